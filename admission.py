@@ -0,0 +1,150 @@
+# admission.py
+# API 准入控制：按服务商配额（RPM / TPM）限流的令牌桶，以及带抖动的指数退避
+
+import asyncio
+import random
+import time
+from typing import Optional
+
+DEFAULT_RPM = 0                   # 每分钟请求数上限，0 表示不限
+DEFAULT_TPM = 0                   # 每分钟 token 数上限，0 表示不限
+DEFAULT_MAX_ATTEMPTS = 4          # 含首次在内的最多尝试次数
+BACKOFF_BASE = 0.5                # 指数退避的起始间隔（秒）
+BACKOFF_CAP = 20.0                # 单次退避的最长间隔（秒）
+
+
+class TokenBucket:
+    """令牌桶：每分钟补充 rate_per_min 个令牌，桶容量默认等于一分钟的额度。"""
+
+    def __init__(self, rate_per_min: float, capacity: Optional[float] = None):
+        self.capacity = float(capacity or rate_per_min)
+        self.rate = rate_per_min / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay_for(self, amount: float) -> float:
+        """还要等多少秒才够 amount 个令牌（超过桶容量的按容量算，避免永远等不到）。"""
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def take(self, amount: float) -> None:
+        self.tokens -= min(amount, self.capacity)
+
+    def refund(self, amount: float) -> None:
+        """预扣多了的令牌退回（比如按 max_tokens 预扣、实际生成得更少）。"""
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class RateLimiter:
+    """
+    同时满足 RPM 和 TPM 的异步限流器
+
+    acquire 持锁等待，所以请求按到达顺序依次放行；rpm / tpm 为 0 的那一项不限制。
+    只能在同一个事件循环里使用。
+    """
+
+    def __init__(self, rpm: float = DEFAULT_RPM, tpm: float = DEFAULT_TPM):
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, tokens: int) -> None:
+        async with self._lock:
+            while True:
+                wait = 0.0
+                if self.requests is not None:
+                    wait = self.requests.delay_for(1)
+                if self.tokens is not None:
+                    wait = max(wait, self.tokens.delay_for(tokens))
+                if wait <= 0:
+                    break
+                await asyncio.sleep(wait)
+            if self.requests is not None:
+                self.requests.take(1)
+            if self.tokens is not None:
+                self.tokens.take(tokens)
+
+    def refund(self, tokens: int) -> None:
+        if self.tokens is not None and tokens > 0:
+            self.tokens.refund(tokens)
+
+
+class SharedRateLimiter:
+    """
+    多进程共享配额的异步限流器，接口和 RateLimiter 相同
+
+    计数放在共享状态后端（shared_state.StateBackend）里，按 60 秒固定窗口计数，
+    同一服务商账号下的所有 worker 进程合起来不超过 RPM / TPM。
+    后端调用是阻塞 I/O，放到线程池里执行，不卡住事件循环。
+    """
+
+    def __init__(self, backend, rpm: float = DEFAULT_RPM, tpm: float = DEFAULT_TPM, name: str = "provider"):
+        self.backend = backend
+        self.rpm = rpm
+        self.tpm = tpm
+        self.name = name
+
+    def _try_acquire(self, tokens: int) -> float:
+        wait = self.backend.consume(f"{self.name}:rpm", 1, self.rpm) if self.rpm else 0.0
+        if wait or not self.tpm:
+            return wait
+        wait = self.backend.consume(f"{self.name}:tpm", tokens, self.tpm)
+        if wait and self.rpm:
+            # 请求数已经扣了但 token 额度不够：把请求数也退回去，下个窗口再一起申请
+            self.backend.release(f"{self.name}:rpm", 1)
+        return wait
+
+    async def acquire(self, tokens: int) -> None:
+        while True:
+            wait = await asyncio.to_thread(self._try_acquire, tokens)
+            if wait <= 0:
+                return
+            await asyncio.sleep(wait)
+
+    def refund(self, tokens: int) -> None:
+        if self.tpm and tokens > 0:
+            self.backend.release(f"{self.name}:tpm", tokens)
+
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """从错误响应的 Retry-After / retry-after-ms 头里读出等待秒数。"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return float(value) / 1000.0
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if value:
+        try:
+            return float(value)
+        except ValueError:
+            return None
+    return None
+
+
+def backoff_delay(attempt: int, error: Optional[Exception] = None,
+                  rng: random.Random = random) -> float:
+    """
+    第 attempt 次重试前的等待秒数
+
+    服务端给了 Retry-After 就听它的（再加一点抖动，避免大家同时醒来），
+    否则用 full jitter 指数退避：[0, min(cap, base × 2^attempt)] 内随机。
+    """
+    hinted = retry_after_seconds(error) if error is not None else None
+    if hinted is not None:
+        return min(hinted, BACKOFF_CAP) + rng.uniform(0, BACKOFF_BASE)
+    return rng.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
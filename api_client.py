@@ -0,0 +1,178 @@
+# api_client.py
+# 进程级共享的 OpenAI 客户端：复用 HTTP 连接池，避免每轮对话都重新建连 / TLS 握手
+# openai / httpx 在第一次创建客户端时才导入，不拖慢页面冷启动
+
+import threading
+from typing import TYPE_CHECKING, Optional
+
+import streamlit as st
+
+if TYPE_CHECKING:
+    import httpx
+    from openai import AsyncOpenAI, OpenAI
+
+
+# ==================== 默认连接参数 ====================
+DEFAULT_TIMEOUT = 60.0            # 单次请求总超时（秒），流式回复也够用
+DEFAULT_CONNECT_TIMEOUT = 5.0     # 建连超时（秒）
+DEFAULT_MAX_RETRIES = 2           # SDK 自带的重试次数
+DEFAULT_MAX_CONNECTIONS = 20      # 连接池上限
+DEFAULT_MAX_KEEPALIVE = 10        # 保持长连接的空闲连接数
+DEFAULT_KEEPALIVE_EXPIRY = 60.0   # 空闲连接保活时间（秒）
+
+
+class ClientMetrics:
+    """
+    客户端指标（线程安全的简单计数器）：
+    - client_calls / client_misses：get_client 调用次数 / 新建客户端的次数
+    - requests：发出的 HTTP 请求数
+    - tcp_connects：新建 TCP 连接数
+    - tls_handshakes：完成的 TLS 握手数
+    命中次数 client_hits = client_calls - client_misses
+    连接复用次数 connection_reuses = requests - tcp_connects
+    """
+
+    FIELDS = ("client_calls", "client_misses", "requests", "tcp_connects", "tls_handshakes")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = dict.fromkeys(self.FIELDS, 0)
+
+    def incr(self, name: str, n: int = 1) -> None:
+        with self._lock:
+            self._counts[name] += n
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            data = dict(self._counts)
+        data["client_hits"] = max(data["client_calls"] - data["client_misses"], 0)
+        data["connection_reuses"] = max(data["requests"] - data["tcp_connects"], 0)
+        return data
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counts = dict.fromkeys(self.FIELDS, 0)
+
+
+METRICS = ClientMetrics()
+
+
+def _http2_available() -> bool:
+    """HTTP/2 需要额外安装 h2（pip install httpx[http2]），没有就退回 HTTP/1.1。"""
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def _trace(event_name: str, info: dict) -> None:
+    """httpcore 的 trace 回调，用来统计真实的建连和握手次数。"""
+    if event_name == "connection.connect_tcp.complete":
+        METRICS.incr("tcp_connects")
+    elif event_name == "connection.start_tls.complete":
+        METRICS.incr("tls_handshakes")
+
+
+def _on_request(request: "httpx.Request") -> None:
+    METRICS.incr("requests")
+    request.extensions["trace"] = _trace
+
+
+async def _atrace(event_name: str, info: dict) -> None:
+    """异步传输层要求 trace 回调是协程函数，计数逻辑和 _trace 相同。"""
+    _trace(event_name, info)
+
+
+async def _on_async_request(request: "httpx.Request") -> None:
+    METRICS.incr("requests")
+    request.extensions["trace"] = _atrace
+
+
+def _limits(max_connections: int, max_keepalive: int) -> "httpx.Limits":
+    import httpx
+
+    return httpx.Limits(
+        max_connections=max_connections,
+        max_keepalive_connections=max_keepalive,
+        keepalive_expiry=DEFAULT_KEEPALIVE_EXPIRY,
+    )
+
+
+@st.cache_resource(show_spinner=False)
+def _create_client(api_key: str, base_url: str, timeout: float, max_retries: int,
+                   max_connections: int, max_keepalive: int) -> "OpenAI":
+    """真正创建客户端；由 st.cache_resource 按参数缓存，整个进程共享同一个实例。"""
+    import httpx
+    from openai import OpenAI
+
+    METRICS.incr("client_misses")
+    http_client = httpx.Client(
+        http2=_http2_available(),
+        limits=_limits(max_connections, max_keepalive),
+        timeout=httpx.Timeout(timeout, connect=DEFAULT_CONNECT_TIMEOUT),
+        event_hooks={"request": [_on_request]},
+    )
+    return OpenAI(
+        api_key=api_key,
+        base_url=base_url,
+        timeout=timeout,
+        max_retries=max_retries,
+        http_client=http_client,
+    )
+
+
+def get_client(api_key: str, base_url: str, timeout: Optional[float] = None,
+               max_retries: Optional[int] = None, max_connections: Optional[int] = None,
+               max_keepalive: Optional[int] = None) -> "OpenAI":
+    """
+    获取共享的 OpenAI 客户端
+
+    Args:
+        api_key: API 密钥
+        base_url: 接口地址
+        timeout: 请求超时（秒），默认 DEFAULT_TIMEOUT
+        max_retries: 失败重试次数，默认 DEFAULT_MAX_RETRIES
+        max_connections: 连接池上限，默认 DEFAULT_MAX_CONNECTIONS
+        max_keepalive: 保活连接数，默认 DEFAULT_MAX_KEEPALIVE
+
+    Returns:
+        OpenAI: 同一组参数在整个进程内只会创建一次的客户端
+    """
+    METRICS.incr("client_calls")
+    return _create_client(
+        api_key,
+        base_url,
+        DEFAULT_TIMEOUT if timeout is None else float(timeout),
+        DEFAULT_MAX_RETRIES if max_retries is None else int(max_retries),
+        DEFAULT_MAX_CONNECTIONS if max_connections is None else int(max_connections),
+        DEFAULT_MAX_KEEPALIVE if max_keepalive is None else int(max_keepalive),
+    )
+
+
+def create_async_client(api_key: str, base_url: str, timeout: float = DEFAULT_TIMEOUT,
+                        max_retries: int = DEFAULT_MAX_RETRIES,
+                        max_connections: int = DEFAULT_MAX_CONNECTIONS,
+                        max_keepalive: int = DEFAULT_MAX_KEEPALIVE) -> "AsyncOpenAI":
+    """
+    创建异步客户端（连接池参数和指标与 get_client 一致）
+
+    异步客户端绑定在创建它的事件循环上，所以不走 st.cache_resource，
+    由持有事件循环的一方（见 gen_service）负责只创建一次。
+    """
+    import httpx
+    from openai import AsyncOpenAI
+
+    http_client = httpx.AsyncClient(
+        http2=_http2_available(),
+        limits=_limits(max_connections, max_keepalive),
+        timeout=httpx.Timeout(timeout, connect=DEFAULT_CONNECT_TIMEOUT),
+        event_hooks={"request": [_on_async_request]},
+    )
+    return AsyncOpenAI(
+        api_key=api_key,
+        base_url=base_url,
+        timeout=timeout,
+        max_retries=max_retries,
+        http_client=http_client,
+    )
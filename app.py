@@ -3,10 +3,29 @@ EchoSoul - 情绪伴侣 AI 网页版
 基于 Streamlit 和 OpenAI API 构建
 """
 import streamlit as st
-from openai import OpenAI
 import html
+import io
+import os
+import time
+import uuid
 from datetime import datetime
-from ai_brain import generate_system_prompt
+from typing import Optional
+from ai_brain import comfort_type_messages, detect_comfort_type, generate_system_prompt, prefix_cache_report
+from config import load_config
+from gen_service import get_generation_service, start_warm_up
+from stream_filter import StreamFilter, max_tokens_for_limit
+from stream_render import StreamRenderer
+from context_window import build_context, estimate_tokens, extend_context, new_summary_state, trim_folded
+from messages import History, Message
+from history_store import get_history_store
+from prompt_store import get_prompt_store
+from conversation_io import (COMPRESSIONS, export_conversation, export_filename, import_conversation,
+                             zstd_available)
+from shared_state import get_state_backend, load_settings, save_settings
+from token_ledger import apply_budget, get_token_ledger, usage_cost
+from reply_cache import get_reply_cache
+from tracing import REGISTRY, count, observe, setup_exporters, span
+from history_view import render_history, reset_history_view
 from ui_style import apply_theme
 
 # ==================== 页面配置 ====================
@@ -16,31 +35,116 @@ st.set_page_config(
     layout="wide",
     initial_sidebar_state="expanded"
 )
+RUN_STARTED_AT = time.perf_counter()
 
 # ==================== 自定义样式 ====================
 
-apply_theme(bg_image="D:\Echosoulaicompanion\assets\background.png")
+apply_theme(bg_image=os.path.join(os.path.dirname(os.path.abspath(__file__)), "assets", "background.png"))
 # ==================== API 配置 (完善版) ====================
 
+# 所有配置在进程里只从 st.secrets 读一次（见 config.py），之后的 rerun 直接复用
+CONFIG = load_config()
+
 # 1. 这里的第二个参数千万不能放真实的 Key，只能放空字符串 "" 或者 None
-API_KEY = st.secrets.get("DEEPSEEK_API_KEY", "") 
+API_KEY = CONFIG["DEEPSEEK_API_KEY"]
 
 # 2. 这里的 URL 和 MODEL 放默认值没关系，因为它们不是秘密
-BASE_URL = st.secrets.get("DEEPSEEK_BASE_URL", "https://api.deepseek.com")
-MODEL = st.secrets.get("DEEPSEEK_MODEL", "deepseek-chat")
+BASE_URL = CONFIG["DEEPSEEK_BASE_URL"]
+MODEL = CONFIG["DEEPSEEK_MODEL"]
+
+# 多服务商（可选）：secrets 里用 [[PROVIDERS]] 配置多个 OpenAI 兼容节点，按首 token 延迟自动路由
+PROVIDERS = CONFIG["PROVIDERS"]
 
 # 3. 这里的报错逻辑会帮你拦截：如果读取不到 Key，程序就会报错停止
-if not API_KEY:
+if not all(api_key for _, api_key, _, _ in PROVIDERS):
     st.error("🔑 未检测到 API 密钥！请检查本地 .streamlit/secrets.toml 或云端 Secrets 配置。")
     st.stop()
 
+# 多进程部署（可选）：会话设置、限流计数放在共享状态后端里，任何一个 worker 都能接着服务同一个会话，
+# 负载均衡不需要粘性会话。默认用本机 SQLite（和历史记录同一个文件），填 redis://host:port/db 则改用 Redis
+STATE_BACKEND_URL = CONFIG["STATE_BACKEND_URL"]
+STATE_BACKEND = get_state_backend(STATE_BACKEND_URL, CONFIG["HISTORY_DB_PATH"])
+
+# token 账本：每次生成的 prompt / 命中缓存 / completion token 记在历史数据库里；
+# 会话累计用量接近 SESSION_TOKEN_BUDGET（0 为不限）时收缩上下文和 max_tokens，TOKEN_PRICES 用于估算费用
+TOKEN_LEDGER = get_token_ledger(CONFIG["HISTORY_DB_PATH"])
+SESSION_TOKEN_BUDGET = CONFIG["SESSION_TOKEN_BUDGET"]
+TOKEN_PRICES = CONFIG["TOKEN_PRICES"] or {}
+
+# 4. 后台生成服务：全局并发上限 / 单会话并发上限 / 服务商配额（RPM、TPM，0 为不限）/ 请求超时 /
+#    重试次数 / 每个节点的连接池上限和长连接数（不配置就跟并发上限一致）
+SERVICE_OPTIONS = {
+    "max_concurrency": CONFIG["MAX_CONCURRENT_GENERATIONS"],
+    "max_per_user": CONFIG["MAX_GENERATIONS_PER_SESSION"],
+    "rpm": CONFIG["DEEPSEEK_RPM"],
+    "tpm": CONFIG["DEEPSEEK_TPM"],
+    "timeout": CONFIG["DEEPSEEK_TIMEOUT"],
+    "max_retries": CONFIG["DEEPSEEK_MAX_RETRIES"],
+    "max_connections": CONFIG["DEEPSEEK_MAX_CONNECTIONS"],
+    "max_keepalive": CONFIG["DEEPSEEK_MAX_KEEPALIVE"],
+    "hedge_after": CONFIG["HEDGE_AFTER"],
+    "prewarm_interval": CONFIG["PREFETCH_INTERVAL"],
+}
+# 进程内第一次运行时在后台预热 DNS 和到服务商的连接，不阻塞页面渲染
+start_warm_up(PROVIDERS, _state_backend=STATE_BACKEND, _ledger=TOKEN_LEDGER, **SERVICE_OPTIONS)
+
+
+def generation_service():
+    """进程内共享的生成服务（同一组配置只创建一次）。"""
+    return get_generation_service(PROVIDERS, _state_backend=STATE_BACKEND, _ledger=TOKEN_LEDGER,
+                                  **SERVICE_OPTIONS)
+
 
+# 5. 每轮发送的历史消息 token 上限，超出部分折叠进滚动摘要
+CONTEXT_TOKEN_BUDGET = CONFIG["CONTEXT_TOKEN_BUDGET"]
+
+# 6. 流式渲染节流：刷新间隔（秒）和字数阈值
+STREAM_FLUSH_INTERVAL = CONFIG["STREAM_FLUSH_INTERVAL"]
+STREAM_FLUSH_CHARS = CONFIG["STREAM_FLUSH_CHARS"]
+
+# 7. 对话持久化：数据库路径、每页条数、单个会话内存里最多保留的消息数
+HISTORY_DB_PATH = CONFIG["HISTORY_DB_PATH"]
+HISTORY_PAGE_SIZE = CONFIG["HISTORY_PAGE_SIZE"]
+MAX_MESSAGES_IN_MEMORY = CONFIG["MAX_MESSAGES_IN_MEMORY"]
+HISTORY_WINDOW = CONFIG["HISTORY_WINDOW"]
+# 导出文件的压缩方式：gzip（默认）/ zstd（需安装 zstandard，没装时退回 gzip）/ none
+EXPORT_COMPRESSION = CONFIG["EXPORT_COMPRESSION"]
+if EXPORT_COMPRESSION not in COMPRESSIONS or (EXPORT_COMPRESSION == "zstd" and not zstd_available()):
+    EXPORT_COMPRESSION = "gzip"
+
+# 8. 开场白回复缓存（默认关闭）：只对对话的第一句话生效
+REPLY_CACHE_ENABLED = CONFIG["REPLY_CACHE_ENABLED"]
+REPLY_CACHE_TTL = CONFIG["REPLY_CACHE_TTL"]
+
+# 9. 耗时埋点导出（可选）：JSONL 文件路径、Prometheus /metrics 端口、管理面板口令
+setup_exporters(CONFIG["TRACE_JSONL_PATH"], CONFIG["METRICS_PORT"])
+ADMIN_TOKEN = CONFIG["ADMIN_TOKEN"]
+
+# 10. 预取（默认关闭）：用户输入下一条消息期间，预先算好系统提示词和裁剪后的上下文，
+#     并在 PREFETCH_TTL 秒内保持到服务商的热连接（连接空闲超过 PREFETCH_INTERVAL 秒就发一次保活请求）
+PREFETCH_ENABLED = CONFIG["PREFETCH_ENABLED"]
+PREFETCH_TTL = CONFIG["PREFETCH_TTL"]
 
 # ==================== 初始化 Session State ====================
 def init_session_state():
     """初始化会话状态"""
+    if "session_id" not in st.session_state:
+        # 会话 id 放在 URL 里，刷新页面后还能找回之前的对话
+        st.session_state.session_id = st.query_params.get("sid") or uuid.uuid4().hex
+        st.query_params["sid"] = st.session_state.session_id
     if "messages" not in st.session_state:
-        st.session_state.messages = []
+        # 只加载最近一页，更早的消息按需翻页
+        st.session_state.messages = History(history_store.load_recent(
+            st.session_state.session_id, HISTORY_PAGE_SIZE
+        ))
+    if "earlier_messages" not in st.session_state:
+        st.session_state.earlier_messages = []
+    if "settings_restored" not in st.session_state:
+        # 新会话（或被负载均衡到另一个 worker 进程）：先恢复之前在任意进程里保存过的设置
+        st.session_state.settings_restored = True
+        for key, value in (load_settings(STATE_BACKEND, st.session_state.session_id) or {}).items():
+            if key in SETTING_KEYS:
+                st.session_state[key] = value
     if "user_desc" not in st.session_state:
         st.session_state.user_desc = ""
     if "comfort_style" not in st.session_state:
@@ -49,78 +153,297 @@ def init_session_state():
         st.session_state.word_limit = 0
     if "forbidden_phrases" not in st.session_state:
         st.session_state.forbidden_phrases = "我只是一个AI"
+    if "pending_reply" not in st.session_state:
+        # 后台正在生成、前台还没渲染完的回复（跨 rerun 保留）
+        st.session_state.pending_reply = None
+    if "comfort_type" not in st.session_state:
+        st.session_state.comfort_type = ""
+    if "context_state" not in st.session_state:
+        st.session_state.context_state = new_summary_state()
+    if "trace_counters" not in st.session_state:
+        st.session_state.trace_counters = {}
+    if "rerun_stats" not in st.session_state:
+        st.session_state.rerun_stats = {"full_runs": 0, "full_seconds": 0.0, "sidebar_runs": 0}
+
+
+# ==================== 设置 ====================
+SETTING_KEYS = ("user_desc", "comfort_style", "word_limit", "forbidden_phrases")
+# 侧边栏表单里对应的控件 key
+SETTING_WIDGET_KEYS = ("user_desc_input", "comfort_style_radio", "word_limit_slider", "forbidden_phrases_input")
 
+COMFORT_STYLES = ["温暖陪伴", "犀利点拨", "温和鼓励", "理性分析"]
 
+history_store = get_history_store(HISTORY_DB_PATH, STATE_BACKEND_URL)
 init_session_state()
 
+
+def apply_settings(draft: dict) -> set:
+    """
+    一次性提交侧边栏的设置草稿
+
+    只有值真的变了才写回 session_state 并递增 settings_version，
+    返回发生变化的设置项名称；草稿里没有的设置项沿用当前值。
+    """
+    changed = {key for key in SETTING_KEYS if key in draft and st.session_state[key] != draft[key]}
+    for key in changed:
+        st.session_state[key] = draft[key]
+    if changed:
+        st.session_state.settings_version = st.session_state.get("settings_version", 0) + 1
+        save_settings(STATE_BACKEND, st.session_state.session_id,
+                      {key: st.session_state[key] for key in SETTING_KEYS})
+    return changed
+
+
+def valid_settings(settings: dict) -> dict:
+    """从导入文件里挑出合法的设置项（类型不对或取值越界的丢掉，沿用当前值）。"""
+    valid = {}
+    for key in SETTING_KEYS:
+        value = settings.get(key)
+        if not isinstance(value, type(st.session_state[key])) or isinstance(value, bool):
+            continue
+        if key == "comfort_style" and value not in COMFORT_STYLES:
+            continue
+        if key == "word_limit" and (value < 0 or value > 500 or value % 50):
+            continue
+        valid[key] = value
+    return valid
+
+
+def reset_setting_widgets() -> None:
+    """
+    设置被代码改掉之后（导入、切换会话）丢掉侧边栏控件的状态
+
+    控件带了 key，Streamlit 会沿用旧的控件状态而忽略 value= / index=，
+    不丢掉的话侧边栏还显示旧设置，下次点「应用设置」又把它们改回去。
+    """
+    for key in SETTING_WIDGET_KEYS:
+        st.session_state.pop(key, None)
+
+
+def drop_prefetch() -> None:
+    """丢掉预取的上下文并取消连接预热（提交、清空记忆、切换会话时调用）。"""
+    prefetch = st.session_state.pop("prefetch", None)
+    if prefetch is not None:
+        prefetch["lease"].cancel()
+
+
+def switch_session(session_id: str) -> None:
+    """切换到另一个会话：放弃正在生成的回复，内存里的对话状态和保存过的设置从新会话的存储重新加载。"""
+    if st.session_state.pending_reply is not None:
+        st.session_state.pending_reply["handle"].cancel()
+        st.session_state.pending_reply = None
+    drop_prefetch()
+    st.session_state.session_id = session_id
+    st.query_params["sid"] = session_id
+    st.session_state.messages = History(history_store.load_recent(session_id, HISTORY_PAGE_SIZE))
+    reset_history_view()
+    st.session_state.context_state = new_summary_state()
+    st.session_state.comfort_type = ""
+    st.session_state.pop("export_file", None)
+    for key, value in (load_settings(STATE_BACKEND, session_id) or {}).items():
+        if key in SETTING_KEYS:
+            st.session_state[key] = value
+    reset_setting_widgets()
+
+
+def import_file(uploaded) -> None:
+    """
+    把上传的导出文件导入成一个新会话，成功后切换过去
+
+    逐批写进历史存储，内存里只加载最近一页；当前会话原样保留（换回原来的 ?sid= 还能打开）。
+    文件中途格式不对时，已写入的部分归档掉，留在当前会话。
+    """
+    session_id = uuid.uuid4().hex
+    try:
+        with span("import", session_id):
+            settings, imported = import_conversation(uploaded, history_store, session_id)
+    except ValueError as e:
+        history_store.archive(session_id)
+        st.error(f"导入失败：{e}")
+        return
+    count(st.session_state.trace_counters, "imported_messages", imported)
+    switch_session(session_id)
+    apply_settings(valid_settings(settings))
+    reset_setting_widgets()
+    st.rerun()
+
+
+def export_panel() -> None:
+    """导出当前会话（从存储里流式读出，不依赖内存里只保留了多少条）/ 导入之前导出的文件。"""
+    with st.expander("💾 导出 / 导入对话"):
+        if st.button("📦 生成导出文件", use_container_width=True, key="export_button"):
+            buffer = io.BytesIO()
+            with span("export", st.session_state.session_id):
+                exported = export_conversation(
+                    history_store, st.session_state.session_id,
+                    {key: st.session_state[key] for key in SETTING_KEYS}, buffer, EXPORT_COMPRESSION,
+                )
+            st.session_state.export_file = (export_filename(EXPORT_COMPRESSION), buffer.getvalue(), exported)
+        export_file = st.session_state.get("export_file")
+        if export_file is not None:
+            file_name, data, exported = export_file
+            st.download_button(f"⬇️ 下载（{exported} 条消息，{len(data) / 1024:.1f} KB）", data=data,
+                               file_name=file_name, mime="application/octet-stream",
+                               use_container_width=True, key="download_export_button")
+
+        uploaded = st.file_uploader("导入对话文件", type=["ndjson", "jsonl", "gz", "zst"],
+                                    key="import_uploader")
+        if uploaded is not None and st.button("📥 导入为新对话", use_container_width=True,
+                                              key="import_button"):
+            import_file(uploaded)
+
+
 # ==================== 侧边栏 ====================
 @st.fragment
 def sidebar_settings():
+    # 侧边栏（含整页 rerun 时）的运行次数；减去整页 rerun 次数就是只重跑侧边栏的次数
+    st.session_state.rerun_stats["sidebar_runs"] += 1
+    
     st.markdown("### 🌙 EchoSoul 设置")
     st.markdown("<p class='subtitle'>你的情绪伴侣 AI</p>", unsafe_allow_html=True)
     st.divider()
     
-    # 一句话描述
-    st.markdown("**一句话描述此刻的你**")
-    user_desc = st.text_input(
-        label="一句话描述此刻的你",
-        label_visibility="collapsed",
-        placeholder="例如：最近工作压力很大，感到有些疲惫...",
-        value=st.session_state.user_desc,
-        key="user_desc_input"
-    )
-    st.session_state.user_desc = user_desc
-    
-    st.divider()
-    
-    # 安慰风格选择
-    st.markdown("**安慰风格**")
-    comfort_style = st.radio(
-        label="选择安慰风格",
-        label_visibility="collapsed",
-        options=["温暖陪伴", "犀利点拨", "温和鼓励", "理性分析"],
-        index=["温暖陪伴", "犀利点拨", "温和鼓励", "理性分析"].index(st.session_state.comfort_style),
-        key="comfort_style_radio"
-    )
-    st.session_state.comfort_style = comfort_style
-    
-    st.divider()
-    
-    # 字数限制
-    st.markdown("**单次回复字数限制**")
-    word_limit = st.select_slider(
-        label="字数限制",
-        label_visibility="collapsed",
-        options=list(range(0, 501, 50)),
-        value=st.session_state.word_limit,
-        format_func=lambda x: "无限制" if x == 0 else f"{x} 字",
-        key="word_limit_slider"
-    )
-    if word_limit == 0:
-        st.caption("💡 拖动滑块设置字数限制，0 表示无限制")
-    st.session_state.word_limit = word_limit
-    
-    st.divider()
+    # 设置放在表单里：编辑时不触发 rerun，点「应用设置」才一次性生效
+    with st.form("settings_form", border=False):
+        # 一句话描述
+        st.markdown("**一句话描述此刻的你**")
+        user_desc = st.text_input(
+            label="一句话描述此刻的你",
+            label_visibility="collapsed",
+            placeholder="例如：最近工作压力很大，感到有些疲惫...",
+            value=st.session_state.user_desc,
+            key="user_desc_input"
+        )
+        
+        st.divider()
+        
+        # 安慰风格选择
+        st.markdown("**安慰风格**")
+        comfort_style = st.radio(
+            label="选择安慰风格",
+            label_visibility="collapsed",
+            options=COMFORT_STYLES,
+            index=COMFORT_STYLES.index(st.session_state.comfort_style),
+            key="comfort_style_radio"
+        )
+        
+        st.divider()
+        
+        # 字数限制
+        st.markdown("**单次回复字数限制**")
+        word_limit = st.select_slider(
+            label="字数限制",
+            label_visibility="collapsed",
+            options=list(range(0, 501, 50)),
+            value=st.session_state.word_limit,
+            format_func=lambda x: "无限制" if x == 0 else f"{x} 字",
+            key="word_limit_slider"
+        )
+        if word_limit == 0:
+            st.caption("💡 拖动滑块设置字数限制，0 表示无限制")
+        
+        st.divider()
+        
+        # 禁止用语
+        st.markdown("**禁止出现的短语**")
+        forbidden_phrases = st.text_input(
+            label="禁止短语",
+            label_visibility="collapsed",
+            placeholder="用逗号分隔，例如：我只是一个AI, 我不知道",
+            value=st.session_state.forbidden_phrases,
+            key="forbidden_phrases_input"
+        )
+        
+        submitted = st.form_submit_button("✅ 应用设置", use_container_width=True)
     
-    # 禁止用语
-    st.markdown("**禁止出现的短语**")
-    forbidden_phrases = st.text_input(
-        label="禁止短语",
-        label_visibility="collapsed",
-        placeholder="用逗号分隔，例如：我只是一个AI, 我不知道",
-        value=st.session_state.forbidden_phrases,
-        key="forbidden_phrases_input"
-    )
-    st.session_state.forbidden_phrases = forbidden_phrases
+    if submitted:
+        changed = apply_settings({
+            "user_desc": user_desc,
+            "comfort_style": comfort_style,
+            "word_limit": word_limit,
+            "forbidden_phrases": forbidden_phrases,
+        })
+        # 其他设置只在发送消息时才用到，只有主页面展示的 user_desc 变了才需要整页 rerun
+        if "user_desc" in changed:
+            st.rerun()
     
     st.divider()
     
     # 重启记忆按钮
     st.markdown("**对话管理**")
     if st.button("🔄 重启 / 清空记忆", type="secondary", use_container_width=True, key="reset_button"):
-        st.session_state.messages = []
+        # 还在生成的回复不要了（取消后不会再落库）
+        if st.session_state.pending_reply is not None:
+            st.session_state.pending_reply["handle"].cancel()
+            st.session_state.pending_reply = None
+        drop_prefetch()
+        # 归档而不是删除：数据库里的记录还在，只是不再加载
+        history_store.archive(st.session_state.session_id)
+        st.session_state.messages = History()
+        reset_history_view()
+        st.session_state.context_state = new_summary_state()
+        st.session_state.comfort_type = ""
+        st.session_state.pop("export_file", None)
         st.rerun()
 
+    export_panel()
+
+def token_usage_tables() -> None:
+    """token 账本的汇总：本会话、按模型、最近 24 小时（配置了 TOKEN_PRICES 时附带估算费用）。"""
+    def rows(data: list) -> list:
+        for row in data:
+            cost = usage_cost(row, TOKEN_PRICES)
+            if cost is not None:
+                row["cost"] = round(cost, 4)
+        return data
+
+    session = TOKEN_LEDGER.rollup("session", st.session_state.session_id)
+    st.caption("token 用量：本会话 / 按模型 / 最近 24 小时")
+    st.dataframe(rows([{"key": "本会话", **session}] + TOKEN_LEDGER.rollups("model")),
+                 hide_index=True, use_container_width=True)
+    st.dataframe(rows(TOKEN_LEDGER.rollups("hour", 24)), hide_index=True, use_container_width=True)
+
+
+@st.fragment(run_every=5)
+def admin_panel():
+    """各阶段耗时的实时分位数（毫秒）、服务商路由、提示词、开场白缓存、rerun 统计和本会话计数器，每 5 秒刷新。"""
+    with st.expander("📈 性能面板", expanded=True):
+        rows = [
+            {"阶段": name, "次数": data["count"],
+             **{key: round(data[key] * 1000, 1) for key in ("p50", "p95", "p99")}}
+            for name, data in REGISTRY.summary().items()
+        ]
+        if rows:
+            st.dataframe(rows, hide_index=True, use_container_width=True)
+        else:
+            st.caption("还没有数据")
+        # 各服务商节点的首 token 延迟 EWMA、错误率和胜出次数
+        st.dataframe(generation_service().router.snapshot(), hide_index=True, use_container_width=True)
+        token_usage_tables()
+        # 当前生效的提示词版本（改动 prompts/ 或重新编译后几秒内自动热加载）
+        prompt_store = get_prompt_store()
+        st.caption(f"提示词版本 {prompt_store.current.version}，已热加载 {prompt_store.reloads} 次")
+        # 上一轮请求里能命中服务商前缀缓存的部分，以及本会话累计的命中比例
+        prefix_report = st.session_state.get("prompt_prefix_report")
+        if prefix_report:
+            counters = st.session_state.trace_counters
+            st.caption(f"请求可缓存前缀：上一轮 {prefix_report['prefix_tokens']} / "
+                       f"{prefix_report['total_tokens']} tokens，本会话累计 "
+                       f"{counters.get('prompt_prefix_tokens', 0)} / {counters.get('prompt_request_tokens', 0)} tokens")
+        # 开场白缓存（进程内共享）的命中率和省下的时间
+        if REPLY_CACHE_ENABLED:
+            cache_stats = get_reply_cache(ttl=REPLY_CACHE_TTL).snapshot()
+            st.caption(f"开场白缓存：命中率 {cache_stats['hit_rate']:.0%}（{cache_stats['lookups']} 次查询），"
+                       f"共省下 {cache_stats['seconds_saved']:.1f} 秒，平均每次命中 "
+                       f"{cache_stats['saved_per_hit'] * 1000:.0f} ms")
+        # 跑完的整页 rerun 次数和平均耗时，侧边栏运行次数（含整页 rerun），对比见 bench_settings_rerun.py
+        rerun_stats = st.session_state.rerun_stats
+        full_runs = rerun_stats["full_runs"]
+        st.caption(f"整页 rerun {full_runs} 次，平均 {rerun_stats['full_seconds'] / max(full_runs, 1) * 1000:.1f} ms；"
+                   f"侧边栏运行 {rerun_stats['sidebar_runs']} 次（含整页 rerun）")
+        st.json(st.session_state.trace_counters)
+
+
 with st.sidebar:
     sidebar_settings()
     
@@ -139,6 +462,10 @@ with st.sidebar:
         3. 添加 `DEEPSEEK_API_KEY`
         """)
 
+    # 隐藏的管理面板：secrets 里配置了 ADMIN_TOKEN，且 URL 带上 ?admin=<ADMIN_TOKEN> 才显示
+    if ADMIN_TOKEN and st.query_params.get("admin") == ADMIN_TOKEN:
+        admin_panel()
+
 # ==================== 主界面 ====================
 # 标题区域
 col1, col2, col3 = st.columns([1, 2, 1])
@@ -154,72 +481,277 @@ if st.session_state.user_desc:
 
 # ==================== 聊天界面 ====================
 
-# 显示历史消息
-for message in st.session_state.messages:
-    with st.chat_message(message["role"]):
-        st.markdown(message["content"])
+# 显示历史消息（只渲染最近的窗口，更早的按需展开）
+render_history(history_store, st.session_state.session_id, HISTORY_WINDOW, HISTORY_PAGE_SIZE)
+
+def finish_turn(pending: dict, full_response: str, message: Message, renderer: StreamRenderer) -> None:
+    """一轮回复结束后的收尾：计数、写入内存里的历史、开场白缓存和整轮耗时。"""
+    session_id = st.session_state.session_id
+    counters = st.session_state.trace_counters
+    count(counters, "tokens_out", estimate_tokens(full_response))
+    count(counters, "chunks", renderer.chunks)
+    count(counters, "render_calls", renderer.render_calls)
+    
+    if message is not None:
+        st.session_state.messages.append(message)
+        # 内存里只保留有限条消息，更早的已经在摘要和数据库里
+        if trim_folded(st.session_state.messages, st.session_state.context_state, MAX_MESSAGES_IN_MEMORY):
+            reset_history_view()
+    
+    # 只缓存完整生成完的回复：出错 / 被取消时截了一半的内容不能给别的用户用
+    if pending.get("cache_bucket") is not None and full_response and pending["handle"].completed:
+        get_reply_cache(ttl=REPLY_CACHE_TTL).store(
+            pending["cache_bucket"], pending["prompt"], full_response,
+            time.perf_counter() - pending["started_at"]
+        )
+    observe("turn", time.perf_counter() - pending["turn_started_at"], session_id)
+
+
+def render_pending_reply() -> None:
+    """
+    渲染后台正在生成（或刚生成完）的回复
+
+    生成在后台事件循环上进行，token 写进这轮回复自己的缓冲区；这里只是挂上去读。
+    脚本被 rerun / 断线打断时不取消生成，下一次运行先把已生成的部分一次性画出来，
+    再从当前偏移量接着流式渲染。回复由后台在结束时落库，这里只负责同步到内存里的历史。
+    """
+    pending = st.session_state.pending_reply
+    handle = pending["handle"]
+    session_id = st.session_state.session_id
+    counters = st.session_state.trace_counters
+    with st.chat_message("assistant"):
+        message_placeholder = st.empty()
+        renderer = StreamRenderer(
+            message_placeholder,
+            interval=STREAM_FLUSH_INTERVAL,
+            max_chars=STREAM_FLUSH_CHARS
+        )
+        try:
+            # 排队 / 限流期间显示排队位置
+            while not handle.wait_started(0.3):
+                ahead = handle.position()
+                message_placeholder.markdown(
+                    f"⏳ 排队中，前面还有 {ahead} 位…" if ahead else "⏳ 排队中…"
+                )
+            text, offset = handle.snapshot()
+            renderer.write(text)
+            for text in handle.iter_from(offset):
+                if not pending["ttft_observed"]:
+                    pending["ttft_observed"] = True
+                    observe("ttft", time.perf_counter() - pending["started_at"], session_id)
+                renderer.write(text)
+        except Exception:
+            if not handle.done:
+                # 不是生成出错（脚本自己被打断之类）：保留 pending，下次运行接着画
+                raise
+            # 出错前已经生成的部分同样由后台落库
+            st.session_state.pending_reply = None
+            full_response = renderer.close()
+            finish_turn(pending, full_response, handle.result, renderer)
+            raise
+        full_response = renderer.close()
+    
+    st.session_state.pending_reply = None
+    observe("stream", time.perf_counter() - pending["started_at"], session_id)
+    if handle.truncated:
+        count(counters, "truncated_replies")
+    finish_turn(pending, full_response, handle.result, renderer)
+
+
+def turn_budgets() -> tuple:
+    """
+    本轮的 (历史上下文 token 预算, max_tokens, 降级程度)
+
+    会话累计用量接近 / 超出 SESSION_TOKEN_BUDGET 时平滑收缩，不拒绝回复。
+    """
+    max_tokens = max_tokens_for_limit(st.session_state.word_limit)
+    if not SESSION_TOKEN_BUDGET:
+        return CONTEXT_TOKEN_BUDGET, max_tokens, 0.0
+    used = TOKEN_LEDGER.session_tokens(st.session_state.session_id)
+    return apply_budget(used, SESSION_TOKEN_BUDGET, CONTEXT_TOKEN_BUDGET, max_tokens)
+
+
+def prefetch_matches(prefetch: Optional[dict], length: int) -> bool:
+    """预取结果是否还对应当前内存里的历史（前 length 条）和摘要状态。"""
+    state = st.session_state.context_state
+    return (prefetch is not None and prefetch["messages"] is st.session_state.messages
+            and prefetch["length"] == length and prefetch["state"] is state
+            and prefetch["folded"] == state["folded"])
+
+
+def prefetch_next_turn() -> None:
+    """
+    为下一轮预取：每次脚本跑完（回复刚结束 / 页面刚打开）、用户开始输入前调用
+
+    st.chat_input 在输入过程中不会触发 rerun，所以预取的时机放在每次运行的末尾：
+    预先组装系统提示词（进 LRU 缓存）、按预算裁剪好当前历史，
+    再向生成服务申请一个连接预热租约。提交时只需把用户这句话接到预取的上下文后面。
+    """
+    messages = st.session_state.messages
+    prefetch = st.session_state.get("prefetch")
+    if prefetch_matches(prefetch, len(messages)) and prefetch["lease"].active:
+        return
+    drop_prefetch()
+    session_id = st.session_state.session_id
+    with span("prefetch", session_id):
+        generate_system_prompt(
+            user_desc=st.session_state.user_desc,
+            comfort_style=st.session_state.comfort_style,
+            word_limit=st.session_state.word_limit,
+            forbidden_phrases=st.session_state.forbidden_phrases
+        )
+        state = st.session_state.context_state
+        context_budget, _, _ = turn_budgets()
+        context = build_context(messages, state, token_budget=context_budget)
+        lease = generation_service().prewarm(PREFETCH_TTL)
+    st.session_state.prefetch = {"messages": messages, "length": len(messages), "state": state,
+                                 "folded": state["folded"], "context": context, "lease": lease}
+
+
+def submit_reply(prompt: str) -> None:
+    """为用户的这条消息组装上下文并提交后台生成（命中开场白缓存时直接回复）。"""
+    session_id = st.session_state.session_id
+    counters = st.session_state.trace_counters
+    turn_started_at = time.perf_counter()
+    count(counters, "turns")
+    
+    # 获取共享的后台生成服务（进程内复用事件循环和连接池）
+    with span("client", session_id):
+        service = generation_service()
+    
+    # 本地识别这条消息需要的安慰类型（特征不明显时沿用上一轮）
+    with span("comfort_type", session_id):
+        st.session_state.comfort_type = detect_comfort_type(prompt, st.session_state.comfort_type)
+    
+    # 生成系统提示词
+    with span("system_prompt", session_id):
+        system_messages = generate_system_prompt(
+            user_desc=st.session_state.user_desc,
+            comfort_style=st.session_state.comfort_style,
+            word_limit=st.session_state.word_limit,
+            forbidden_phrases=st.session_state.forbidden_phrases
+        )
+    system_prompt = system_messages[0]["content"]
+    
+    # 构建完整消息列表（system + 摘要 + 预算内的最近历史 + 本轮安慰类型）
+    # 会话用量接近配额时收缩本轮的上下文和回复长度
+    context_budget, max_tokens, degraded = turn_budgets()
+    if degraded:
+        count(counters, "budget_degraded")
+    
+    # 有预取结果时只把用户这句话接上去，放不进窗口预算再整体重算
+    with span("context", session_id):
+        messages = st.session_state.messages
+        prefetch = st.session_state.get("prefetch")
+        context = None
+        if prefetch_matches(prefetch, len(messages) - 1):
+            context = extend_context(prefetch["context"], messages, st.session_state.context_state,
+                                     token_budget=context_budget)
+        drop_prefetch()
+        if context is None:
+            context = build_context(messages, st.session_state.context_state, token_budget=context_budget)
+        else:
+            count(counters, "prefetch_hits")
+        # 每轮都可能变的安慰类型接在历史后面，换类型也不影响前面整段的前缀缓存
+        type_messages = comfort_type_messages(st.session_state.comfort_type)
+        api_messages = system_messages + context + type_messages
+    # 历史部分直接用缓存在消息上的 token 数，只有 system prompt、摘要和安慰类型需要现算
+    context_state = st.session_state.context_state
+    count(counters, "tokens_in",
+          estimate_tokens(system_prompt) + context_state["tokens"] + context_state["window_tokens"]
+          + sum(estimate_tokens(message["content"]) for message in type_messages))
+    
+    # 记录本轮请求相对上一轮可命中前缀缓存的长度；两个计数器之比就是整个请求的前缀缓存命中率
+    prefix_report = st.session_state.prompt_prefix_report = prefix_cache_report(
+        st.session_state.get("last_request", []), api_messages
+    )
+    st.session_state.last_request = api_messages
+    count(counters, "prompt_prefix_tokens", prefix_report["prefix_tokens"])
+    count(counters, "prompt_request_tokens", prefix_report["total_tokens"])
+    
+    pending = {"prompt": prompt, "turn_started_at": turn_started_at, "cache_bucket": None,
+               "ttft_observed": False}
+    
+    # 开场白缓存：只在第一轮、且没有填写个人描述时查询
+    if (REPLY_CACHE_ENABLED and len(st.session_state.messages) == 1
+            and not st.session_state.earlier_messages and not st.session_state.user_desc):
+        reply_cache = get_reply_cache(ttl=REPLY_CACHE_TTL)
+        pending["cache_bucket"] = reply_cache.bucket(
+            st.session_state.comfort_style,
+            st.session_state.word_limit,
+            st.session_state.forbidden_phrases
+        )
+        lookup_started_at = time.perf_counter()
+        cached_reply = reply_cache.lookup(pending["cache_bucket"], prompt)
+        if cached_reply is not None:
+            with st.chat_message("assistant"):
+                renderer = StreamRenderer(st.empty())
+                renderer.write(cached_reply)
+                full_response = renderer.close()
+            message = Message("assistant", full_response)
+            history_store.append(session_id, message)
+            # 命中时实际花的时间，从省下的生成耗时里扣掉
+            reply_cache.served(time.perf_counter() - lookup_started_at)
+            count(counters, "reply_cache_hits")
+            pending["started_at"] = time.perf_counter()
+            pending["cache_bucket"] = None
+            finish_turn(pending, full_response, message, renderer)
+            return
+    
+    def commit_reply(text: str) -> Message:
+        # 在后台线程上调用：不管前台还在不在，回复一结束就写进数据库
+        message = Message("assistant", text)
+        history_store.append(session_id, message)
+        return message
+    
+    # 流式响应：请求在后台事件循环上执行，禁止短语在写入缓冲区前删掉，
+    # 超出字数上限就提前结束（同时关闭 HTTP 响应）
+    pending["started_at"] = time.perf_counter()
+    pending["handle"] = service.submit(
+        session_id,
+        text_filter=StreamFilter(st.session_state.forbidden_phrases, st.session_state.word_limit),
+        on_done=commit_reply,
+        model=MODEL,
+        messages=api_messages,
+        temperature=0.8,
+        max_tokens=max_tokens
+    )
+    st.session_state.pending_reply = pending
+
+
+def show_error(error: Exception) -> None:
+    st.error(f"❌ 出错了：{str(error)}")
+    st.info("💡 请检查 API Key 是否正确，或稍后重试。")
+
+
+# 上一次运行被打断时还没画完的回复：先接着画完，再处理新的输入，保证消息顺序
+if st.session_state.pending_reply is not None:
+    try:
+        render_pending_reply()
+    except Exception as e:
+        show_error(e)
 
 # 用户输入
 if prompt := st.chat_input("想对我说点什么吗？"):
     # 添加用户消息
-    st.session_state.messages.append({"role": "user", "content": prompt})
+    user_message = Message("user", prompt)
+    history_store.append(st.session_state.session_id, user_message)
+    st.session_state.messages.append(user_message)
     with st.chat_message("user"):
         st.markdown(prompt)
     
     # 准备 API 调用
     try:
         # 检查 API Key
-        api_key = API_KEY or st.secrets.get("DEEPSEEK_API_KEY", "")
-        if not api_key:
+        if not all(api_key for _, api_key, _, _ in PROVIDERS):
             st.error("⚠️ 请先配置 DEEPSEEK_API_KEY！点击侧边栏的「API 配置」查看设置方法。")
         else:
-            # 初始化客户端
-            client = OpenAI(
-                api_key=api_key,
-                base_url=BASE_URL
-            )
-            
-            # 生成系统提示词
-            system_messages = generate_system_prompt(
-                user_desc=st.session_state.user_desc,
-                comfort_style=st.session_state.comfort_style,
-                word_limit=st.session_state.word_limit,
-                forbidden_phrases=st.session_state.forbidden_phrases
-            )
-            
-            # 构建完整消息列表（system + history）
-            api_messages = system_messages + [
-                {"role": m["role"], "content": m["content"]}
-                for m in st.session_state.messages
-            ]
-            
-            # 调用 API
-            with st.chat_message("assistant"):
-                message_placeholder = st.empty()
-                full_response = ""
-                
-                # 流式响应
-                stream = client.chat.completions.create(
-                    model=MODEL,
-                    messages=api_messages,
-                    stream=True,
-                    temperature=0.8,
-                    max_tokens=2048
-                )
-                
-                for chunk in stream:
-                    if chunk.choices[0].delta.content is not None:
-                        full_response += chunk.choices[0].delta.content
-                        message_placeholder.markdown(full_response + "▌")
-                
-                message_placeholder.markdown(full_response)
-            
-            # 保存 AI 回复
-            st.session_state.messages.append({"role": "assistant", "content": full_response})
+            submit_reply(prompt)
+            if st.session_state.pending_reply is not None:
+                render_pending_reply()
     
     except Exception as e:
-        st.error(f"❌ 出错了：{str(e)}")
-        st.info("💡 请检查 API Key 是否正确，或稍后重试。")
+        show_error(e)
 
 # ==================== 空状态提示 ====================
 if not st.session_state.messages:
@@ -236,3 +768,12 @@ if not st.session_state.messages:
         </p>
     </div>
     """, unsafe_allow_html=True)
+
+# ==================== 预取下一轮 ====================
+if PREFETCH_ENABLED and st.session_state.pending_reply is None:
+    prefetch_next_turn()
+
+# ==================== rerun 统计 ====================
+# 只统计完整跑到底的整页 rerun（st.stop / st.rerun 提前结束的不算）
+st.session_state.rerun_stats["full_runs"] += 1
+st.session_state.rerun_stats["full_seconds"] += time.perf_counter() - RUN_STARTED_AT
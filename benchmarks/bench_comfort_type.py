@@ -0,0 +1,134 @@
+# bench_comfort_type.py
+# 本地安慰类型识别基准：每条消息的分类耗时、在一小组标注样例上的准确率，
+# 以及去掉提示词里「五种基本类型」整段说明、改为每轮一行策略后省下的 prompt token
+# 用法：python benchmarks/bench_comfort_type.py
+
+import time
+
+from common import percentiles, write_results
+
+from ai_brain import (base_system_prompt, comfort_type_messages, comfort_type_scores, detect_comfort_type,
+                      generate_system_prompt)
+from context_window import estimate_tokens
+
+# 改动前固定提示词里让模型自己判断类型的那一段（对照用）
+LEGACY_TYPE_SECTION = """## 情绪安慰类型识别
+
+不同的人在不同时刻需要不同类型的安慰。Echosoul 需要识别用户当前最需要哪种类型，并灵活调整。
+
+### 五种基本类型
+
+**1. 情绪聚焦型**
+- 特征：用户表达的是感受（"我好累"、"我很难过"、"我不知道为什么就是不开心"）
+- 需要：被倾听、被理解、被允许感受
+- 回应策略：多共情，少分析，不急着给建议，让用户感到情绪被接住
+
+**2. 问题聚焦型**
+- 特征：用户描述的是具体问题或困境（"我不知道该怎么处理这件事"、"他这样做我该怎么办"）
+- 需要：分析原因、找到解决方案
+- 回应策略：帮助理清问题，提供思路和具体建议
+
+**3. 意义聚焦型**
+- 特征：用户对某件事感到困惑或价值观受到冲击（"我不明白为什么会这样"、"这样做到底有什么意义"）
+- 需要：重新理解这件事的意义，获得新的视角
+- 回应策略：提供新的框架或角度，帮用户重新诠释经历
+
+**4. 陪伴型**
+- 特征：用户没有说太多具体内容，或者说"就是想找人聊聊"、"我也不知道想说什么"
+- 需要：不需要解决什么，就是有人在
+- 回应策略：保持在场感，话不用多，让用户感到不孤单
+
+**5. 宣泄型**
+- 特征：用户在倾倒情绪，话很多，可能有抱怨、愤怒、委屈
+- 需要：把情绪释放出来，不需要太多回应
+- 回应策略：少打断，用简短的话让用户知道你在听，等他们说完再回应
+
+### 类型是流动的
+
+同一个人在同一次对话中，可能会在不同类型之间切换。比如一开始只是想倾诉（宣泄型），说着说着想要建议了（问题聚焦型），最后需要一点鼓励（情绪聚焦型）。
+
+**保持觉察，跟随用户的节奏调整。**
+
+---
+"""
+
+LABELLED = [
+    ("我好累，今天又哭了", "情绪聚焦"),
+    ("心里特别难受，说不上来为什么", "情绪聚焦"),
+    ("最近一直很焦虑，晚上也很低落", "情绪聚焦"),
+    ("我不知道该怎么和领导说这件事，怎么办？", "问题聚焦"),
+    ("要不要换工作，我很纠结", "问题聚焦"),
+    ("明天面试，有什么建议吗", "问题聚焦"),
+    ("他这样做我该怎么处理？", "问题聚焦"),
+    ("我不明白努力到底有什么意义", "意义聚焦"),
+    ("人生是不是就这样了，活着有什么价值", "意义聚焦"),
+    ("想不通为什么会变成这样", "意义聚焦"),
+    ("在吗", "陪伴"),
+    ("就是想找人聊聊", "陪伴"),
+    ("我也不知道想说什么…", "陪伴"),
+    ("睡不着，一个人好无聊", "陪伴"),
+    ("凭什么每次都是我背锅！！气死我了", "宣泄"),
+    ("太过分了，真的受不了他们了，无语", "宣泄"),
+    ("烦死了烦死了，每次都这样，讨厌死了！", "宣泄"),
+    ("今天又被老板当着所有人的面骂了一顿，我辛辛苦苦做了一个月的方案，他看都没看就说不行，"
+     "然后转头把同事那个抄来的版本夸了一遍，我真的受不了了，凭什么啊，这种地方还有什么好待的！", "宣泄"),
+]
+REPEAT = 2000
+
+
+def bench_latency() -> dict:
+    samples = []
+    for _ in range(REPEAT // len(LABELLED)):
+        for text, _ in LABELLED:
+            start = time.perf_counter()
+            detect_comfort_type(text)
+            samples.append(time.perf_counter() - start)
+    return {key: value * 1e6 for key, value in percentiles(samples).items()}
+
+
+def bench_accuracy() -> dict:
+    wrong = [{"text": text, "label": label, "predicted": detect_comfort_type(text),
+              "scores": {k: round(v, 2) for k, v in comfort_type_scores(text).items()}}
+             for text, label in LABELLED if detect_comfort_type(text) != label]
+    return {"samples": len(LABELLED), "correct": len(LABELLED) - len(wrong), "wrong": wrong}
+
+
+def legacy_base_prompt() -> str:
+    """把现在的精简段落换回旧的整段说明，得到改动前的固定提示词。"""
+    base = base_system_prompt()
+    start = base.index("## 情绪安慰类型")
+    end = base.index("## 个性化机制")
+    return base[:start] + LEGACY_TYPE_SECTION + base[end:]
+
+
+def bench_tokens() -> dict:
+    legacy_tokens = estimate_tokens(legacy_base_prompt())
+    per_turn = [
+        legacy_tokens - sum(estimate_tokens(message["content"])
+                            for message in generate_system_prompt() + comfort_type_messages(detect_comfort_type(text)))
+        for text, _ in LABELLED
+    ]
+    return {
+        "legacy_prompt_tokens": legacy_tokens,
+        "base_prompt_tokens": estimate_tokens(base_system_prompt()),
+        "saved_per_turn_mean": sum(per_turn) / len(per_turn),
+        "saved_per_turn_min": min(per_turn),
+    }
+
+
+def main() -> None:
+    results = {"latency_us": bench_latency(), "accuracy": bench_accuracy(), "tokens": bench_tokens()}
+    latency = results["latency_us"]
+    print(f"分类耗时：p50={latency['p50']:.1f} µs  p99={latency['p99']:.1f} µs")
+    accuracy = results["accuracy"]
+    print(f"标注样例：{accuracy['correct']} / {accuracy['samples']} 正确")
+    for row in accuracy["wrong"]:
+        print(f"  ✗ {row['text'][:20]}… 标注={row['label']} 预测={row['predicted'] or '（未识别）'}")
+    tokens = results["tokens"]
+    print(f"系统提示词 {tokens['legacy_prompt_tokens']} → {tokens['base_prompt_tokens']} tokens（不含本轮策略），"
+          f"每轮平均省下 {tokens['saved_per_turn_mean']:.0f} prompt tokens（最少 {tokens['saved_per_turn_min']}）")
+    write_results("comfort_type", results)
+
+
+if __name__ == "__main__":
+    main()
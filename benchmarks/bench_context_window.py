@@ -0,0 +1,55 @@
+# bench_context_window.py
+# 200 轮合成对话：对比「全量历史」与「token 预算窗口 + 滚动摘要」的 prompt 大小
+# 用法：python benchmarks/bench_context_window.py
+
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from context_window import build_context, estimate_tokens, new_summary_state  # noqa: E402
+from messages import History, Message  # noqa: E402
+
+TURNS = 200
+SENTENCES = [
+    "最近工作压力很大，感觉每天都很累。",
+    "我不知道该怎么和领导沟通这件事。",
+    "其实我也明白，只是心里还是过不去。",
+    "你说得对，我可能需要给自己一点时间。",
+    "有时候真的想什么都不管，好好睡一觉。",
+]
+
+
+def _payload_tokens(messages) -> int:
+    return sum(estimate_tokens(m["content"] if isinstance(m, dict) else m.content) for m in messages)
+
+
+def main() -> None:
+    rng = random.Random(42)
+    messages = History()
+    state = new_summary_state()
+    build_seconds = 0.0
+
+    print(f"{'turn':>5} {'full_tokens':>12} {'window_tokens':>14}")
+    for turn in range(1, TURNS + 1):
+        user_text = "".join(rng.choice(SENTENCES) for _ in range(rng.randint(1, 3)))
+        messages.append(Message("user", user_text))
+
+        start = time.perf_counter()
+        context = build_context(messages, state)
+        build_seconds += time.perf_counter() - start
+
+        if turn % 20 == 0 or turn == 1:
+            full = _payload_tokens(messages)
+            print(f"{turn:>5} {full:>12} {_payload_tokens(context):>14}")
+
+        reply = "".join(rng.choice(SENTENCES) for _ in range(rng.randint(4, 10)))
+        messages.append(Message("assistant", reply))
+
+    print(f"build_context 平均耗时：{build_seconds / TURNS * 1e6:.1f} µs/turn")
+
+
+if __name__ == "__main__":
+    main()
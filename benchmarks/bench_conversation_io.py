@@ -0,0 +1,136 @@
+# bench_conversation_io.py
+# 对话导出 / 导入基准：1k / 10k / 50k 条消息，none / gzip / zstd（装了 zstandard 才测）
+# 吞吐按未压缩的 NDJSON 字节数计算（MB/s），另用 tracemalloc 量峰值内存，
+# 和「先把整段历史读进内存再 json.dumps」的做法对比，确认导出 / 导入是流式的
+# 用法：python benchmarks/bench_conversation_io.py   往返内容不一致时退出码为 1
+
+import gzip
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from common import write_results
+
+from conversation_io import export_conversation, import_conversation, zstd_available
+from history_store import HistoryStore
+from messages import Message
+
+SIZES = (1000, 10000, 50000)
+SENTENCES = [
+    "最近工作压力很大，感觉每天都很累。",
+    "我不知道该怎么和领导沟通这件事。",
+    "其实我也明白，只是心里还是过不去。",
+    "你说得对，我可能需要给自己一点时间。",
+    "有时候真的想什么都不管，好好睡一觉。",
+    "听起来你已经撑了很久，愿意多说一点吗？",
+]
+SETTINGS = {"user_desc": "最近有点累", "comfort_style": "温暖陪伴", "word_limit": 200,
+            "forbidden_phrases": "我只是一个AI"}
+
+
+def fill(store: HistoryStore, session_id: str, n: int, seed: int = 42) -> None:
+    rng = random.Random(seed)
+    now = time.time()
+    batch = []
+    for i in range(n):
+        content = "".join(rng.choice(SENTENCES) for _ in range(rng.randint(1, 8)))
+        batch.append(Message("user" if i % 2 == 0 else "assistant", content, created_at=now + i))
+        if len(batch) == 1000:
+            store.append_many(session_id, batch)
+            batch = []
+    store.append_many(session_id, batch)
+
+
+def materialized_export(store: HistoryStore, session_id: str, path: str) -> None:
+    # 对照组：整段历史读进内存，拼成一个大字符串再压缩写出
+    rows = [[m.role, m.content, m.created_at] for batch in store.iter_messages(session_id) for m in batch]
+    data = json.dumps({"settings": SETTINGS, "messages": rows}, ensure_ascii=False).encode("utf-8")
+    with open(path, "wb") as f:
+        f.write(gzip.compress(data, compresslevel=6))
+
+
+def timed(fn) -> float:
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def peak_bytes(fn) -> int:
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+
+def main() -> None:
+    compressions = ["none", "gzip"] + (["zstd"] if zstd_available() else [])
+    tmp = tempfile.mkdtemp(prefix="echosoul-io-")
+    store = HistoryStore(os.path.join(tmp, "history.db"))
+    results = []
+    failures = []
+    print(f"{'messages':>8} {'codec':>6} {'raw_MB':>7} {'file_MB':>8} {'ratio':>6} "
+          f"{'export_MB/s':>12} {'import_MB/s':>12} {'export_peak_KB':>15} {'import_peak_KB':>15}")
+    for n in SIZES:
+        source = f"source-{n}"
+        fill(store, source, n)
+        original = [(m.role, m.content, m.created_at) for b in store.iter_messages(source) for m in b]
+
+        raw_path = os.path.join(tmp, f"raw-{n}.ndjson")
+        with open(raw_path, "wb") as f:
+            export_conversation(store, source, SETTINGS, f, "none")
+        raw_bytes = os.path.getsize(raw_path)
+
+        for codec in compressions:
+            path = os.path.join(tmp, f"export-{n}.{codec}")
+
+            def export():
+                with open(path, "wb") as f:
+                    export_conversation(store, source, SETTINGS, f, codec)
+
+            target = f"import-{n}-{codec}"
+
+            def do_import(session_id=target):
+                with open(path, "rb") as f:
+                    return import_conversation(f, store, session_id)
+
+            export_seconds = timed(export)
+            import_seconds = timed(do_import)
+            imported = [(m.role, m.content, m.created_at) for b in store.iter_messages(target) for m in b]
+            if imported != original:
+                failures.append(f"{n} 条 / {codec}：导入后内容和原会话不一致")
+            store.archive(target)
+
+            row = {
+                "messages": n,
+                "compression": codec,
+                "raw_bytes": raw_bytes,
+                "file_bytes": os.path.getsize(path),
+                "export_mb_s": raw_bytes / export_seconds / 1e6,
+                "import_mb_s": raw_bytes / import_seconds / 1e6,
+                "export_peak": peak_bytes(export),
+                "import_peak": peak_bytes(lambda: do_import(f"{target}-mem")),
+            }
+            store.archive(f"{target}-mem")
+            results.append(row)
+            print(f"{n:>8} {codec:>6} {raw_bytes / 1e6:>7.2f} {row['file_bytes'] / 1e6:>8.2f} "
+                  f"{raw_bytes / row['file_bytes']:>6.1f} {row['export_mb_s']:>12.1f} {row['import_mb_s']:>12.1f} "
+                  f"{row['export_peak'] / 1024:>15.0f} {row['import_peak'] / 1024:>15.0f}")
+
+        baseline_path = os.path.join(tmp, f"materialized-{n}.json.gz")
+        baseline_peak = peak_bytes(lambda: materialized_export(store, source, baseline_path))
+        results.append({"messages": n, "compression": "materialized-gzip", "export_peak": baseline_peak})
+        print(f"{n:>8} {'对照':>6} {'(整段读进内存再 gzip)':>46} {baseline_peak / 1024:>15.0f}")
+
+    write_results("conversation_io", results)
+    for failure in failures:
+        print(failure)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+# bench_generation.py
+# 对本地桩服务器测首 token 延迟（TTFT）：
+# 1) 每轮新建 OpenAI 客户端（旧） vs 共享连接池客户端（新）
+# 2) GenerationService 在不同并发数下的吞吐和 p50 / p99 TTFT
+# 用法：python benchmarks/bench_generation.py
+
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from common import percentiles, write_results
+from mock_server import start_mock_server
+
+from api_client import METRICS, create_async_client, get_client
+from gen_service import GenerationService
+from router import ProviderRouter
+from openai import OpenAI
+
+MESSAGES = [{"role": "user", "content": "我不开心"}]
+
+
+def _stream_ttft(client) -> float:
+    start = time.perf_counter()
+    stream = client.chat.completions.create(model="mock", messages=MESSAGES, stream=True, max_tokens=64)
+    ttft = None
+    for chunk in stream:
+        if ttft is None and chunk.choices and chunk.choices[0].delta.content:
+            ttft = time.perf_counter() - start
+    return ttft
+
+
+def bench_client_reuse(server, sessions: int, turns: int) -> dict:
+    base_url = server.base_url
+
+    def fresh_client_turns(_):
+        return [_stream_ttft(OpenAI(api_key="mock", base_url=base_url)) for _ in range(turns)]
+
+    def pooled_client_turns(_):
+        return [_stream_ttft(get_client("mock", base_url)) for _ in range(turns)]
+
+    results = {}
+    for name, worker in (("per_turn_client", fresh_client_turns), ("pooled_client", pooled_client_turns)):
+        METRICS.reset()
+        connections_before = server.config.connections
+        with ThreadPoolExecutor(sessions) as pool:
+            samples = [s for batch in pool.map(worker, range(sessions)) for s in batch]
+        results[name] = {
+            "ttft": percentiles(samples),
+            "server_connections": server.config.connections - connections_before,
+            "client_metrics": METRICS.snapshot(),
+        }
+    return results
+
+
+def bench_service(base_url: str, concurrency: int, requests: int) -> dict:
+    client = create_async_client("mock", base_url, max_connections=concurrency)
+    service = GenerationService(ProviderRouter.single(client), max_concurrency=concurrency, max_per_user=1)
+    start = time.perf_counter()
+    handles = [service.submit(f"user-{i}", model="mock", messages=MESSAGES, max_tokens=64)
+               for i in range(requests)]
+    tokens = sum(1 for handle in handles for _ in handle)
+    elapsed = time.perf_counter() - start
+    stats = service.stats.snapshot()
+    return {
+        "concurrency": concurrency,
+        "requests": requests,
+        "seconds": elapsed,
+        "streams_per_sec": requests / elapsed,
+        "tokens_per_sec": tokens / elapsed,
+        "peak_active": stats["peak_active"],
+        "ttft_p50": stats.get("ttft_p50"),
+        "ttft_p99": stats.get("ttft_p99"),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="首 token 延迟 / 并发吞吐基准")
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--tokens-per-sec", type=float, default=100.0)
+    parser.add_argument("--sessions", type=int, default=8)
+    parser.add_argument("--turns", type=int, default=5)
+    parser.add_argument("--requests", type=int, default=64)
+    args = parser.parse_args()
+
+    server = start_mock_server(latency=args.latency, tokens_per_sec=args.tokens_per_sec, reply_tokens=64)
+    results = {
+        "config": vars(args),
+        "client_reuse": bench_client_reuse(server, args.sessions, args.turns),
+        "service": [bench_service(server.base_url, c, args.requests) for c in (1, 4, 16, 64)],
+    }
+    server.shutdown()
+
+    for name, data in results["client_reuse"].items():
+        print(f"{name:<16} ttft p50={data['ttft']['p50'] * 1e3:.1f} ms  "
+              f"connections={data['server_connections']}")
+    for row in results["service"]:
+        print(f"concurrency={row['concurrency']:>3}  {row['streams_per_sec']:.1f} streams/s  "
+              f"ttft p50={row['ttft_p50'] * 1e3:.0f} ms  p99={row['ttft_p99'] * 1e3:.0f} ms")
+    write_results("generation", results)
+
+
+if __name__ == "__main__":
+    main()
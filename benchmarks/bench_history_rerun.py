@@ -0,0 +1,64 @@
+# bench_history_rerun.py
+# 用 AppTest 测一次 rerun 的耗时：全量渲染历史（旧） vs 窗口化渲染（新），50 / 500 / 5000 条消息
+# 用法：python benchmarks/bench_history_rerun.py
+
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from streamlit.testing.v1 import AppTest  # noqa: E402
+
+from messages import History, Message  # noqa: E402
+
+SIZES = (50, 500, 5000)
+RERUNS = 5
+
+
+def _full_app():
+    import streamlit as st
+
+    for message in st.session_state.messages:
+        with st.chat_message(message.role):
+            st.markdown(message.content)
+
+
+def _windowed_app():
+    import os
+
+    from history_store import HistoryStore
+    from history_view import render_history
+
+    render_history(HistoryStore(os.environ["ECHOSOUL_BENCH_DB"]), "bench")
+
+
+def _messages(n: int) -> History:
+    return History(
+        Message("user" if i % 2 == 0 else "assistant", f"第 {i} 条消息：最近有点累，但还在努力。" * 3, i + 1)
+        for i in range(n)
+    )
+
+
+def _time_reruns(script, n: int) -> float:
+    at = AppTest.from_function(script, default_timeout=60)
+    at.session_state["messages"] = _messages(n)
+    at.session_state["earlier_messages"] = []
+    at.run()
+    start = time.perf_counter()
+    for _ in range(RERUNS):
+        at.run()
+    return (time.perf_counter() - start) / RERUNS * 1e3
+
+
+def main() -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["ECHOSOUL_BENCH_DB"] = os.path.join(tmp, "bench.db")
+        print(f"{'messages':>8} {'full_ms':>10} {'windowed_ms':>12}")
+        for n in SIZES:
+            print(f"{n:>8} {_time_reruns(_full_app, n):>10.1f} {_time_reruns(_windowed_app, n):>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+# bench_messages.py
+# 消息模型基准（tracemalloc）：长对话下 dict 列表（旧） vs Message / History（新）的
+# 1) 每个会话常驻内存  2) 每轮组装 API 消息时新分配的内存  3) 序列化耗时和大小
+# 用法：python benchmarks/bench_messages.py
+
+import json
+import random
+import time
+import tracemalloc
+
+from common import write_results
+
+from context_window import build_context, estimate_tokens, new_summary_state
+from messages import History, Message
+
+SIZES = (200, 2000, 20000)
+TURNS = 50
+SENTENCES = [
+    "最近工作压力很大，感觉每天都很累。",
+    "我不知道该怎么和领导沟通这件事。",
+    "其实我也明白，只是心里还是过不去。",
+    "你说得对，我可能需要给自己一点时间。",
+    "有时候真的想什么都不管，好好睡一觉。",
+]
+
+
+def synthetic_rows(n: int, seed: int = 42) -> list:
+    rng = random.Random(seed)
+    now = time.time()
+    return [
+        (i + 1, "user" if i % 2 == 0 else "assistant",
+         "".join(rng.choice(SENTENCES) for _ in range(rng.randint(1, 6))), now + i)
+        for i in range(n)
+    ]
+
+
+def build_dicts(rows: list) -> list:
+    # 旧模型：每条消息一个 dict，token 数第一次估算后写回 "tokens" 字段
+    messages = [{"id": i, "role": role, "content": content} for i, role, content, _ in rows]
+    for message in messages:
+        message["tokens"] = estimate_tokens(message["content"]) + 4
+    return messages
+
+
+def build_history(rows: list) -> History:
+    history = History(Message.from_row(row) for row in rows)
+    for message in history:
+        message.tokens
+    return history
+
+
+def retained_bytes(build, rows: list) -> int:
+    """构建一份历史后常驻的内存（不含 rows 里共享的字符串）。"""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    messages = build(rows)
+    retained = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del messages
+    return retained
+
+
+def old_payload(messages: list, window: int) -> list:
+    # 旧做法：每轮把窗口内的消息逐条复制成新的 {"role", "content"}
+    return [{"role": m["role"], "content": m["content"]} for m in messages[-window:]]
+
+
+def per_turn_bytes(rows: list, window: int) -> dict:
+    """连续 TURNS 轮组装 API 消息，统计每轮新分配的峰值内存。"""
+    messages = build_dicts(rows)
+    history = build_history(rows)
+    start = len(history) - window
+    # 新做法走 build_context 时也是 history.payloads(start)，这里去掉摘要部分单独比较
+    build_context(history, new_summary_state())
+
+    results = {}
+    for name, make in (("dicts", lambda: old_payload(messages, window)),
+                       ("history", lambda: history.payloads(start))):
+        make()
+        tracemalloc.start()
+        peak = 0
+        for _ in range(TURNS):
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+            payload = make()
+            peak = max(peak, tracemalloc.get_traced_memory()[1] - base)
+            del payload
+        tracemalloc.stop()
+        results[name] = peak
+    return results
+
+
+def serialize(rows: list) -> dict:
+    messages = build_dicts(rows)
+    history = build_history(rows)
+    start = time.perf_counter()
+    old = json.dumps(messages, ensure_ascii=False)
+    old_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    new = history.dumps()
+    new_seconds = time.perf_counter() - start
+    return {"dicts_bytes": len(old.encode("utf-8")), "dicts_ms": old_seconds * 1e3,
+            "history_bytes": len(new.encode("utf-8")), "history_ms": new_seconds * 1e3}
+
+
+def main() -> None:
+    results = []
+    print(f"{'messages':>8} {'dict_KB':>9} {'history_KB':>11} {'turn_dict_KB':>13} {'turn_hist_KB':>13} "
+          f"{'dump_dict_ms':>13} {'dump_hist_ms':>13}")
+    for n in SIZES:
+        rows = synthetic_rows(n)
+        turn = per_turn_bytes(rows, window=min(n, 60))
+        row = {
+            "messages": n,
+            "retained_dicts": retained_bytes(build_dicts, rows),
+            "retained_history": retained_bytes(build_history, rows),
+            "turn_dicts": turn["dicts"],
+            "turn_history": turn["history"],
+            **serialize(rows),
+        }
+        results.append(row)
+        print(f"{n:>8} {row['retained_dicts'] / 1024:>9.1f} {row['retained_history'] / 1024:>11.1f} "
+              f"{row['turn_dicts'] / 1024:>13.1f} {row['turn_history'] / 1024:>13.1f} "
+              f"{row['dicts_ms']:>13.2f} {row['history_ms']:>13.2f}")
+    write_results("messages", results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+# bench_prefetch.py
+# 预取基准：对本地桩服务器测「点发送 -> 首 token」的耗时，预取关闭（旧） vs 开启（新）
+# 桩服务器模拟 TLS 握手耗时（--connect-latency）和服务端断开空闲长连接（--idle-timeout），
+# 用户每轮输入耗时超过空闲断开时间，不预热的话每轮提交都要重新建连
+# 另外验证取消路径：租约取消后不再发保活请求，被丢下的租约到期后自动停止
+# 用法：python benchmarks/bench_prefetch.py --turns 8 --typing 2.0
+
+import argparse
+import time
+
+from common import percentiles, write_results
+from mock_server import start_mock_server
+
+from ai_brain import comfort_type_messages, detect_comfort_type, generate_system_prompt
+from api_client import create_async_client
+from context_window import build_context, extend_context, new_summary_state
+from gen_service import GenerationService
+from messages import History, Message
+from router import ProviderRouter
+
+SETTINGS = {"user_desc": "最近工作压力很大", "comfort_style": "温暖陪伴", "word_limit": 200,
+            "forbidden_phrases": "我只是一个AI"}
+PROMPTS = ["今天又被领导批评了，好难受", "我该怎么办才好？", "其实也没什么，就是有点累",
+           "谢谢你一直听我说", "我觉得自己什么都做不好……"]
+
+
+def seed_history(n: int) -> History:
+    return History(
+        Message("user" if i % 2 == 0 else "assistant", f"第 {i} 条：最近有点累，但还在努力撑着。" * 4)
+        for i in range(n)
+    )
+
+
+def system_messages() -> list:
+    return generate_system_prompt(**SETTINGS)
+
+
+def run_turns(service: GenerationService, prefetch: bool, turns: int, typing: float, ttl: float) -> dict:
+    history = seed_history(400)
+    state = new_summary_state()
+    comfort_type = ""
+    ttft, prepare = [], []
+    for turn in range(turns):
+        lease = context = None
+        if prefetch:
+            # 上一轮回复结束：预热提示词缓存、裁剪好上下文、申请连接预热租约
+            system_messages()
+            context = build_context(history, state)
+            lease = service.prewarm(ttl)
+        time.sleep(typing)                    # 用户输入中
+
+        prompt = PROMPTS[turn % len(PROMPTS)]
+        submitted_at = time.perf_counter()
+        history.append(Message("user", prompt))
+        comfort_type = detect_comfort_type(prompt, comfort_type)
+        api_messages = system_messages()
+        extended = extend_context(context, history, state) if context is not None else None
+        api_messages += extended if extended is not None else build_context(history, state)
+        api_messages += comfort_type_messages(comfort_type)
+        if lease is not None:
+            lease.cancel()
+        prepare.append(time.perf_counter() - submitted_at)
+
+        handle = service.submit(f"bench-{prefetch}", model="mock", messages=api_messages, max_tokens=32)
+        text = []
+        for token in handle:
+            if not text:
+                ttft.append(time.perf_counter() - submitted_at)
+            text.append(token)
+        history.append(Message("assistant", "".join(text)))
+    return {"submit_to_first_token": percentiles(ttft), "prepare": percentiles(prepare)}
+
+
+def check_cancellation(service: GenerationService, server, interval: float) -> dict:
+    """取消后的租约不产生任何请求；没人取消的租约在 ttl 后停止保活。"""
+    pings = server.config.pings
+    lease = service.prewarm(ttl=60)
+    lease.cancel()
+    time.sleep(interval * 3)
+    after_cancel = server.config.pings - pings
+
+    pings = server.config.pings
+    service.prewarm(ttl=interval * 2.5)       # 被丢下的草稿：没人取消
+    time.sleep(interval * 3)
+    during = server.config.pings - pings
+    time.sleep(interval * 3)
+    after_expiry = server.config.pings - pings - during
+    return {"pings_after_cancel": after_cancel, "pings_while_abandoned": during,
+            "pings_after_expiry": after_expiry}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="预取 / 连接预热对提交到首 token 的影响")
+    parser.add_argument("--turns", type=int, default=8)
+    parser.add_argument("--typing", type=float, default=2.0, help="每轮用户输入耗时（秒）")
+    parser.add_argument("--connect-latency", type=float, default=0.15, help="桩服务器模拟的握手耗时")
+    parser.add_argument("--idle-timeout", type=float, default=1.0, help="桩服务器断开空闲连接的秒数")
+    args = parser.parse_args()
+
+    server = start_mock_server(latency=0.05, tokens_per_sec=0, reply_tokens=32,
+                               connect_latency=args.connect_latency, idle_timeout=args.idle_timeout)
+    interval = args.idle_timeout / 2
+    results = {}
+    for prefetch in (False, True):
+        client = create_async_client("mock", server.base_url)
+        service = GenerationService(ProviderRouter.single(client), prewarm_interval=interval)
+        service.warm_up()
+        connections = server.config.connections
+        data = run_turns(service, prefetch, args.turns, args.typing, ttl=args.typing * 2)
+        data["new_connections"] = server.config.connections - connections
+        data["prewarms"] = service.stats.snapshot()["prewarms"]
+        name = "prefetch" if prefetch else "no_prefetch"
+        results[name] = data
+        print(f"{name:>12}: 首 token p50 {data['submit_to_first_token']['p50'] * 1e3:7.1f} ms  "
+              f"p95 {data['submit_to_first_token']['p95'] * 1e3:7.1f} ms  "
+              f"提交准备 p50 {data['prepare']['p50'] * 1e3:.2f} ms  "
+              f"新建连接 {data['new_connections']}  保活请求 {data['prewarms']}")
+        if prefetch:
+            results["cancellation"] = check_cancellation(service, server, interval)
+            print(f"{'取消路径':>10}: {results['cancellation']}")
+    write_results("prefetch", results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+# bench_prompt_artifact.py
+# 预编译提示词产物基准：
+# 1) 编译耗时、产物大小、变体个数，且每个变体都和按源文件现拼的结果逐字节相同
+# 2) 启动：mmap 加载产物 vs 每次启动从源文件现拼全部变体
+# 3) 取一个「风格 × 字数」变体的耗时（产物 vs 现拼）
+# 4) 多个 worker 进程同时 mmap 同一个产物时的内存占用（/proc/self/smaps 的 Rss / Pss，Pss 按共享进程数分摊）
+# 5) 热加载：改动源文件后多久新提示词生效
+# 用法：python benchmarks/bench_prompt_artifact.py
+
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+
+from common import percentiles, write_results
+
+from prompt_compiler import SOURCE_DIR, build_variants, compile_prompts, load_sources
+from prompt_store import CompiledPrompts, PromptStore
+
+WORKERS = 4
+REPEAT = 200
+
+
+def mapping_memory(path: str) -> dict:
+    """本进程里 path 这个映射的 Rss / Pss（KB）；不是 Linux 时返回空 dict。"""
+    try:
+        with open("/proc/self/smaps", encoding="utf-8") as f:
+            lines = f.read().splitlines()
+    except OSError:
+        return {}
+    memory, inside = {}, False
+    for line in lines:
+        fields = line.split()
+        if "-" in fields[0] and len(fields) >= 5:
+            inside = fields[-1] == path
+        elif inside and fields[0] in ("Rss:", "Pss:"):
+            memory[fields[0][:-1].lower()] = memory.get(fields[0][:-1].lower(), 0) + int(fields[1])
+    return memory
+
+
+def worker(path: str, barrier) -> dict:
+    prompts = CompiledPrompts(path)
+    for key in prompts.index["variants"]:
+        style, word_limit = key.split("|")
+        prompts.static_prompt(style, int(word_limit))
+    barrier.wait()                    # 所有进程都映射好了再量，Pss 才按共享进程数分摊
+    memory = mapping_memory(path)
+    barrier.wait()
+    return memory
+
+
+def bench_sharing(path: str) -> list:
+    ctx = multiprocessing.get_context("spawn")
+    with ctx.Manager() as manager:
+        barrier = manager.Barrier(WORKERS)
+        with ctx.Pool(WORKERS) as pool:
+            return pool.starmap(worker, [(path, barrier)] * WORKERS)
+
+
+def bench_reload(tmp: str) -> dict:
+    source_dir = os.path.join(tmp, "src")
+    shutil.copytree(SOURCE_DIR, source_dir, ignore=shutil.ignore_patterns("compiled"))
+    store = PromptStore(os.path.join(source_dir, "compiled", "prompts.bin"), source_dir, check_interval=0.05)
+    before = store.current.version
+    time.sleep(0.01)                  # 保证源文件的 mtime 比产物新
+    with open(os.path.join(source_dir, "base.md"), "a", encoding="utf-8") as f:
+        f.write("\n（热加载测试）\n")
+    start = time.perf_counter()
+    while "热加载测试" not in store.current.base:
+        time.sleep(0.005)
+    return {"seconds": time.perf_counter() - start, "before": before, "after": store.current.version,
+            "reloads": store.reloads}
+
+
+def main() -> None:
+    tmp = tempfile.mkdtemp(prefix="echosoul-prompts-")
+    path = os.path.join(tmp, "prompts.bin")
+
+    start = time.perf_counter()
+    index = compile_prompts(SOURCE_DIR, path)
+    compile_ms = (time.perf_counter() - start) * 1000
+    expected = build_variants(load_sources(SOURCE_DIR))
+    prompts = CompiledPrompts(path)
+    for key, text in expected.items():
+        style, word_limit = key.split("|")
+        assert prompts.static_prompt(style, int(word_limit)) == text, key
+    results = {"version": index["version"], "variants": len(expected), "compile_ms": compile_ms,
+               "artifact_kb": os.path.getsize(path) / 1024}
+    print(f"版本 {index['version']}：{len(expected)} 个变体，产物 {results['artifact_kb']:.1f} KB，"
+          f"编译 {compile_ms:.1f} ms，全部变体与现拼结果一致")
+
+    load, assemble = [], []
+    for _ in range(REPEAT):
+        t0 = time.perf_counter()
+        CompiledPrompts(path)
+        t1 = time.perf_counter()
+        build_variants(load_sources(SOURCE_DIR))
+        t2 = time.perf_counter()
+        load.append((t1 - t0) * 1e6)
+        assemble.append((t2 - t1) * 1e6)
+    results["startup_us"] = {"mmap": percentiles(load), "assemble": percentiles(assemble)}
+    print(f"启动：mmap 加载 p50={percentiles(load)['p50']:.0f} µs，"
+          f"从源文件现拼 p50={percentiles(assemble)['p50']:.0f} µs")
+
+    sources = load_sources(SOURCE_DIR)
+    lookup, concat = [], []
+    for _ in range(REPEAT):
+        t0 = time.perf_counter()
+        prompts.static_prompt("犀利点拨", 200)
+        t1 = time.perf_counter()
+        sources["base"] + f"\n\n{sources['style_heading']}\n{sources['styles']['犀利点拨']}" \
+            + f"\n\n{sources['word_limit_heading']}\n" + sources["word_limit"].format(word_limit=200)
+        t2 = time.perf_counter()
+        lookup.append((t1 - t0) * 1e6)
+        concat.append((t2 - t1) * 1e6)
+    results["lookup_us"] = {"artifact": percentiles(lookup), "concat": percentiles(concat)}
+    print(f"取变体：产物 p50={percentiles(lookup)['p50']:.2f} µs，现拼 p50={percentiles(concat)['p50']:.2f} µs")
+
+    memory = bench_sharing(path)
+    results["sharing"] = memory
+    if memory and memory[0]:
+        rss = sum(m["rss"] for m in memory)
+        pss = sum(m["pss"] for m in memory)
+        print(f"{WORKERS} 个进程映射同一产物：Rss 合计 {rss} KB，Pss 合计 {pss} KB（实际只占一份）")
+    else:
+        print("跳过内存占用（没有 /proc/self/smaps）")
+
+    results["reload"] = bench_reload(tmp)
+    print(f"热加载：改动源文件后 {results['reload']['seconds'] * 1000:.0f} ms 生效，"
+          f"版本 {results['reload']['before']} -> {results['reload']['after']}")
+    shutil.rmtree(tmp, ignore_errors=True)
+    write_results("prompt_artifact", results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+# bench_router.py
+# 多服务商路由基准：两个首 token 延迟不同的本地桩服务器，比较
+# 1) 只用慢节点 / 路由到最快节点 的 TTFT
+# 2) 快节点突然卡住时，对冲请求把 TTFT 限制在 hedge_after 附近
+# 3) 快节点全部报错时自动切到备用节点
+# 用法：python benchmarks/bench_router.py
+
+import argparse
+import time
+
+from common import percentiles, write_results
+from mock_server import start_mock_server
+
+from api_client import create_async_client
+from gen_service import GenerationService
+from router import Provider, ProviderRouter
+
+MESSAGES = [{"role": "user", "content": "我不开心"}]
+
+
+def make_service(servers: dict, hedge_after: float) -> GenerationService:
+    providers = [Provider(name, create_async_client("mock", server.base_url, max_retries=0), "mock")
+                 for name, server in servers.items()]
+    return GenerationService(ProviderRouter(providers, hedge_after=hedge_after), max_per_user=1,
+                             max_attempts=1)
+
+
+def run_turns(service: GenerationService, turns: int) -> dict:
+    samples = []
+    errors = 0
+    for i in range(turns):
+        start = time.perf_counter()
+        handle = service.submit(f"user-{i}", model="mock", messages=MESSAGES, max_tokens=8)
+        ttft = None
+        try:
+            for _ in handle:
+                if ttft is None:
+                    ttft = time.perf_counter() - start
+        except Exception:
+            errors += 1
+        if ttft is not None:
+            samples.append(ttft)
+    stats = service.stats.snapshot()
+    return {
+        "ttft": percentiles(samples),
+        "errors": errors,
+        "hedges": stats["hedges"],
+        "failovers": stats["failovers"],
+        "providers": service.router.snapshot(),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="多服务商路由 / 对冲 / 故障切换基准")
+    parser.add_argument("--fast-latency", type=float, default=0.05)
+    parser.add_argument("--slow-latency", type=float, default=0.4)
+    parser.add_argument("--stall-latency", type=float, default=3.0, help="快节点卡住时的首 token 延迟")
+    parser.add_argument("--hedge-after", type=float, default=0.5)
+    parser.add_argument("--turns", type=int, default=30)
+    args = parser.parse_args()
+
+    fast = start_mock_server(latency=args.fast_latency, tokens_per_sec=0, reply_tokens=8)
+    slow = start_mock_server(latency=args.slow_latency, tokens_per_sec=0, reply_tokens=8)
+    results = {"config": vars(args)}
+
+    # 1) 基线：只有慢节点；路由：慢节点排在配置的第一位，看路由能否学会改走快节点
+    results["slow_only"] = run_turns(make_service({"slow": slow}, 0), args.turns)
+    results["routed"] = run_turns(make_service({"slow": slow, "fast": fast}, args.hedge_after), args.turns)
+
+    # 2) 快节点卡住：没有对冲时每轮都要等满 stall，有对冲时在 hedge_after 后改由慢节点出字
+    fast.config.latency = args.stall_latency
+    service = make_service({"fast": fast, "slow": slow}, 0)
+    results["stalled_no_hedge"] = run_turns(service, 3)
+    service = make_service({"fast": fast, "slow": slow}, args.hedge_after)
+    results["stalled_hedged"] = run_turns(service, args.turns)
+
+    # 3) 快节点全部报错：每轮都自动切到慢节点，错误率升高后快节点被排到后面
+    fast.config.latency = args.fast_latency
+    fast.config.error_rate = 1.0
+    results["fast_failing"] = run_turns(make_service({"fast": fast, "slow": slow}, args.hedge_after),
+                                        args.turns)
+    fast.shutdown()
+    slow.shutdown()
+
+    for name in ("slow_only", "routed", "stalled_no_hedge", "stalled_hedged", "fast_failing"):
+        data = results[name]
+        wins = ", ".join(f"{p['name']}={p['wins']}" for p in data["providers"])
+        print(f"{name:<18} ttft p50={data['ttft']['p50'] * 1e3:7.1f} ms  p99={data['ttft']['p99'] * 1e3:7.1f} ms  "
+              f"hedges={data['hedges']:<3} failovers={data['failovers']:<3} errors={data['errors']}  wins: {wins}")
+    write_results("router", results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+# bench_settings_rerun.py
+# 脚本化地改一遍侧边栏设置，比较两个版本的代码各会触发多少次 rerun、每次多久。
+# 设置控件直接写回 session_state 时，每改一次（输入框回车 / 失焦、点单选、拖滑块）就整页 rerun 一次；
+# 控件放在表单里时编辑不触发 rerun，点「应用设置」才 rerun 一次。
+# --before / --after 是要对比的 git 版本，--after 缺省时用当前工作区（含未提交的改动）；
+# 每个版本各自从 git 取出完整代码树，在子进程里用 AppTest 跑（避免几份同名模块混在一个进程里），
+# 会话里预先放一段历史，让每次 rerun 的开销接近真实使用。
+# 注意 AppTest 每次交互都跑整个脚本：表单版本那次应用设置在浏览器里只有改了 user_desc 才整页 rerun，
+# 否则只重跑侧边栏 fragment，所以这里测到的表单版本每次耗时是上限。
+# 用法：python benchmarks/bench_settings_rerun.py [--before HEAD~1] [--after <rev>] [--messages 200]
+
+import argparse
+import inspect
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Optional
+
+from common import ROOT, percentiles, write_results
+
+SESSION_ID = "bench-settings"
+# 一次典型的改设置：描述分三次写完，换风格，字数拖两下，改禁止短语
+EDITS = [
+    ("text_input", "user_desc_input", "最近"),
+    ("text_input", "user_desc_input", "最近工作压力很大"),
+    ("text_input", "user_desc_input", "最近工作压力很大，有点累"),
+    ("radio", "comfort_style_radio", "温和鼓励"),
+    ("select_slider", "word_limit_slider", 100),
+    ("select_slider", "word_limit_slider", 150),
+    ("text_input", "forbidden_phrases_input", "我只是一个AI, 加油"),
+]
+
+
+def resolve(rev: str) -> str:
+    return subprocess.check_output(["git", "rev-parse", "--short", rev], cwd=ROOT, text=True).strip()
+
+
+def extract(rev: str, dest: str) -> str:
+    archive = subprocess.run(["git", "archive", rev], cwd=ROOT, capture_output=True, check=True).stdout
+    subprocess.run(["tar", "-x", "-C", dest], input=archive, check=True)
+    return dest
+
+
+def seed_history(db_path: str, n: int) -> None:
+    from history_store import HistoryStore
+
+    store = HistoryStore(db_path)
+    uses_message = "role" not in inspect.signature(store.append).parameters
+    for i in range(n):
+        role = "user" if i % 2 == 0 else "assistant"
+        content = f"第 {i} 条消息：最近有点累，但还在努力。" * 3
+        if uses_message:
+            from messages import Message
+
+            store.append(SESSION_ID, Message(role, content))
+        else:
+            store.append(SESSION_ID, role, content)
+
+
+def sidebar_runs(at) -> Optional[int]:
+    return at.session_state["rerun_stats"]["sidebar_runs"] if "rerun_stats" in at.session_state else None
+
+
+def run_session(tree: str, messages: int) -> dict:
+    """在子进程里执行：对 tree 下的 app.py 跑一遍 EDITS，记录每次 rerun 的耗时。"""
+    from streamlit.testing.v1 import AppTest
+
+    db_path = os.path.join(tempfile.mkdtemp(prefix="echosoul-settings-"), "bench.db")
+    seed_history(db_path, messages)
+    at = AppTest.from_file(os.path.join(tree, "app.py"), default_timeout=120)
+    at.secrets["DEEPSEEK_API_KEY"] = "mock-key"
+    at.secrets["HISTORY_DB_PATH"] = db_path
+    at.query_params["sid"] = SESSION_ID
+    at.run()
+
+    submit = [button for button in at.button if button.key and button.key.startswith("FormSubmitter:")]
+    runs_at_start = sidebar_runs(at)
+    seconds = []
+    for kind, key, value in EDITS:
+        widget = getattr(at, kind)(key=key)
+        if kind == "text_input":
+            widget.input(value)
+        else:
+            widget.set_value(value)
+        if not submit:               # 没有表单：每次编辑都会触发一次 rerun
+            start = time.perf_counter()
+            at.run()
+            seconds.append(time.perf_counter() - start)
+    if submit:                       # 表单：编辑全部攒着，提交时 rerun 一次
+        start = time.perf_counter()
+        submit[0].click().run()
+        seconds.append(time.perf_counter() - start)
+    if at.exception:
+        raise RuntimeError(at.exception[0].message)
+
+    applied = {key: at.session_state[key] for key in ("user_desc", "comfort_style", "word_limit",
+                                                        "forbidden_phrases")}
+    # 有 rerun_stats 的版本按脚本实际运行次数算（提交后改了 user_desc 会再 st.rerun 一次整页），
+    # 没有的版本每次交互就是一次 rerun
+    runs = sidebar_runs(at) - runs_at_start if runs_at_start is not None else len(seconds)
+    return {"form": bool(submit), "interactions": len(seconds), "reruns": runs, "seconds": seconds,
+            "applied": applied}
+
+
+def measure(tree: str, messages: int) -> dict:
+    proc = subprocess.run([sys.executable, os.path.abspath(__file__), "--worker", tree,
+                           "--messages", str(messages)], cwd=tree, capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise SystemExit(proc.stderr.strip().splitlines()[-1])
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="侧边栏设置的 rerun 次数 / 耗时（两个版本对比）")
+    parser.add_argument("--before", default="HEAD~1", help="对比的基线版本（git revision）")
+    parser.add_argument("--after", default=None, help="对比的新版本（git revision），缺省用当前工作区")
+    parser.add_argument("--messages", type=int, default=200, help="会话里预置的历史条数")
+    parser.add_argument("--worker", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        sys.path.insert(0, args.worker)
+        print(json.dumps(run_session(args.worker, args.messages), ensure_ascii=False))
+        return
+
+    results = {"before_rev": resolve(args.before),
+               "after_rev": resolve(args.after) if args.after else "working tree",
+               "messages": args.messages, "edits": len(EDITS)}
+    with tempfile.TemporaryDirectory(prefix="echosoul-before-") as tmp:
+        results["before"] = measure(extract(args.before, tmp), args.messages)
+    if args.after:
+        with tempfile.TemporaryDirectory(prefix="echosoul-after-") as tmp:
+            results["after"] = measure(extract(args.after, tmp), args.messages)
+    else:
+        results["after"] = measure(ROOT, args.messages)
+    assert results["after"]["applied"] == results["before"]["applied"], "两个版本最终的设置不一致"
+
+    print(f"{len(EDITS)} 次编辑，会话里 {args.messages} 条历史：")
+    for name in ("before", "after"):
+        data = results[name]
+        timing = percentiles([s * 1e3 for s in data["seconds"]])
+        data["ms"] = timing
+        print(f"  {name:<6} {results[name + '_rev']:<12} 触发 rerun 的交互 {data['interactions']:>2} 次"
+              f"（脚本运行 {data['reruns']:>2} 次）  每次交互 p50 {timing['p50']:7.1f} ms  "
+              f"合计 {sum(data['seconds']) * 1e3:7.1f} ms")
+    write_results("settings_rerun", results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+# bench_shared_state.py
+# 多进程共享状态验证 + 基准：SQLite 文件后端 和 Redis 协议后端（本地假服务器）各跑一遍
+# 1) 进程 A 写对话和设置 -> 进程 B 读到后接着聊 -> 进程 A 再读到 B 写的内容（不靠粘性会话）
+# 2) 两个进程同时抢同一个限流窗口，放行总数不能超过上限
+# 3) 后端单次操作延迟（get / set / incr / 追加消息）
+# 用法：python benchmarks/bench_shared_state.py   任何一项验证失败时退出码为 1
+# 跨进程的正确性另有 tests/test_shared_state.py（python -m pytest -q tests），这里侧重延迟数据
+
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+import uuid
+
+from common import percentiles, write_results
+from fake_redis import start_fake_redis
+
+from history_store import HistoryStore, RedisHistoryStore
+from messages import Message
+from shared_state import load_settings, open_backend, save_settings
+
+LIMIT = 100
+ATTEMPTS = 150                    # 每个进程尝试的次数，两个进程合计远超上限
+OPS = 500
+
+
+def _open(url: str, db_path: str):
+    # 不走 st.cache_resource 的缓存，每个进程各开各的连接
+    store = RedisHistoryStore(url) if url.startswith("redis://") else HistoryStore(db_path)
+    return open_backend(url, db_path), store
+
+
+def worker_turn(url: str, db_path: str, session_id: str, turn: int, settings: dict) -> dict:
+    """一个全新的进程接手会话：读出之前的设置和消息，再追加一轮。"""
+    backend, store = _open(url, db_path)
+    seen_settings = load_settings(backend, session_id)
+    seen = [m.content for m in store.load_recent(session_id, limit=100)]
+    store.append(session_id, Message("user", f"第 {turn} 轮：用户的话（pid {os.getpid()}）"))
+    store.append(session_id, Message("assistant", f"第 {turn} 轮：回复（pid {os.getpid()}）"))
+    save_settings(backend, session_id, {**(seen_settings or {}), **settings})
+    return {"pid": os.getpid(), "settings": seen_settings, "messages": seen}
+
+
+def worker_limit(url: str, db_path: str, name: str, start_at: float) -> int:
+    backend, _ = _open(url, db_path)
+    # 两个进程约好同一时刻开抢，保证请求真正交错
+    time.sleep(max(start_at - time.time(), 0))
+    return sum(backend.consume(name, 1, LIMIT, window=3600) == 0 for _ in range(ATTEMPTS))
+
+
+def check_handoff(pool, url: str, db_path: str) -> list:
+    session_id = uuid.uuid4().hex
+    turns = [
+        ("A", {"tone": "温柔"}),
+        ("B", {"temperature": 0.6}),
+        ("A", {}),
+    ]
+    failures = []
+    results = []
+    for turn, (_, settings) in enumerate(turns, start=1):
+        results.append(pool.apply(worker_turn, (url, db_path, session_id, turn, settings)))
+    first, second, third = results
+    if second["messages"] != [f"第 1 轮：用户的话（pid {first['pid']}）", f"第 1 轮：回复（pid {first['pid']}）"]:
+        failures.append(f"进程 B 没读到 A 写的消息：{second['messages']}")
+    if second["settings"] != {"tone": "温柔"}:
+        failures.append(f"进程 B 没读到 A 保存的设置：{second['settings']}")
+    if len(third["messages"]) != 4 or "pid " + str(second["pid"]) not in third["messages"][-1]:
+        failures.append(f"进程 A 没读到 B 写的消息：{third['messages']}")
+    if third["settings"] != {"tone": "温柔", "temperature": 0.6}:
+        failures.append(f"进程 A 没读到 B 更新的设置：{third['settings']}")
+    return failures
+
+
+def check_limit(pool, url: str, db_path: str) -> tuple:
+    name = f"bench:{uuid.uuid4().hex}"
+    start_at = time.time() + 1.0
+    admitted = pool.starmap(worker_limit, [(url, db_path, name, start_at)] * 2, chunksize=1)
+    failures = []
+    if sum(admitted) != LIMIT:
+        failures.append(f"限流放行 {sum(admitted)} 次（{admitted}），应为 {LIMIT}")
+    return admitted, failures
+
+
+def measure_ops(url: str, db_path: str) -> dict:
+    backend, store = _open(url, db_path)
+    session_id = uuid.uuid4().hex
+    ops = {
+        "set": lambda i: backend.set(f"bench:{i % 50}", "x" * 64),
+        "get": lambda i: backend.get(f"bench:{i % 50}"),
+        "incr": lambda i: backend.incr("bench:counter", 1, ttl=60),
+        "append": lambda i: store.append(session_id, Message("user", "最近有点累。")),
+    }
+    results = {}
+    for name, op in ops.items():
+        samples = []
+        for i in range(OPS):
+            start = time.perf_counter()
+            op(i)
+            samples.append((time.perf_counter() - start) * 1e3)
+        results[name] = percentiles(samples)
+    return results
+
+
+def main() -> None:
+    server = start_fake_redis()
+    tmp = tempfile.mkdtemp(prefix="echosoul-shared-")
+    backends = {
+        "sqlite": ("", os.path.join(tmp, "shared.db")),
+        "redis": (server.url, os.path.join(tmp, "unused.db")),
+    }
+    results = {}
+    failures = []
+    # spawn + 每个任务换一个新进程：进程之间不共享任何内存，只能经由后端交换状态
+    with multiprocessing.get_context("spawn").Pool(2, maxtasksperchild=1) as pool:
+        for label, (url, db_path) in backends.items():
+            handoff = check_handoff(pool, url, db_path)
+            admitted, limit_failures = check_limit(pool, url, db_path)
+            ops = measure_ops(url, db_path)
+            failures += [f"[{label}] {f}" for f in handoff + limit_failures]
+            results[label] = {"handoff_ok": not handoff, "limit_admitted": admitted, "ops_ms": ops}
+            print(f"{label:>7}: 接力 {'通过' if not handoff else '失败'}，"
+                  f"两进程限流放行 {admitted}（上限 {LIMIT}）")
+            for name, stats in ops.items():
+                print(f"{'':>9}{name:>7} p50 {stats['p50']:.3f} ms  p99 {stats['p99']:.3f} ms")
+    server.shutdown()
+    write_results("shared_state", results)
+    for failure in failures:
+        print(failure)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
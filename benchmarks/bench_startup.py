@@ -0,0 +1,90 @@
+# bench_startup.py
+# 冷启动基准：用 python -X importtime 统计 app.py 依赖的本地模块导入耗时，
+# 检查 openai / httpx 没有在启动时被导入，并对总耗时设回归预算（超出则退出码为 1）
+# 用法：python benchmarks/bench_startup.py [--budget-ms 300] [--repeat 5]
+
+import argparse
+import statistics
+import subprocess
+import sys
+
+from common import ROOT, write_results
+
+# app.py 启动时导入的本地模块（streamlit 本身的耗时不计入预算，先单独导入）
+APP_MODULES = (
+    "ai_brain", "admission", "config", "gen_service", "stream_filter", "stream_render",
+    "context_window", "history_store", "reply_cache", "tracing", "history_view", "ui_style",
+)
+LAZY_MODULES = ("openai", "httpx")     # 只应在第一次发送消息时才导入
+DEFAULT_BUDGET_MS = 300.0
+
+
+def parse_importtime(stderr: str) -> dict:
+    """
+    解析 -X importtime 输出
+
+    Returns:
+        {模块名: (cumulative_us, 是否为顶层导入)}，只取每个模块第一次出现的那一行
+    """
+    timings = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        _, cumulative_us, name = line[len("import time:"):].split("|")
+        top_level = name.startswith(" ") and not name.startswith("  ")
+        name = name.strip()
+        if name not in timings:
+            timings[name] = (int(cumulative_us), top_level)
+    return timings
+
+
+def measure_once() -> dict:
+    code = "import streamlit\nimport " + ", ".join(APP_MODULES)
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=ROOT,
+                          capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise SystemExit(proc.stderr.strip().splitlines()[-1])
+    timings = parse_importtime(proc.stderr)
+    # 被别的本地模块顺带导入的模块已计入上层的 cumulative，合计时只加顶层导入，避免重复
+    total_us = sum(timings[name][0] for name in APP_MODULES if name in timings and timings[name][1])
+    return {
+        "modules_ms": {name: timings[name][0] / 1000 for name in APP_MODULES if name in timings},
+        "total_ms": total_us / 1000,
+        "streamlit_ms": timings.get("streamlit", (0, True))[0] / 1000,
+        "lazy_imported": [name for name in LAZY_MODULES if name in timings],
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="冷启动导入耗时基准")
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    runs = [measure_once() for _ in range(args.repeat)]
+    modules_ms = {name: statistics.median(run["modules_ms"].get(name, 0.0) for run in runs)
+                  for name in APP_MODULES}
+    total_ms = statistics.median(run["total_ms"] for run in runs)
+    lazy_imported = sorted({name for run in runs for name in run["lazy_imported"]})
+    results = {
+        "config": vars(args),
+        "modules_ms": modules_ms,
+        "total_ms": total_ms,
+        "streamlit_ms": statistics.median(run["streamlit_ms"] for run in runs),
+        "lazy_imported": lazy_imported,
+    }
+
+    for name, ms in sorted(modules_ms.items(), key=lambda item: -item[1]):
+        print(f"{name:<16} {ms:8.1f} ms")
+    print(f"本地模块合计 {total_ms:.1f} ms（预算 {args.budget_ms:.0f} ms），"
+          f"streamlit 自身 {results['streamlit_ms']:.1f} ms")
+    if lazy_imported:
+        print(f"启动时导入了应当懒加载的模块：{', '.join(lazy_imported)}")
+    write_results("startup", results)
+
+    if total_ms > args.budget_ms or lazy_imported:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
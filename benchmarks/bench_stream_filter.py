@@ -0,0 +1,66 @@
+# bench_stream_filter.py
+# 流式过滤器基准：每个 token 的额外开销，以及超长回复被截断后省下的 token 数
+# 用法：python benchmarks/bench_stream_filter.py
+
+import time
+
+from bench_stream_render import recorded_stream
+from common import write_results
+
+from context_window import estimate_tokens
+from stream_filter import StreamFilter, build_automaton, max_tokens_for_limit, parse_phrases
+
+PHRASES = "我只是一个AI, 我不知道, 没什么大不了的, 想开点, 你不应该这么想"
+WORD_LIMITS = (50, 100, 200, 500)
+
+
+def bench_overhead(chunks: list) -> dict:
+    start = time.perf_counter()
+    for _ in range(20):
+        stream_filter = StreamFilter(PHRASES, 0)
+        for text in chunks:
+            stream_filter.feed(text)
+        stream_filter.flush()
+    per_token = (time.perf_counter() - start) / (20 * len(chunks))
+
+    start = time.perf_counter()
+    build_automaton.cache_clear()
+    build_automaton(parse_phrases(PHRASES))
+    build_seconds = time.perf_counter() - start
+    return {"us_per_token": per_token * 1e6, "automaton_build_us": build_seconds * 1e6}
+
+
+def bench_truncation(chunks: list) -> list:
+    full_tokens = sum(estimate_tokens(text) for text in chunks)
+    rows = []
+    for limit in WORD_LIMITS:
+        stream_filter = StreamFilter("", limit)
+        consumed = 0
+        for text in chunks:
+            consumed += 1
+            stream_filter.feed(text)
+            if stream_filter.stopped:
+                break
+        streamed_tokens = sum(estimate_tokens(text) for text in chunks[:consumed])
+        rows.append({
+            "word_limit": limit,
+            "max_tokens": max_tokens_for_limit(limit),
+            "reply_tokens": full_tokens,
+            "streamed_tokens": streamed_tokens,
+            "tokens_saved": full_tokens - streamed_tokens,
+        })
+    return rows
+
+
+def main() -> None:
+    chunks = recorded_stream()
+    results = {"overhead": bench_overhead(chunks), "truncation": bench_truncation(chunks)}
+    print(f"过滤开销：{results['overhead']['us_per_token']:.2f} µs/token")
+    for row in results["truncation"]:
+        print(f"字数上限 {row['word_limit']:>4}：max_tokens={row['max_tokens']:>4}  "
+              f"省下 {row['tokens_saved']} / {row['reply_tokens']} tokens")
+    write_results("stream_filter", results)
+
+
+if __name__ == "__main__":
+    main()
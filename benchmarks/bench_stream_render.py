@@ -0,0 +1,80 @@
+# bench_stream_render.py
+# 回放一段 2k token 的流式回复：对比逐 token 渲染（旧） vs StreamRenderer 节流渲染（新）
+# 用法：python benchmarks/bench_stream_render.py
+
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from stream_render import CURSOR, StreamRenderer  # noqa: E402
+
+TOKENS = 2048
+TOKEN_GAP = 0.002                 # 模拟上游每个 token 的到达间隔（秒）
+
+
+class FakePlaceholder:
+    """统计渲染次数和发送字节数的假占位符。"""
+
+    def __init__(self):
+        self.calls = 0
+        self.bytes = 0
+
+    def markdown(self, body: str) -> None:
+        self.calls += 1
+        self.bytes += len(body.encode("utf-8"))
+
+
+def recorded_stream(seed: int = 7) -> list:
+    rng = random.Random(seed)
+    pieces = ["我", "在", "这里", "，", "慢慢", "说", "没关系", "。", "你", "已经", "很", "努力", "了", "\n\n"]
+    return [rng.choice(pieces) for _ in range(TOKENS)]
+
+
+class ReplayClock:
+    """按固定间隔推进的虚拟时钟，让回放结果可复现。"""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def run_naive(chunks: list) -> dict:
+    placeholder = FakePlaceholder()
+    start = time.process_time()
+    full_response = ""
+    for text in chunks:
+        full_response += text
+        placeholder.markdown(full_response + CURSOR)
+    placeholder.markdown(full_response)
+    return {"render_calls": placeholder.calls, "bytes_sent": placeholder.bytes,
+            "cpu_ms": (time.process_time() - start) * 1e3}
+
+
+def run_throttled(chunks: list) -> dict:
+    placeholder = FakePlaceholder()
+    clock = ReplayClock()
+    start = time.process_time()
+    renderer = StreamRenderer(placeholder, clock=clock)
+    for text in chunks:
+        clock.now += TOKEN_GAP
+        renderer.write(text)
+    renderer.close()
+    return {"render_calls": placeholder.calls, "bytes_sent": placeholder.bytes,
+            "cpu_ms": (time.process_time() - start) * 1e3}
+
+
+def main() -> None:
+    chunks = recorded_stream()
+    for name, runner in (("逐 token 渲染", run_naive), ("节流渲染", run_throttled)):
+        result = runner(chunks)
+        print(f"{name:<10} render_calls={result['render_calls']:>5}  "
+              f"bytes_sent={result['bytes_sent']:>10}  cpu={result['cpu_ms']:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+# bench_theme_payload.py
+# 对比主题 CSS 每次 rerun 发往浏览器的字节数：内联原始 PNG（旧） vs 静态 URL / 压缩 data URI（新）
+# 用法：python benchmarks/bench_theme_payload.py
+
+import base64
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from ui_style import _encode_background, _img_to_b64, build_css  # noqa: E402
+
+BG_PATH = os.path.join(ROOT, "assets", "background.png")
+
+
+def main() -> None:
+    start = time.perf_counter()
+    old_css = build_css(f"data:image/png;base64,{_img_to_b64(BG_PATH)}")
+    old_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    data, mime = _encode_background(BG_PATH)
+    encode_seconds = time.perf_counter() - start
+    data_uri_css = build_css(f"data:{mime};base64,{base64.b64encode(data).decode('utf-8')}")
+    static_css = build_css("app/static/bg-000000000000.jpg")
+
+    start = time.perf_counter()
+    for _ in range(1000):
+        build_css("app/static/bg-000000000000.jpg")
+    cached_seconds = (time.perf_counter() - start) / 1000
+
+    print(f"旧：内联原始 PNG      {len(old_css.encode()):>10} bytes/rerun  {old_seconds * 1e3:.1f} ms/rerun")
+    print(f"新：压缩 data URI     {len(data_uri_css.encode()):>10} bytes/rerun  (一次性编码 {encode_seconds * 1e3:.1f} ms)")
+    print(f"新：静态文件 URL      {len(static_css.encode()):>10} bytes/rerun  {cached_seconds * 1e6:.1f} µs/rerun")
+
+
+if __name__ == "__main__":
+    main()
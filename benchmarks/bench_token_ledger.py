@@ -0,0 +1,111 @@
+# bench_token_ledger.py
+# token 账本基准：
+# 1) 记账吞吐（每轮一个事务：一条明细 + 三个维度的汇总累加）
+# 2) 查询一个会话的汇总：汇总表主键查找（新） vs 对明细表 GROUP BY 现算（旧做法），1k / 10k / 100k 条明细
+# 3) 端到端：GenerationService 对本地桩服务器发 include_usage 请求，确认账本里记的是服务商返回的用量
+# 用法：python benchmarks/bench_token_ledger.py
+
+import os
+import random
+import tempfile
+import time
+
+from common import percentiles, write_results
+from mock_server import start_mock_server
+
+from token_ledger import TokenLedger, apply_budget
+
+SIZES = (1000, 10000, 100000)
+QUERIES = 200
+SESSIONS = 500
+
+
+def fill(ledger: TokenLedger, n: int, start: int, seed: int = 7) -> float:
+    rng = random.Random(seed + start)
+    now = time.time() - n
+    began = time.perf_counter()
+    for i in range(start, n):
+        prompt = rng.randint(500, 6000)
+        ledger.record(f"s{rng.randrange(SESSIONS)}", {
+            "model": rng.choice(("deepseek-chat", "backup-model")), "provider": "bench",
+            "prompt_tokens": prompt, "cached_tokens": rng.randint(0, prompt),
+            "completion_tokens": rng.randint(20, 400), "estimated": False,
+        }, created_at=now + i)
+    return time.perf_counter() - began
+
+
+def scan_rollup(ledger: TokenLedger, session_id: str) -> tuple:
+    return ledger._conn().execute(
+        "SELECT COUNT(*), SUM(prompt_tokens), SUM(cached_tokens), SUM(completion_tokens) "
+        "FROM token_ledger WHERE session_id = ?", (session_id,),
+    ).fetchone()
+
+
+def time_queries(fn) -> dict:
+    samples = []
+    for i in range(QUERIES):
+        session_id = f"s{i % SESSIONS}"
+        start = time.perf_counter()
+        fn(session_id)
+        samples.append((time.perf_counter() - start) * 1e6)
+    return percentiles(samples)
+
+
+def end_to_end(tmp: str) -> dict:
+    from api_client import create_async_client
+    from gen_service import GenerationService
+    from router import ProviderRouter
+
+    server = start_mock_server(latency=0.01, tokens_per_sec=0, reply_tokens=40)
+    ledger = TokenLedger(os.path.join(tmp, "e2e.db"))
+    service = GenerationService(ProviderRouter.single(create_async_client("mock", server.base_url)),
+                                ledger=ledger)
+    handle = service.submit("e2e", model="mock", max_tokens=64,
+                            messages=[{"role": "user", "content": "我今天有点难过"}])
+    "".join(handle)
+    time.sleep(0.2)                   # 记账在线程池里异步完成
+    entry = ledger.entries("e2e", 1)
+    return {"usage": handle.usage, "ledger": entry[0] if entry else None}
+
+
+def main() -> None:
+    tmp = tempfile.mkdtemp(prefix="echosoul-ledger-")
+    ledger = TokenLedger(os.path.join(tmp, "ledger.db"))
+    results = {"sizes": []}
+    done = 0
+    print(f"{'entries':>8} {'record/s':>9} {'rollup_p50_us':>14} {'scan_p50_us':>12} {'speedup':>8}")
+    for n in SIZES:
+        seconds = fill(ledger, n, done)
+        records_per_sec = (n - done) / seconds
+        done = n
+        rollup = time_queries(lambda sid: ledger.rollup("session", sid))
+        scan = time_queries(lambda sid: scan_rollup(ledger, sid))
+        # 两种算法的结果必须一致
+        sample = ledger.rollup("session", "s1")
+        assert tuple(sample.values()) == scan_rollup(ledger, "s1")
+        results["sizes"].append({"entries": n, "records_per_sec": records_per_sec,
+                                 "rollup_us": rollup, "scan_us": scan})
+        print(f"{n:>8} {records_per_sec:>9.0f} {rollup['p50']:>14.1f} {scan['p50']:>12.1f} "
+              f"{scan['p50'] / rollup['p50']:>7.1f}x")
+
+    budget = 20000
+    results["degrade"] = [
+        {"used": used, **dict(zip(("context_budget", "max_tokens", "level"),
+                                  apply_budget(used, budget, 6000, 1024)))}
+        for used in (0, 15000, 17000, 19000, 20000, 30000)
+    ]
+    print("会话预算 20000 下的降级：")
+    for row in results["degrade"]:
+        print(f"  已用 {row['used']:>6}: 上下文 {row['context_budget']:>5}  max_tokens {row['max_tokens']:>5}  "
+              f"level {row['level']:.2f}")
+
+    try:
+        results["end_to_end"] = end_to_end(tmp)
+        print(f"端到端：{results['end_to_end']}")
+    except ImportError as e:
+        print(f"跳过端到端（{e}）")
+    write_results("token_ledger", results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+# common.py
+# 压测 / 基准脚本共用的工具：把结果写成带 commit 信息的 JSON，方便逐 commit 对比
+
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def percentiles(samples: list) -> dict:
+    """p50 / p95 / p99 / mean，样本为空时返回空 dict。"""
+    if not samples:
+        return {}
+    if len(samples) == 1:
+        return {"p50": samples[0], "p95": samples[0], "p99": samples[0], "mean": samples[0]}
+    cuts = statistics.quantiles(samples, n=100, method="inclusive")
+    return {"p50": cuts[49], "p95": cuts[94], "p99": cuts[98], "mean": statistics.fmean(samples)}
+
+
+def write_results(name: str, results: dict, out_dir: str = RESULTS_DIR) -> str:
+    """写入 <out_dir>/<name>-<commit>.json 并返回路径。"""
+    os.makedirs(out_dir, exist_ok=True)
+    revision = git_revision()
+    payload = {
+        "benchmark": name,
+        "commit": revision,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "results": results,
+    }
+    path = os.path.join(out_dir, f"{name}-{revision}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(payload, f, ensure_ascii=False, indent=2)
+    print(f"结果已写入 {path}")
+    return path
@@ -0,0 +1,178 @@
+# fake_redis.py
+# 本地 Redis 协议假服务器：只实现 EchoSoul 用到的命令子集，离线测试多进程共享状态用
+# 用法：python benchmarks/fake_redis.py --port 6390
+# 然后把 secrets 里的 STATE_BACKEND_URL 设为 redis://127.0.0.1:6390/0
+
+import argparse
+import socketserver
+import threading
+import time
+
+
+class FakeRedisData:
+    """所有连接共享的数据：字符串 / 列表两种值，过期时间惰性检查。"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.values = {}
+        self.expires = {}
+        self.commands = 0
+
+    def _alive(self, key: bytes) -> bool:
+        expires_at = self.expires.get(key)
+        if expires_at is not None and expires_at <= time.time():
+            self.values.pop(key, None)
+            self.expires.pop(key, None)
+        return key in self.values
+
+    def execute(self, args: list):
+        name = args[0].upper()
+        with self.lock:
+            self.commands += 1
+            handler = getattr(self, "cmd_" + name.decode(), None)
+            if handler is None:
+                return ValueError(f"ERR unknown command '{name.decode()}'")
+            return handler(*args[1:])
+
+    def cmd_PING(self, *args):
+        return "PONG"
+
+    def cmd_SELECT(self, db):
+        return "OK"
+
+    def cmd_AUTH(self, *args):
+        return "OK"
+
+    def cmd_GET(self, key):
+        return self.values.get(key) if self._alive(key) else None
+
+    def cmd_SET(self, key, value, *options):
+        self.values[key] = value
+        self.expires.pop(key, None)
+        if len(options) == 2 and options[0].upper() in (b"PX", b"EX"):
+            scale = 1000.0 if options[0].upper() == b"PX" else 1.0
+            self.expires[key] = time.time() + int(options[1]) / scale
+        return "OK"
+
+    def cmd_DEL(self, *keys):
+        removed = 0
+        for key in keys:
+            if self._alive(key):
+                del self.values[key]
+                self.expires.pop(key, None)
+                removed += 1
+        return removed
+
+    def cmd_INCRBY(self, key, amount):
+        value = int(self.values[key]) if self._alive(key) else 0
+        value += int(amount)
+        self.values[key] = str(value).encode()
+        return value
+
+    def cmd_PEXPIRE(self, key, ms):
+        if not self._alive(key):
+            return 0
+        self.expires[key] = time.time() + int(ms) / 1000.0
+        return 1
+
+    def cmd_RPUSH(self, key, *items):
+        if not self._alive(key):
+            self.values[key] = []
+        values = self.values[key]
+        values.extend(items)
+        return len(values)
+
+    def cmd_LLEN(self, key):
+        return len(self.values[key]) if self._alive(key) else 0
+
+    def cmd_LRANGE(self, key, start, stop):
+        values = self.values[key] if self._alive(key) else []
+        start, stop = int(start), int(stop)
+        if start < 0:
+            start = max(len(values) + start, 0)
+        stop = len(values) + stop if stop < 0 else stop
+        return values[start:stop + 1]
+
+    def cmd_RENAME(self, key, new_key):
+        if not self._alive(key):
+            return ValueError("ERR no such key")
+        self.values[new_key] = self.values.pop(key)
+        if key in self.expires:
+            self.expires[new_key] = self.expires.pop(key)
+        return "OK"
+
+    def cmd_FLUSHDB(self):
+        self.values.clear()
+        self.expires.clear()
+        return "OK"
+
+
+def _encode(value) -> bytes:
+    if value is None:
+        return b"$-1\r\n"
+    if isinstance(value, ValueError):
+        return f"-{value}\r\n".encode()
+    if isinstance(value, int):
+        return b":%d\r\n" % value
+    if isinstance(value, str):
+        return f"+{value}\r\n".encode()
+    if isinstance(value, bytes):
+        return b"$%d\r\n%s\r\n" % (len(value), value)
+    return b"*%d\r\n" % len(value) + b"".join(_encode(item) for item in value)
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        data = self.server.data
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            if not line.startswith(b"*"):
+                # inline 命令（redis-cli / telnet 调试用）
+                args = line.split()
+            else:
+                args = []
+                for _ in range(int(line[1:-2])):
+                    length = int(self.rfile.readline()[1:-2])
+                    args.append(self.rfile.read(length + 2)[:-2])
+            if args:
+                self.wfile.write(_encode(data.execute(args)))
+                self.wfile.flush()
+
+
+class FakeRedisServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, port: int = 0, host: str = "127.0.0.1"):
+        super().__init__((host, port), _Handler)
+        self.data = FakeRedisData()
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"redis://{host}:{port}/0"
+
+
+def start_fake_redis(port: int = 0) -> FakeRedisServer:
+    """在后台线程启动假服务器；port=0 表示随机端口，用 server.url 拿地址。"""
+    server = FakeRedisServer(port)
+    threading.Thread(target=server.serve_forever, name="fake-redis", daemon=True).start()
+    return server
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="本地 Redis 协议假服务器")
+    parser.add_argument("--port", type=int, default=6390)
+    args = parser.parse_args()
+    server = FakeRedisServer(args.port)
+    print(f"fake redis listening on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
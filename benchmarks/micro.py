@@ -0,0 +1,69 @@
+# micro.py
+# 热路径微基准：generate_system_prompt / 主题 CSS / 流式渲染循环，结果写成 JSON
+# 用法：python benchmarks/micro.py
+
+import os
+import timeit
+
+from common import ROOT, write_results
+
+from ai_brain import _assemble_prompt, generate_system_prompt
+from bench_stream_render import recorded_stream, run_naive, run_throttled
+from ui_style import _encode_background, build_css
+
+REPEAT = 5
+
+
+def _best_us(stmt, number: int) -> float:
+    """多次重复取最快一次，返回单次调用的微秒数。"""
+    return min(timeit.repeat(stmt, number=number, repeat=REPEAT)) / number * 1e6
+
+
+def bench_system_prompt() -> dict:
+    args = dict(user_desc="最近工作压力很大", comfort_style="犀利点拨", word_limit=200,
+                forbidden_phrases="我只是一个AI, 我不知道")
+
+    def uncached():
+        _assemble_prompt.cache_clear()
+        generate_system_prompt(**args)
+
+    return {
+        "cached_us": _best_us(lambda: generate_system_prompt(**args), 10000),
+        "uncached_us": _best_us(uncached, 2000),
+    }
+
+
+def bench_theme() -> dict:
+    bg_path = os.path.join(ROOT, "assets", "background.png")
+    url = "app/static/bg-000000000000.jpg"
+
+    def uncached():
+        build_css.cache_clear()
+        build_css(url)
+
+    return {
+        "build_css_cached_us": _best_us(lambda: build_css(url), 10000),
+        "build_css_uncached_us": _best_us(uncached, 1000),
+        "encode_background_ms": _best_us(lambda: _encode_background(bg_path), 1) / 1e3,
+        "css_bytes": len(build_css(url).encode("utf-8")),
+    }
+
+
+def bench_stream_render() -> dict:
+    chunks = recorded_stream()
+    return {"naive": run_naive(chunks), "throttled": run_throttled(chunks)}
+
+
+def main() -> None:
+    results = {
+        "system_prompt": bench_system_prompt(),
+        "theme": bench_theme(),
+        "stream_render": bench_stream_render(),
+    }
+    for group, values in results.items():
+        print(group, values)
+    write_results("micro", results)
+
+
+if __name__ == "__main__":
+    main()
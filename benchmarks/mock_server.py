@@ -0,0 +1,192 @@
+# mock_server.py
+# 本地 OpenAI 兼容的流式桩服务器：可配置首 token 延迟、吐字速度和错误注入，离线压测用
+# 用法：python benchmarks/mock_server.py --port 8765 --latency 0.3 --tokens-per-sec 40 --error-rate 0.05
+#       --connect-latency 0.1 --idle-timeout 5   （模拟 TLS 握手耗时和服务端断开空闲长连接）
+# 然后把 secrets 里的 DEEPSEEK_BASE_URL 指向 http://127.0.0.1:8765
+
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+REPLY_PIECES = ["我", "在", "这里", "，", "慢慢", "说", "，", "不着急", "。", "你", "已经", "做得", "很好", "了", "。"]
+
+
+class MockConfig:
+    """桩服务器的行为参数，运行时可以直接改。"""
+
+    def __init__(self, latency: float = 0.2, tokens_per_sec: float = 50.0, reply_tokens: int = 120,
+                 error_rate: float = 0.0, retry_after: float = 1.0, seed: int = None,
+                 connect_latency: float = 0.0, idle_timeout: float = None):
+        self.latency = latency                # 首 token 之前的等待（秒）
+        self.tokens_per_sec = tokens_per_sec  # 吐字速度，0 表示不限速
+        self.reply_tokens = reply_tokens      # 每次回复的 token 数（不超过请求里的 max_tokens）
+        self.error_rate = error_rate          # 按概率返回 429 / 500
+        self.retry_after = retry_after        # 429 时 Retry-After 头的秒数
+        self.connect_latency = connect_latency  # 每条新连接第一次响应前的额外等待，模拟 TLS 握手
+        self.idle_timeout = idle_timeout      # 长连接空闲多久被服务端断开，None 表示不断开
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.connections = 0
+        self.pings = 0                        # GET /models 次数（预热 / 保活）
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"         # 支持 keep-alive，才能测出连接复用的效果
+
+    def setup(self):
+        # 等下一个请求超过 idle_timeout 就断开连接（handle_one_request 读超时后关闭）
+        self.timeout = self.server.config.idle_timeout
+        super().setup()
+        with self.server.config.lock:
+            self.server.config.connections += 1
+        self._handshake_pending = self.server.config.connect_latency > 0
+
+    def _handshake(self) -> None:
+        if self._handshake_pending:
+            self._handshake_pending = False
+            time.sleep(self.server.config.connect_latency)
+
+    def log_message(self, format, *args):
+        pass
+
+    def _write_chunk(self, data: bytes) -> None:
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def _send_json(self, status: int, payload: dict, headers: dict = None) -> None:
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        # 预热用的 GET /models
+        self._handshake()
+        if self.path.rstrip("/").endswith("/models"):
+            with self.server.config.lock:
+                self.server.config.pings += 1
+            self._send_json(200, {"object": "list", "data": [{"id": "mock", "object": "model",
+                                                              "owned_by": "mock"}]})
+        else:
+            self._send_json(404, {"error": {"message": "not found"}})
+
+    def do_POST(self):
+        config = self.server.config
+        self._handshake()
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": "not found"}})
+            return
+
+        with config.lock:
+            config.requests += 1
+            fail = config.rng.random() < config.error_rate
+            status = config.rng.choice((429, 500)) if fail else 200
+            if fail:
+                config.errors += 1
+        if fail:
+            headers = {"Retry-After": str(config.retry_after)} if status == 429 else {}
+            self._send_json(status, {"error": {"message": "injected error", "type": "mock"}}, headers)
+            return
+
+        n_tokens = min(config.reply_tokens, int(request.get("max_tokens") or config.reply_tokens))
+        tokens = [REPLY_PIECES[i % len(REPLY_PIECES)] for i in range(n_tokens)]
+        prompt_tokens = sum(len(m.get("content") or "") for m in request.get("messages", []))
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": n_tokens,
+                 "total_tokens": prompt_tokens + n_tokens, "prompt_cache_hit_tokens": 0,
+                 "prompt_cache_miss_tokens": prompt_tokens}
+        model = request.get("model", "mock")
+        time.sleep(config.latency)
+
+        if not request.get("stream"):
+            self._send_json(200, {
+                "id": "chatcmpl-mock", "object": "chat.completion", "created": int(time.time()),
+                "model": model, "usage": usage,
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": "".join(tokens)}}],
+            })
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        gap = 1.0 / config.tokens_per_sec if config.tokens_per_sec else 0.0
+        try:
+            for i, token in enumerate(tokens):
+                if i and gap:
+                    time.sleep(gap)
+                delta = {"content": token} if i else {"role": "assistant", "content": token}
+                self._event(model, [{"index": 0, "delta": delta, "finish_reason": None}])
+            self._event(model, [{"index": 0, "delta": {}, "finish_reason": "stop"}])
+            if (request.get("stream_options") or {}).get("include_usage"):
+                self._event(model, [], usage)
+            self._write_chunk(b"data: [DONE]\n\n")
+            self._write_chunk(b"")
+        except (BrokenPipeError, ConnectionResetError):
+            # 客户端提前关闭（取消 / 截断），不算错误
+            self.close_connection = True
+
+    def _event(self, model: str, choices: list, usage: dict = None) -> None:
+        payload = {"id": "chatcmpl-mock", "object": "chat.completion.chunk", "created": int(time.time()),
+                   "model": model, "choices": choices}
+        if usage is not None:
+            payload["usage"] = usage
+        self._write_chunk(f"data: {json.dumps(payload, ensure_ascii=False)}\n\n".encode("utf-8"))
+
+
+class MockServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, port: int = 0, config: MockConfig = None, host: str = "127.0.0.1"):
+        super().__init__((host, port), _Handler)
+        self.config = config or MockConfig()
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+def start_mock_server(port: int = 0, **config) -> MockServer:
+    """在后台线程启动桩服务器；port=0 表示随机端口，用 server.base_url 拿地址。"""
+    server = MockServer(port, MockConfig(**config))
+    threading.Thread(target=server.serve_forever, name="mock-deepseek", daemon=True).start()
+    return server
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="本地 OpenAI 兼容流式桩服务器")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.2, help="首 token 前的等待秒数")
+    parser.add_argument("--tokens-per-sec", type=float, default=50.0, help="吐字速度，0 为不限速")
+    parser.add_argument("--reply-tokens", type=int, default=120, help="每次回复的 token 数")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="返回 429/500 的概率")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="429 的 Retry-After 秒数")
+    parser.add_argument("--connect-latency", type=float, default=0.0, help="新连接的额外握手秒数")
+    parser.add_argument("--idle-timeout", type=float, default=None, help="空闲长连接被断开的秒数")
+    args = parser.parse_args()
+
+    server = MockServer(args.port, MockConfig(args.latency, args.tokens_per_sec, args.reply_tokens,
+                                              args.error_rate, args.retry_after,
+                                              connect_latency=args.connect_latency,
+                                              idle_timeout=args.idle_timeout))
+    print(f"mock DeepSeek listening on {server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+# run_app.py
+# 用 Streamlit AppTest 无头运行 app.py，对本地桩服务器跑脚本化的多轮对话
+# 用法：python benchmarks/run_app.py --conversations 3 --turns 10
+
+import argparse
+import os
+import tempfile
+import time
+
+from common import ROOT, percentiles, write_results
+from mock_server import start_mock_server
+from streamlit.testing.v1 import AppTest
+
+SCRIPT = [
+    "我不开心",
+    "最近工作压力很大，每天都加班到很晚",
+    "领导总是临时改需求，我也不知道该怎么拒绝",
+    "其实我也想过换工作，但又怕找不到更好的",
+    "你说得对，我可能需要先照顾好自己",
+    "谢谢你愿意听我说这些",
+]
+
+
+def run_conversation(base_url: str, db_path: str, turns: int) -> dict:
+    at = AppTest.from_file(os.path.join(ROOT, "app.py"), default_timeout=120)
+    at.secrets["DEEPSEEK_API_KEY"] = "mock-key"
+    at.secrets["DEEPSEEK_BASE_URL"] = base_url
+    at.secrets["HISTORY_DB_PATH"] = db_path
+
+    start = time.perf_counter()
+    at.run()
+    first_load = time.perf_counter() - start
+
+    turn_seconds = []
+    for i in range(turns):
+        start = time.perf_counter()
+        at.chat_input[0].set_value(SCRIPT[i % len(SCRIPT)]).run()
+        turn_seconds.append(time.perf_counter() - start)
+        if at.exception:
+            raise RuntimeError(at.exception[0].message)
+        if at.error:
+            raise RuntimeError(at.error[0].value)
+
+    return {
+        "first_load_seconds": first_load,
+        "turn_seconds": turn_seconds,
+        "messages": len(at.session_state["messages"]),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="AppTest 无头多轮对话压测")
+    parser.add_argument("--conversations", type=int, default=3)
+    parser.add_argument("--turns", type=int, default=6)
+    parser.add_argument("--latency", type=float, default=0.1)
+    parser.add_argument("--tokens-per-sec", type=float, default=200.0)
+    parser.add_argument("--reply-tokens", type=int, default=120)
+    args = parser.parse_args()
+
+    server = start_mock_server(latency=args.latency, tokens_per_sec=args.tokens_per_sec,
+                               reply_tokens=args.reply_tokens, seed=0)
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "history.db")
+        conversations = [run_conversation(server.base_url, db_path, args.turns)
+                         for _ in range(args.conversations)]
+    server.shutdown()
+
+    all_turns = [s for c in conversations for s in c["turn_seconds"]]
+    results = {
+        "config": vars(args),
+        "first_load": percentiles([c["first_load_seconds"] for c in conversations]),
+        "turn": percentiles(all_turns),
+        "conversations": conversations,
+        "mock_server": {"requests": server.config.requests, "connections": server.config.connections},
+    }
+    print(f"turn p50={results['turn']['p50'] * 1e3:.0f} ms  p99={results['turn']['p99'] * 1e3:.0f} ms")
+    write_results("app_conversation", results)
+
+
+if __name__ == "__main__":
+    main()
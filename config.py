@@ -0,0 +1,88 @@
+# config.py
+# 进程级配置：secrets 只在进程里读一次并做好类型转换，之后每次 rerun 直接复用
+
+import streamlit as st
+
+from admission import DEFAULT_RPM, DEFAULT_TPM
+from context_window import DEFAULT_TOKEN_BUDGET
+from conversation_io import DEFAULT_COMPRESSION
+from gen_service import (DEFAULT_MAX_CONCURRENCY, DEFAULT_MAX_PER_USER, DEFAULT_PREWARM_INTERVAL,
+                         DEFAULT_PREWARM_TTL)
+from history_store import DEFAULT_DB_PATH, DEFAULT_PAGE_SIZE
+from history_view import DEFAULT_WINDOW
+from reply_cache import DEFAULT_TTL
+from router import DEFAULT_HEDGE_AFTER
+from stream_render import DEFAULT_FLUSH_CHARS, DEFAULT_FLUSH_INTERVAL
+from token_ledger import DEFAULT_SESSION_BUDGET
+
+# (secrets 键名, 默认值, 类型转换)；默认值为 None 的项不做转换
+_SCHEMA = (
+    ("DEEPSEEK_API_KEY", "", str),
+    ("DEEPSEEK_BASE_URL", "https://api.deepseek.com", str),
+    ("DEEPSEEK_MODEL", "deepseek-chat", str),
+    ("DEEPSEEK_TIMEOUT", None, float),
+    ("DEEPSEEK_MAX_RETRIES", None, int),
+    ("DEEPSEEK_MAX_CONNECTIONS", None, int),
+    ("DEEPSEEK_MAX_KEEPALIVE", None, int),
+    ("PROVIDERS", None, list),
+    ("HEDGE_AFTER", DEFAULT_HEDGE_AFTER, float),
+    ("MAX_CONCURRENT_GENERATIONS", DEFAULT_MAX_CONCURRENCY, int),
+    ("MAX_GENERATIONS_PER_SESSION", DEFAULT_MAX_PER_USER, int),
+    ("DEEPSEEK_RPM", DEFAULT_RPM, float),
+    ("DEEPSEEK_TPM", DEFAULT_TPM, float),
+    ("CONTEXT_TOKEN_BUDGET", DEFAULT_TOKEN_BUDGET, int),
+    ("STREAM_FLUSH_INTERVAL", DEFAULT_FLUSH_INTERVAL, float),
+    ("STREAM_FLUSH_CHARS", DEFAULT_FLUSH_CHARS, int),
+    ("HISTORY_DB_PATH", DEFAULT_DB_PATH, str),
+    ("STATE_BACKEND_URL", "", str),
+    ("HISTORY_PAGE_SIZE", DEFAULT_PAGE_SIZE, int),
+    ("MAX_MESSAGES_IN_MEMORY", 200, int),
+    ("HISTORY_WINDOW", DEFAULT_WINDOW, int),
+    ("EXPORT_COMPRESSION", DEFAULT_COMPRESSION, str),
+    ("REPLY_CACHE_ENABLED", False, bool),
+    ("REPLY_CACHE_TTL", DEFAULT_TTL, float),
+    ("TRACE_JSONL_PATH", None, str),
+    ("METRICS_PORT", None, int),
+    ("ADMIN_TOKEN", "", str),
+    ("SESSION_TOKEN_BUDGET", DEFAULT_SESSION_BUDGET, int),
+    ("TOKEN_PRICES", None, dict),
+    ("PREFETCH_ENABLED", False, bool),
+    ("PREFETCH_TTL", DEFAULT_PREWARM_TTL, float),
+    ("PREFETCH_INTERVAL", DEFAULT_PREWARM_INTERVAL, float),
+)
+
+
+@st.cache_resource(show_spinner=False)
+def load_config() -> dict:
+    """
+    读取全部配置（每个进程只读一次 st.secrets）
+
+    Returns:
+        以 secrets 键名为 key 的配置字典；缺省项取各模块的默认值。
+        PROVIDERS 整理成 ((name, api_key, base_url, model), ...)
+    """
+    config = {}
+    for key, default, cast in _SCHEMA:
+        value = st.secrets.get(key, default)
+        config[key] = value if value is None else cast(value)
+    config["PROVIDERS"] = _providers(config)
+    return config
+
+
+def _providers(config: dict) -> tuple:
+    """
+    服务商节点列表
+
+    secrets 里用 [[PROVIDERS]] 表数组配置多个节点（name / base_url / model / api_key，
+    api_key 缺省时用 DEEPSEEK_API_KEY）；没配置时只有 DEEPSEEK_BASE_URL + DEEPSEEK_MODEL 一个节点。
+    """
+    entries = config["PROVIDERS"] or [{}]
+    providers = []
+    for i, entry in enumerate(entries):
+        providers.append((
+            str(entry.get("name", f"provider-{i}" if config["PROVIDERS"] else "deepseek")),
+            str(entry.get("api_key", config["DEEPSEEK_API_KEY"])),
+            str(entry.get("base_url", config["DEEPSEEK_BASE_URL"])),
+            str(entry.get("model", config["DEEPSEEK_MODEL"])),
+        ))
+    return tuple(providers)
@@ -0,0 +1,133 @@
+# context_window.py
+# 按 token 预算裁剪对话上下文：最近的对话原样保留，更早的对话滚动折叠成摘要
+
+from typing import Optional
+
+# DeepSeek 官方给的粗略换算：1 个中文字符 ≈ 0.6 token，1 个英文字符 ≈ 0.3 token
+CJK_TOKEN_RATIO = 0.6
+ASCII_TOKEN_RATIO = 0.3
+MESSAGE_OVERHEAD = 4              # 每条消息的角色 / 分隔符开销
+
+DEFAULT_TOKEN_BUDGET = 6000       # 历史消息（含摘要）的 token 上限
+DEFAULT_SUMMARY_BUDGET = 800      # 摘要本身的 token 上限
+SUMMARY_SNIPPET_CHARS = 60        # 每条被折叠的消息在摘要里保留的字数
+
+_ROLE_NAMES = {"user": "用户", "assistant": "你"}
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算一段文本的 token 数（不依赖分词器，足够做预算控制）。"""
+    if not text:
+        return 0
+    cjk = sum(1 for ch in text if ord(ch) > 0x2E80)
+    return int(cjk * CJK_TOKEN_RATIO + (len(text) - cjk) * ASCII_TOKEN_RATIO) + 1
+
+
+def new_summary_state() -> dict:
+    """滚动摘要的状态：folded 表示已折叠进摘要的消息条数，window_tokens 是上一次窗口内消息的 token 数。"""
+    return {"folded": 0, "lines": [], "tokens": 0, "window_tokens": 0}
+
+
+def _snippet(message) -> str:
+    content = " ".join(message.content.split())
+    if len(content) > SUMMARY_SNIPPET_CHARS:
+        content = content[:SUMMARY_SNIPPET_CHARS] + "…"
+    return f"- {_ROLE_NAMES.get(message.role, message.role)}：{content}"
+
+
+def _fold(state: dict, messages: list, summary_budget: int) -> None:
+    """把新移出窗口的消息追加进摘要；超出摘要预算就丢掉最早的几行。"""
+    for message in messages:
+        line = _snippet(message)
+        state["lines"].append(line)
+        state["tokens"] += estimate_tokens(line)
+    while state["lines"] and state["tokens"] > summary_budget:
+        state["tokens"] -= estimate_tokens(state["lines"].pop(0))
+
+
+def build_context(messages, state: Optional[dict] = None,
+                  token_budget: int = DEFAULT_TOKEN_BUDGET,
+                  summary_budget: int = DEFAULT_SUMMARY_BUDGET) -> list:
+    """
+    生成发送给 API 的历史消息
+
+    Args:
+        messages: 完整对话历史（messages.History，token 数和 payload 缓存在每条消息上）
+        state: 滚动摘要状态（由 new_summary_state 创建，跨轮次复用）
+        token_budget: 历史部分的 token 上限
+        summary_budget: 摘要部分的 token 上限
+
+    Returns:
+        list: [摘要 system message（可选）] + 最近窗口内的消息
+    """
+    if state is None:
+        state = new_summary_state()
+    if state["folded"] > len(messages):
+        # 历史被清空过，摘要也要重来
+        state.update(new_summary_state())
+
+    # 从最新的消息往前装，直到装不下为止；窗口起点只会向后移动
+    # 摘要的额度始终预留出来，保证 摘要 + 窗口 不超过 token_budget
+    window_budget = token_budget - summary_budget
+    start = len(messages)
+    used = 0
+    while start > state["folded"]:
+        cost = messages[start - 1].tokens
+        if used + cost > window_budget and start < len(messages):
+            break
+        used += cost
+        start -= 1
+
+    # 窗口尽量从用户消息开始，避免以一条孤立的 AI 回复开头
+    while start < len(messages) - 1 and messages[start].role != "user":
+        start += 1
+
+    if start > state["folded"]:
+        _fold(state, messages[state["folded"]:start], summary_budget)
+        state["folded"] = start
+
+    context = []
+    if state["lines"]:
+        context.append({
+            "role": "system",
+            "content": "## 之前的对话摘要\n" + "\n".join(state["lines"]),
+        })
+    context.extend(messages.payloads(start))
+    state["window_tokens"] = messages.tokens(start)
+    return context
+
+
+def extend_context(context: list, messages, state: dict,
+                   token_budget: int = DEFAULT_TOKEN_BUDGET,
+                   summary_budget: int = DEFAULT_SUMMARY_BUDGET) -> Optional[list]:
+    """
+    在预先算好的上下文后面接上最新一条消息，省掉提交时重新裁剪
+
+    context 必须是 messages 去掉最后一条时 build_context 的结果，且之后 state 没有变过。
+    新消息放得进窗口预算、窗口起点不需要移动时，结果和对整个 messages 调用 build_context 完全一样；
+    否则返回 None，由调用方退回 build_context。
+    """
+    message = messages[len(messages) - 1]
+    if state["window_tokens"] + message.tokens > token_budget - summary_budget:
+        return None
+    window = len(context) - (1 if state["lines"] else 0)
+    start = len(messages) - 1 - window
+    if window and messages[start].role != "user":
+        # 窗口原来以 AI 回复开头，加上新消息后 build_context 会把起点往后挪
+        return None
+    state["window_tokens"] += message.tokens
+    return context + [message.payload]
+
+
+def trim_folded(messages, state: dict, max_messages: int) -> int:
+    """
+    内存里的历史超过 max_messages 条时，丢掉最前面已经折叠进摘要的消息
+
+    只丢已折叠的部分，所以不影响下一轮发送的内容；返回丢掉的条数。
+    """
+    drop = min(len(messages) - max_messages, state["folded"])
+    if drop <= 0:
+        return 0
+    messages.drop_front(drop)
+    state["folded"] -= drop
+    return drop
@@ -0,0 +1,238 @@
+# conversation_io.py
+# 对话导出 / 导入：逐行 JSON（NDJSON），可选 gzip / zstd 压缩，全程流式读写，
+# 几千上万条的历史也不需要一次性放进内存
+
+import gzip
+import io
+import json
+import time
+import zlib
+from typing import Iterable, Iterator, Optional
+
+from messages import Message
+
+FORMAT_NAME = "echosoul-conversation"
+FORMAT_VERSION = 1
+COMPRESSIONS = ("gzip", "zstd", "none")
+DEFAULT_COMPRESSION = "gzip"
+DEFAULT_BATCH_SIZE = 500          # 导入时每批写入存储的消息条数
+_WRITE_CHUNK = 64 * 1024          # 攒够这么多字节再写一次，减少压缩器的调用次数
+_ROLES = ("user", "assistant")
+
+_GZIP_MAGIC = b"\x1f\x8b"
+_ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+_READ_SIZE = 1 << 13             # 解压 zstd 时每次读入的压缩数据字节数
+
+FILE_SUFFIXES = {"gzip": ".ndjson.gz", "zstd": ".ndjson.zst", "none": ".ndjson"}
+
+
+def zstd_available() -> bool:
+    """zstd 压缩需要额外安装 zstandard（pip install zstandard），没有就只能用 gzip。"""
+    try:
+        import zstandard  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def export_lines(messages: Iterable[Message], settings: dict) -> Iterator[bytes]:
+    """
+    逐行生成导出内容
+
+    第一行是文件头 {"format", "version", "exported_at", "settings"}，
+    之后每条消息一行紧凑数组 [role, content, created_at]（不带 id，导入时由存储重新分配）。
+    """
+    header = {"format": FORMAT_NAME, "version": FORMAT_VERSION,
+              "exported_at": time.time(), "settings": settings}
+    yield json.dumps(header, ensure_ascii=False).encode("utf-8") + b"\n"
+    dumps = json.JSONEncoder(ensure_ascii=False, separators=(",", ":")).encode
+    for message in messages:
+        yield dumps([message.role, message.content, message.created_at]).encode("utf-8") + b"\n"
+
+
+def _compressor(fileobj, compression: str):
+    if compression == "gzip":
+        # mtime=0：同样的内容导出两次字节完全一致
+        return gzip.GzipFile(fileobj=fileobj, mode="wb", compresslevel=6, mtime=0)
+    if compression == "zstd":
+        import zstandard
+
+        return zstandard.ZstdCompressor(level=3).stream_writer(fileobj, closefd=False)
+    if compression == "none":
+        return None
+    raise ValueError(f"不支持的压缩方式：{compression}")
+
+
+def write_export(fileobj, messages: Iterable[Message], settings: dict,
+                 compression: str = DEFAULT_COMPRESSION) -> int:
+    """
+    把消息流式写进一个二进制文件对象
+
+    Args:
+        fileobj: 可写的二进制文件对象（写完不会关闭它）
+        messages: 按时间正序的消息，可以是生成器
+        settings: 会话设置，原样写进文件头
+        compression: "gzip" / "zstd" / "none"
+
+    Returns:
+        int: 导出的消息条数
+    """
+    writer = _compressor(fileobj, compression)
+    target = writer or fileobj
+    buffer = []
+    size = 0
+    count = -1                    # 第一行是文件头
+    for line in export_lines(messages, settings):
+        count += 1
+        buffer.append(line)
+        size += len(line)
+        if size >= _WRITE_CHUNK:
+            target.write(b"".join(buffer))
+            buffer.clear()
+            size = 0
+    if buffer:
+        target.write(b"".join(buffer))
+    if writer is not None:
+        writer.close()
+    return count
+
+
+def export_conversation(store, session_id: str, settings: dict, fileobj,
+                        compression: str = DEFAULT_COMPRESSION) -> int:
+    """从历史存储里逐批读出会话并导出，内存里同时只有一批消息。"""
+    batches = store.iter_messages(session_id)
+    return write_export(fileobj, (message for batch in batches for message in batch), settings, compression)
+
+
+def _zstd_lines(fileobj, decompressor) -> Iterator[bytes]:
+    """
+    逐行解压 zstd 流
+
+    stream_reader 读到截断的帧会当成正常结束，静默丢掉后半段；
+    这里用 decompressobj 自己解压，读完后检查帧是否完整。
+    """
+    pending = b""
+    while True:
+        chunk = fileobj.read(_READ_SIZE)
+        if not chunk:
+            break
+        pending += decompressor.decompress(chunk)
+        *lines, pending = pending.split(b"\n")
+        yield from lines
+    if not decompressor.eof:
+        raise EOFError("zstd 数据在帧结束前就断了")
+    if pending:
+        yield pending
+
+
+def _decompressed(fileobj):
+    """按文件开头的魔数判断压缩方式，返回可以逐行迭代的解压后内容。"""
+    if not hasattr(fileobj, "peek"):
+        fileobj = io.BufferedReader(fileobj)
+    head = fileobj.peek(4)[:4]
+    if head.startswith(_GZIP_MAGIC):
+        return gzip.GzipFile(fileobj=fileobj, mode="rb")
+    if head.startswith(_ZSTD_MAGIC):
+        try:
+            import zstandard
+        except ImportError:
+            raise ValueError("这是 zstd 压缩的导出文件，需要先安装 zstandard（pip install zstandard）") from None
+        return _zstd_lines(fileobj, zstandard.ZstdDecompressor().decompressobj())
+    return fileobj
+
+
+def _decompress_errors() -> tuple:
+    """截断 / 损坏的压缩数据在读的时候才报错：gzip 抛 EOFError / BadGzipFile（OSError）/ zlib.error，zstd 抛 ZstdError。"""
+    errors = (EOFError, OSError, zlib.error)
+    try:
+        import zstandard
+    except ImportError:
+        return errors
+    return errors + (zstandard.ZstdError,)
+
+
+def _lines(stream) -> Iterator[bytes]:
+    """逐行读解压后的流，解压出错统一转成 ValueError。"""
+    try:
+        yield from stream
+    except _decompress_errors() as e:
+        raise ValueError(f"导出文件已损坏或不完整（{e}）") from None
+
+
+def _valid_row(row) -> bool:
+    created_at = row[2] if isinstance(row, list) and len(row) == 3 else None
+    return (created_at is not None and row[0] in _ROLES and isinstance(row[1], str)
+            and isinstance(created_at, (int, float)) and not isinstance(created_at, bool))
+
+
+def read_export(fileobj, batch_size: int = DEFAULT_BATCH_SIZE) -> tuple:
+    """
+    流式读取导出文件
+
+    Args:
+        fileobj: 可读的二进制文件对象（压缩与否自动识别）
+        batch_size: 每批消息条数
+
+    Returns:
+        tuple: (文件头里的设置 dict, 逐批产出 Message 列表的生成器)
+
+    Raises:
+        ValueError: 不是 EchoSoul 导出文件、版本不支持、某一行格式不对，或压缩数据截断 / 损坏
+            （读到出问题的那一批时才抛出）
+    """
+    lines = _lines(_decompressed(fileobj))
+    first = next(lines, b"")
+    try:
+        header = json.loads(first)
+    except ValueError:
+        header = None
+    if not isinstance(header, dict) or header.get("format") != FORMAT_NAME:
+        raise ValueError("不是 EchoSoul 的对话导出文件")
+    if header.get("version") != FORMAT_VERSION:
+        raise ValueError(f"不支持的导出文件版本：{header.get('version')}")
+    settings = header.get("settings") or {}
+    if not isinstance(settings, dict):
+        raise ValueError("导出文件里的设置格式不对")
+
+    def batches() -> Iterator[list]:
+        batch = []
+        for number, line in enumerate(lines, start=2):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                raise ValueError(f"第 {number} 行格式不对") from None
+            if not _valid_row(row):
+                raise ValueError(f"第 {number} 行格式不对")
+            role, content, created_at = row
+            batch.append(Message(role, content, created_at=float(created_at)))
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    return settings, batches()
+
+
+def import_conversation(fileobj, store, session_id: str,
+                        batch_size: int = DEFAULT_BATCH_SIZE) -> tuple:
+    """
+    把导出文件逐批追加进会话的历史存储（每批一个事务），不在内存里攒整段历史
+
+    追加完后页面照常只从存储加载最近一页，更早的消息由懒加载的历史视图按需翻页。
+
+    Returns:
+        tuple: (文件头里的设置 dict, 导入的消息条数)
+    """
+    settings, batches = read_export(fileobj, batch_size)
+    count = 0
+    for batch in batches:
+        count += store.append_many(session_id, batch)
+    return settings, count
+
+
+def export_filename(compression: str, now: Optional[float] = None) -> str:
+    stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(now))
+    return f"echosoul-{stamp}{FILE_SUFFIXES[compression]}"
@@ -0,0 +1,733 @@
+# gen_service.py
+# 异步生成服务：在后台事件循环上用 AsyncOpenAI 跑流式请求，
+# Streamlit 脚本线程只负责从缓冲区里取 token 渲染
+
+import asyncio
+import hashlib
+import json
+import socket
+import statistics
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Callable, Iterator, Optional
+from urllib.parse import urlsplit
+
+import streamlit as st
+
+from admission import (DEFAULT_MAX_ATTEMPTS, DEFAULT_RPM, DEFAULT_TPM, RateLimiter, SharedRateLimiter,
+                       backoff_delay)
+from api_client import create_async_client
+from context_window import estimate_tokens
+from router import DEFAULT_HEDGE_AFTER, Provider, ProviderRouter
+from shared_state import StateBackend
+from token_ledger import TokenLedger, usage_from_chunk
+
+DEFAULT_MAX_CONCURRENCY = 32      # 全局同时进行的生成数
+DEFAULT_MAX_PER_USER = 1          # 单个会话同时进行的生成数（保证会话间公平）
+TTFT_SAMPLES = 1000               # 保留最近多少个首 token 延迟样本
+DEFAULT_PREWARM_TTL = 120.0       # 一次预热租约最长保持多久（秒），页面被丢下不管时到期自动停止
+DEFAULT_PREWARM_INTERVAL = 15.0   # 连接空闲多久（秒）发一次保活请求，应小于服务端的空闲断开时间
+
+
+def is_retryable(error: Exception) -> bool:
+    """限流、服务端错误和网络错误值得重试；参数错误、鉴权失败之类的不重试。"""
+    import openai
+
+    if isinstance(error, (openai.RateLimitError, openai.InternalServerError, openai.APIConnectionError)):
+        return True
+    return isinstance(error, openai.APIStatusError) and error.status_code >= 500
+
+
+def request_key(user_id: str, params: dict) -> tuple:
+    """同一会话内完全相同的请求（参数逐字节相同）视为重复提交。"""
+    digest = hashlib.sha1(
+        json.dumps(params, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8")
+    ).hexdigest()
+    return user_id, digest
+
+
+class _Job:
+    """
+    一次生成：后台写入 token，任意多个订阅者各自按偏移量读取
+
+    text_filter（如 StreamFilter）在后台线程上逐段过滤，tokens 里存的就是可以显示的文本；
+    on_done 在生成正常结束（或出错但已有内容）时以完整文本调用一次，返回值存进 result。
+    """
+
+    def __init__(self, key: tuple, user_id: str, params: dict, text_filter=None,
+                 on_done: Optional[Callable[[str], object]] = None):
+        self.key = key
+        self.user_id = user_id
+        self.params = params
+        self.text_filter = text_filter
+        self.on_done = on_done
+        self.result = None
+        self.usage = None             # 这次生成的 token 用量（见 _stream），没有发出请求时为 None
+        self.received = False         # 是否收到过服务商的 token（过滤器可能还扣着没放出来）
+        self.tokens = []
+        self.started = False
+        self.done = False
+        self.error = None
+        self.cancelled = False
+        self.refs = 0
+        self.future = None
+        self._cond = threading.Condition()
+
+    def put(self, text: str) -> None:
+        with self._cond:
+            self.tokens.append(text)
+            self._cond.notify_all()
+
+    def mark_started(self) -> None:
+        with self._cond:
+            self.started = True
+            self._cond.notify_all()
+
+    def finish(self, error: Optional[Exception] = None, cancelled: bool = False) -> None:
+        with self._cond:
+            self.done = True
+            self.error = error
+            self.cancelled = cancelled
+            self._cond.notify_all()
+
+    def wait_started(self, timeout: float) -> bool:
+        with self._cond:
+            self._cond.wait_for(lambda: self.started or self.done, timeout)
+            return self.started or self.done
+
+    def snapshot(self) -> tuple:
+        """(目前为止的文本, 对应的 token 偏移量)，配合 iter_from 从断点继续读。"""
+        with self._cond:
+            return "".join(self.tokens), len(self.tokens)
+
+    def iter_from(self, offset: int) -> Iterator[str]:
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: offset < len(self.tokens) or self.done)
+                batch = self.tokens[offset:]
+                finished = self.done
+                error = self.error
+            offset += len(batch)
+            yield from batch
+            if finished and offset >= len(self.tokens):
+                if error is not None:
+                    raise error
+                return
+
+    def acquire(self) -> None:
+        with self._cond:
+            self.refs += 1
+
+    def release(self) -> None:
+        """最后一个订阅者离开时取消生成，后台会关闭对应的 HTTP 响应。"""
+        with self._cond:
+            self.refs -= 1
+            last = self.refs == 0
+        if last and self.future is not None:
+            self.future.cancel()
+
+
+class GenerationHandle:
+    """
+    一次生成请求的订阅句柄：在脚本线程里迭代拿 token，出错时在迭代处抛出
+
+    用法：
+        handle = service.submit(session_id, model=MODEL, messages=api_messages)
+        for text in handle:
+            renderer.write(text)
+        handle.cancel()
+    """
+
+    def __init__(self, service: "GenerationService", job: _Job):
+        self._service = service
+        self._job = job
+        self._released = False
+        job.acquire()
+
+    def __iter__(self) -> Iterator[str]:
+        return self._job.iter_from(0)
+
+    def iter_from(self, offset: int) -> Iterator[str]:
+        return self._job.iter_from(offset)
+
+    def snapshot(self) -> tuple:
+        return self._job.snapshot()
+
+    @property
+    def done(self) -> bool:
+        return self._job.done
+
+    @property
+    def result(self):
+        """on_done 的返回值（比如已经写入历史的那条消息）；还没结束或没有回调时为 None。"""
+        return self._job.result
+
+    @property
+    def usage(self) -> Optional[dict]:
+        """token 用量（prompt / cached / completion，见 token_ledger）；请求结束后才有。"""
+        return self._job.usage
+
+    @property
+    def completed(self) -> bool:
+        """是否完整生成完：已结束、没有出错也没有被取消（被字数上限截断仍算完整）。"""
+        return self._job.done and self._job.error is None and not self._job.cancelled
+
+    @property
+    def truncated(self) -> bool:
+        """回复是否被过滤器（字数上限）提前截断。"""
+        return bool(self._job.text_filter is not None and self._job.text_filter.stopped)
+
+    @property
+    def started(self) -> bool:
+        """是否已经通过排队和限流、真正发出了请求。"""
+        return self._job.started
+
+    def wait_started(self, timeout: float) -> bool:
+        return self._job.wait_started(timeout)
+
+    def position(self) -> int:
+        """排队位置：前面还有多少个请求在等（0 表示已经轮到或已经开始）。"""
+        return self._service.queue_position(self._job)
+
+    def cancel(self) -> None:
+        """不再需要这次生成；同一请求的其他订阅者还在的话生成会继续。"""
+        if not self._released:
+            self._released = True
+            self._job.release()
+
+
+class PrewarmLease:
+    """
+    一次连接预热的租约（见 GenerationService.prewarm）
+
+    持有期间后台会让到首选节点的连接保持可用；真正提交请求、会话被清空或页面被丢下时调用 cancel，
+    没人 cancel 也会在 ttl 秒后自动失效。
+    """
+
+    def __init__(self, service: "GenerationService", lease_id: int, expires_at: float):
+        self._service = service
+        self.lease_id = lease_id
+        self.expires_at = expires_at
+
+    @property
+    def active(self) -> bool:
+        return self._service.lease_active(self.lease_id)
+
+    def cancel(self) -> None:
+        self._service.release_prewarm(self.lease_id)
+
+
+class ServiceStats:
+    """生成服务的统计：并发数、峰值并发、首 token 延迟（含排队时间）、去重和重试次数。"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.submitted = 0
+        self.deduplicated = 0
+        self.retries = 0
+        self.hedges = 0
+        self.failovers = 0
+        self.prewarms = 0
+        self.ledger_errors = 0
+        self.completed = 0
+        self.failed = 0
+        self.active = 0
+        self.peak_active = 0
+        self._ttft = deque(maxlen=TTFT_SAMPLES)
+
+    def incr(self, name: str) -> None:
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def started(self) -> None:
+        with self._lock:
+            self.active += 1
+            self.peak_active = max(self.peak_active, self.active)
+
+    def finished(self, ok: bool) -> None:
+        with self._lock:
+            self.active -= 1
+            if ok:
+                self.completed += 1
+            else:
+                self.failed += 1
+
+    def first_token(self, seconds: float) -> None:
+        with self._lock:
+            self._ttft.append(seconds)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            samples = sorted(self._ttft)
+            data = {
+                "submitted": self.submitted,
+                "deduplicated": self.deduplicated,
+                "retries": self.retries,
+                "hedges": self.hedges,
+                "failovers": self.failovers,
+                "prewarms": self.prewarms,
+                "ledger_errors": self.ledger_errors,
+                "completed": self.completed,
+                "failed": self.failed,
+                "active": self.active,
+                "peak_active": self.peak_active,
+            }
+        if len(samples) >= 2:
+            cuts = statistics.quantiles(samples, n=100, method="inclusive")
+            data["ttft_p50"] = cuts[49]
+            data["ttft_p99"] = cuts[98]
+        elif samples:
+            data["ttft_p50"] = data["ttft_p99"] = samples[0]
+        return data
+
+
+class GenerationService:
+    """
+    后台事件循环 + AsyncOpenAI 的生成服务
+
+    - 路由：每次请求交给 ProviderRouter 排名第一的节点，出错立即换下一个，
+      超过 hedge_after 还没首 token 就向下一个节点对冲，先出字的留下、其余取消
+    - 去重：同一会话里参数完全相同、仍在进行中的请求直接共享同一次生成
+    - 会话公平：每个会话最多 max_per_user 个生成同时进行，多出的在自己的队里等
+    - 限流：RPM / TPM 令牌桶按服务商配额放行（按 prompt + max_tokens 预扣，结束后退回多扣的）
+    - 全局并发上限：asyncio.Semaphore(max_concurrency)，按提交顺序放行
+    - 重试：限流 / 5xx / 网络错误且还没吐出 token 时，按 Retry-After 或带抖动的指数退避重试
+    """
+
+    def __init__(self, router: ProviderRouter, max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+                 max_per_user: int = DEFAULT_MAX_PER_USER, rpm: float = DEFAULT_RPM,
+                 tpm: float = DEFAULT_TPM, max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+                 state_backend: Optional[StateBackend] = None,
+                 prewarm_interval: float = DEFAULT_PREWARM_INTERVAL,
+                 ledger: Optional[TokenLedger] = None):
+        self.router = router
+        self.ledger = ledger
+        self.max_per_user = max_per_user
+        self.max_attempts = max_attempts
+        self.prewarm_interval = prewarm_interval
+        self.stats = ServiceStats()
+        # 配了共享状态后端时，多个 worker 进程共用同一份 RPM / TPM 配额
+        if state_backend is not None:
+            self._limiter = SharedRateLimiter(state_backend, rpm, tpm)
+        else:
+            self._limiter = RateLimiter(rpm, tpm)
+        self._global = asyncio.Semaphore(max_concurrency)
+        self._user_slots = {}         # user_id -> [Semaphore, 引用计数]，只在事件循环线程里访问
+        self._lock = threading.Lock()
+        self._in_flight = {}          # request_key -> _Job
+        self._waiting = OrderedDict()  # 还没开始的 _Job，按提交顺序
+        self._leases = {}             # 预热租约 id -> 到期时间（monotonic）
+        self._next_lease = 0
+        self._prewarm_task = None     # 保活任务，只在事件循环线程里访问
+        self._last_used = time.monotonic()  # 最近一次请求结束 / 保活的时间
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="echosoul-generation",
+                                        daemon=True)
+        self._thread.start()
+
+    def submit(self, user_id: str, text_filter=None, on_done: Optional[Callable[[str], object]] = None,
+               **params) -> GenerationHandle:
+        """
+        提交一次流式生成
+
+        生成在后台跑完为止，不依赖脚本是否还在读：rerun / 断线重连后用同一个句柄从断点接着读，
+        回复结束时由 on_done 负责落库，前台没读完也不会丢。
+
+        Args:
+            user_id: 会话标识，用于去重和会话间公平调度
+            text_filter: 可选的流式过滤器（feed / flush / stopped），stopped 后提前结束生成
+            on_done: 可选，结束时在后台线程上以完整回复文本调用（被取消时不调用）
+            **params: 透传给 chat.completions.create 的参数（model、messages 等）
+
+        Returns:
+            GenerationHandle: 可迭代的 token 句柄
+        """
+        self.stats.incr("submitted")
+        key = request_key(user_id, params)
+        with self._lock:
+            job = self._in_flight.get(key)
+            if job is not None and not job.future.cancelled():
+                self.stats.incr("deduplicated")
+                return GenerationHandle(self, job)
+            job = self._in_flight[key] = _Job(key, user_id, params, text_filter, on_done)
+            self._waiting[job] = None
+            handle = GenerationHandle(self, job)
+            job.future = asyncio.run_coroutine_threadsafe(self._generate(job), self._loop)
+        # 在锁外注册：future 已经结束时回调会在当前线程里立即执行，回调里还要拿锁
+        job.future.add_done_callback(lambda future: self._on_job_done(job, future))
+        return handle
+
+    def queue_position(self, job: _Job) -> int:
+        with self._lock:
+            for position, waiting in enumerate(self._waiting):
+                if waiting is job:
+                    return position
+        return 0
+
+    def _acquire_user_slot(self, user_id: str) -> asyncio.Semaphore:
+        entry = self._user_slots.get(user_id)
+        if entry is None:
+            entry = self._user_slots[user_id] = [asyncio.Semaphore(self.max_per_user), 0]
+        entry[1] += 1
+        return entry[0]
+
+    def _release_user_slot(self, user_id: str) -> None:
+        entry = self._user_slots[user_id]
+        entry[1] -= 1
+        if entry[1] == 0:
+            del self._user_slots[user_id]
+
+    def _dequeue(self, job: _Job) -> None:
+        with self._lock:
+            self._waiting.pop(job, None)
+
+    def _forget(self, job: _Job) -> None:
+        with self._lock:
+            if self._in_flight.get(job.key) is job:
+                del self._in_flight[job.key]
+            self._waiting.pop(job, None)
+
+    def _on_job_done(self, job: _Job, future) -> None:
+        """兜底收尾：任务还没开始跑就被取消时，_generate 的 finally 不会执行。"""
+        self._forget(job)
+        if not job.done:
+            job.finish(cancelled=True)
+
+    async def _generate(self, job: _Job) -> None:
+        submitted_at = time.perf_counter()
+        params = job.params
+        max_tokens = int(params.get("max_tokens") or 0)
+        charge = sum(estimate_tokens(m.get("content") or "") for m in params.get("messages", ())) + max_tokens
+        user_slot = self._acquire_user_slot(job.user_id)
+        ok = False
+        started = False
+        cancelled = False
+        charged = False
+        error = None
+        try:
+            async with user_slot:
+                for attempt in range(self.max_attempts):
+                    await self._limiter.acquire(charge)
+                    charged = True
+                    try:
+                        async with self._global:
+                            if not started:
+                                started = True
+                                self._dequeue(job)
+                                self.stats.started()
+                                job.mark_started()
+                            await self._stream(job, submitted_at)
+                        break
+                    except Exception as e:
+                        if job.received or attempt == self.max_attempts - 1 or not is_retryable(e):
+                            raise
+                        # 失败的这次没有产出，预扣的令牌全部退回再重试，重试不会越扣越多
+                        self._limiter.refund(charge)
+                        charged = False
+                        self.stats.incr("retries")
+                        await asyncio.sleep(backoff_delay(attempt, e))
+            ok = True
+        except asyncio.CancelledError:
+            cancelled = True
+            raise
+        except Exception as e:
+            error = e
+        finally:
+            # 不管成功、出错还是被取消，按 max_tokens 预扣而没有用掉的令牌都退回
+            if charged:
+                produced = sum(estimate_tokens(text) for text in job.tokens)
+                self._limiter.refund(max_tokens - produced)
+            self._forget(job)
+            # 用量记账放到线程池里，不占用事件循环
+            if self.ledger is not None and job.usage is not None:
+                self._loop.run_in_executor(None, self._record_usage, job)
+            # 先落库再标记结束，订阅者看到 done 时 result 已经就绪；
+            # 落库（SQLite 写入 + 共享状态更新）同样放到线程池里，不卡住其他会话的流
+            if job.on_done is not None and job.tokens and not cancelled:
+                try:
+                    job.result = await self._loop.run_in_executor(None, job.on_done, "".join(job.tokens))
+                except asyncio.CancelledError:
+                    cancelled = True  # 落库已在线程池里进行，只是不再等它的返回值
+                except Exception as e:
+                    error = error or e
+            job.finish(error, cancelled)
+            if started:
+                self.stats.finished(ok)
+                self._last_used = time.monotonic()
+            self._release_user_slot(job.user_id)
+
+    def prewarm(self, ttl: float = DEFAULT_PREWARM_TTL) -> PrewarmLease:
+        """
+        用户可能正在输入下一条消息时调用：租约有效期间，只要连接空闲超过 prewarm_interval，
+        后台就向排名第一的节点发一个 GET /models，让连接池里始终有一条热连接，
+        提交时不用重新建连 / 握手
+
+        整个进程只有一个保活任务，同时有多少个租约都只按一份节奏发请求；
+        最后一个租约取消或到期后任务立即停止（正在进行的保活请求也一并取消）。
+        """
+        with self._lock:
+            self._next_lease += 1
+            lease = PrewarmLease(self, self._next_lease, time.monotonic() + ttl)
+            self._leases[lease.lease_id] = lease.expires_at
+        self._loop.call_soon_threadsafe(self._start_prewarm)
+        return lease
+
+    def lease_active(self, lease_id: int) -> bool:
+        with self._lock:
+            expires_at = self._leases.get(lease_id)
+        return expires_at is not None and expires_at > time.monotonic()
+
+    def release_prewarm(self, lease_id: int) -> None:
+        with self._lock:
+            self._leases.pop(lease_id, None)
+            idle = not self._leases
+        if idle:
+            self._loop.call_soon_threadsafe(self._stop_prewarm)
+
+    def _start_prewarm(self) -> None:
+        if self._prewarm_task is None or self._prewarm_task.done():
+            self._prewarm_task = self._loop.create_task(self._keep_warm())
+
+    def _stop_prewarm(self) -> None:
+        with self._lock:
+            if self._leases:
+                return
+        if self._prewarm_task is not None:
+            self._prewarm_task.cancel()
+            self._prewarm_task = None
+
+    async def _keep_warm(self) -> None:
+        while True:
+            now = time.monotonic()
+            with self._lock:
+                for lease_id in [i for i, expires_at in self._leases.items() if expires_at <= now]:
+                    del self._leases[lease_id]
+                if not self._leases:
+                    return
+            wait = self.prewarm_interval - (now - self._last_used)
+            if wait <= 0 and not self.stats.active:
+                try:
+                    await self.router.ranked()[0].client.models.list()
+                    self.stats.incr("prewarms")
+                except Exception:
+                    pass
+                self._last_used = time.monotonic()
+                wait = self.prewarm_interval
+            # 有请求正在进行时连接本来就是热的，等它结束后再算空闲时间
+            await asyncio.sleep(wait if wait > 0 else self.prewarm_interval)
+
+    def _record_usage(self, job: _Job) -> None:
+        try:
+            self.ledger.record(job.user_id, job.usage)
+        except Exception:
+            self.stats.incr("ledger_errors")
+
+    def warm_up(self, timeout: float = 10.0) -> bool:
+        """
+        预热：在后台事件循环上向每个节点发一个轻量的 GET /models，
+        提前完成 DNS 解析、TCP 建连和 TLS 握手，把长连接留在连接池里。
+        """
+        async def _ping():
+            results = await asyncio.gather(*(p.client.models.list() for p in self.router.providers),
+                                           return_exceptions=True)
+            return not any(isinstance(r, Exception) for r in results)
+
+        try:
+            return asyncio.run_coroutine_threadsafe(_ping(), self._loop).result(timeout)
+        except Exception:
+            return False
+
+    async def _open(self, provider: Provider, params: dict) -> tuple:
+        """向一个节点发出流式请求，等到第一个有内容的 chunk；返回 (stream, 迭代器, 首段文本, 耗时)。"""
+        started_at = time.perf_counter()
+        # include_usage：最后多发一个只带 usage 的 chunk，用于 token 记账
+        stream = await provider.client.chat.completions.create(
+            stream=True, stream_options={"include_usage": True}, **provider.params_for(params)
+        )
+        chunks = stream.__aiter__()
+        try:
+            while True:
+                try:
+                    chunk = await chunks.__anext__()
+                except StopAsyncIteration:
+                    return stream, chunks, "", time.perf_counter() - started_at
+                if chunk.choices and chunk.choices[0].delta.content:
+                    return stream, chunks, chunk.choices[0].delta.content, time.perf_counter() - started_at
+        except BaseException:
+            await stream.close()
+            raise
+
+    async def _race(self, params: dict) -> tuple:
+        """
+        按路由排名发请求，返回最先出首 token 的 (provider, stream, 迭代器, 首段文本)
+
+        节点出错就马上换下一个（failover），等首 token 超过 hedge_after 就再向下一个节点
+        并行发一份（hedge）；分出胜负后取消其余请求。所有节点都失败时抛出最后一个错误。
+        """
+        router = self.router
+        candidates = iter(router.ranked())
+        pending = {}
+        launched_at = {}
+        winner = None
+        error = None
+
+        def launch() -> bool:
+            provider = next(candidates, None)
+            if provider is None:
+                return False
+            task = asyncio.ensure_future(self._open(provider, params))
+            pending[task] = provider
+            launched_at[task] = time.perf_counter()
+            return True
+
+        launch()
+        try:
+            while pending and winner is None:
+                timeout = router.hedge_after or None
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    if launch():
+                        self.stats.incr("hedges")
+                    continue
+                for task in done:
+                    provider = pending.pop(task)
+                    if task.exception() is None and winner is None:
+                        winner = provider, task.result()
+                    elif task.exception() is None:
+                        # 同一时刻到达的另一个胜者，关掉它的流
+                        await task.result()[0].close()
+                    else:
+                        error = task.exception()
+                        router.record_error(provider)
+                        if winner is None and not pending and launch():
+                            self.stats.incr("failovers")
+        finally:
+            for task, provider in pending.items():
+                task.cancel()
+                router.record_abandoned(provider, time.perf_counter() - launched_at[task])
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+        if winner is None:
+            raise error
+        provider, (stream, chunks, text, ttft) = winner
+        router.record_success(provider, ttft)
+        return provider, stream, chunks, text
+
+    def _emit(self, job: _Job, text: str, submitted_at: float) -> bool:
+        """把一段原始输出过滤后写入缓冲区，返回是否应当提前结束。"""
+        if not job.received:
+            job.received = True
+            self.stats.first_token(time.perf_counter() - submitted_at)
+        text_filter = job.text_filter
+        if text_filter is None:
+            job.put(text)
+            return False
+        text = text_filter.feed(text)
+        if text:
+            job.put(text)
+        return text_filter.stopped
+
+    @staticmethod
+    def _usage(job: _Job, provider: Provider, usage, received: list) -> dict:
+        """服务商返回的用量；提前截断 / 中途出错拿不到 usage 时按文本估算（estimated=True）。"""
+        if usage is not None:
+            data = usage_from_chunk(usage)
+        else:
+            data = {
+                "prompt_tokens": sum(estimate_tokens(m.get("content") or "")
+                                     for m in job.params.get("messages", ())),
+                "cached_tokens": 0,
+                "completion_tokens": estimate_tokens("".join(received)),
+                "estimated": True,
+            }
+        data["model"] = provider.params_for(job.params).get("model") or ""
+        data["provider"] = provider.name
+        return data
+
+    async def _stream(self, job: _Job, submitted_at: float) -> None:
+        provider, stream, chunks, text = await self._race(job.params)
+        received = [text]
+        usage = None
+        try:
+            stopped = bool(text) and self._emit(job, text, submitted_at)
+            if not stopped:
+                async for chunk in chunks:
+                    if chunk.usage is not None:
+                        usage = chunk.usage
+                    if not chunk.choices:
+                        continue
+                    text = chunk.choices[0].delta.content
+                    if text:
+                        received.append(text)
+                        if self._emit(job, text, submitted_at):
+                            # 过滤器要求截断：不再读后面的内容，关闭响应后服务商也会停止生成
+                            break
+        finally:
+            await stream.close()
+            job.usage = self._usage(job, provider, usage, received)
+        if job.text_filter is not None:
+            tail = job.text_filter.flush()
+            if tail:
+                job.put(tail)
+
+@st.cache_resource(show_spinner=False)
+def get_generation_service(providers: tuple,
+                           max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+                           max_per_user: int = DEFAULT_MAX_PER_USER,
+                           rpm: float = DEFAULT_RPM, tpm: float = DEFAULT_TPM,
+                           timeout: Optional[float] = None,
+                           max_retries: Optional[int] = None,
+                           max_connections: Optional[int] = None,
+                           max_keepalive: Optional[int] = None,
+                           hedge_after: float = DEFAULT_HEDGE_AFTER,
+                           prewarm_interval: float = DEFAULT_PREWARM_INTERVAL,
+                           _state_backend: Optional[StateBackend] = None,
+                           _ledger: Optional[TokenLedger] = None) -> GenerationService:
+    """
+    进程内共享的生成服务，同一组参数只启动一个后台事件循环
+
+    Args:
+        providers: ((name, api_key, base_url, model), ...)，按配置顺序排列的 OpenAI 兼容节点
+        max_retries: 出错后最多重试几次（不含首次），默认 DEFAULT_MAX_ATTEMPTS - 1
+        max_connections: 每个节点的连接池上限，默认等于 max_concurrency
+        max_keepalive: 每个节点保持长连接的空闲连接数，默认等于连接池上限
+            （比并发数小的话，高峰时多出来的连接用完就关，下一次又要重新握手）
+        _state_backend: 可选的共享状态后端，用于跨进程限流（下划线开头，不参与缓存键）
+        _ledger: 可选的 token 账本，每次生成结束后记一笔用量
+    """
+    client_kwargs = {} if timeout is None else {"timeout": float(timeout)}
+    max_connections = max_concurrency if max_connections is None else int(max_connections)
+    max_keepalive = max_connections if max_keepalive is None else int(max_keepalive)
+    max_attempts = DEFAULT_MAX_ATTEMPTS if max_retries is None else int(max_retries) + 1
+    # 重试由服务自己按 Retry-After / 退避处理，SDK 层不再重试，避免重试次数相乘
+    router = ProviderRouter([
+        Provider(name, create_async_client(api_key, base_url, max_retries=0, max_connections=max_connections,
+                                           max_keepalive=max_keepalive, **client_kwargs), model)
+        for name, api_key, base_url, model in providers
+    ], hedge_after=hedge_after)
+    return GenerationService(router, max_concurrency=max_concurrency, max_per_user=max_per_user,
+                             rpm=rpm, tpm=tpm, max_attempts=max_attempts, state_backend=_state_backend,
+                             prewarm_interval=prewarm_interval, ledger=_ledger)
+
+
+@st.cache_resource(show_spinner=False)
+def start_warm_up(providers: tuple, _state_backend: Optional[StateBackend] = None,
+                  _ledger: Optional[TokenLedger] = None, **service_options) -> threading.Thread:
+    """
+    进程启动后第一次打开页面时，在后台线程里预热（每个进程只做一次，不阻塞页面渲染）：
+    DNS 解析 → 导入 openai SDK 并创建生成服务 → 建好到各个服务商的长连接。
+    """
+    def _run():
+        for _, _, base_url, _ in providers:
+            parts = urlsplit(base_url)
+            try:
+                socket.getaddrinfo(parts.hostname, parts.port or (443 if parts.scheme == "https" else 80))
+            except OSError:
+                pass
+        get_generation_service(providers, _state_backend=_state_backend, _ledger=_ledger,
+                               **service_options).warm_up()
+
+    thread = threading.Thread(target=_run, name="echosoul-warm-up", daemon=True)
+    thread.start()
+    return thread
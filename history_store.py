@@ -0,0 +1,199 @@
+# history_store.py
+# 对话持久化：SQLite（WAL 模式）只追加写入，按页懒加载历史
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+import streamlit as st
+
+from messages import Message
+from shared_state import RedisClient
+
+DEFAULT_DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "echosoul_history.db")
+DEFAULT_PAGE_SIZE = 30            # 打开页面时加载的最近消息条数 / 每次「加载更早」的条数
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id          INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id  TEXT    NOT NULL,
+    role        TEXT    NOT NULL,
+    content     TEXT    NOT NULL,
+    created_at  REAL    NOT NULL,
+    archived    INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_messages_session ON messages (session_id, archived, id);
+"""
+
+
+class HistoryStore:
+    """
+    对话历史存储
+
+    - 每条消息一次 INSERT，不重写整段历史
+    - 读取只按 (session_id, id) 索引取一页，内存占用和历史总长度无关
+    - 「清空记忆」只把消息标记为已归档，不真正删除
+    """
+
+    def __init__(self, path: str = DEFAULT_DB_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._conn().executescript(_SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        """每个线程一个连接（sqlite3 连接不能跨线程共享）。"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def append(self, session_id: str, message: Message) -> int:
+        """追加一条消息，把数据库分配的 id 写回 message.id 并返回。"""
+        cur = self._conn().execute(
+            "INSERT INTO messages (session_id, role, content, created_at) VALUES (?, ?, ?, ?)",
+            (session_id, message.role, message.content, message.created_at),
+        )
+        message.id = cur.lastrowid
+        return message.id
+
+    def append_many(self, session_id: str, messages: list) -> int:
+        """在一个事务里批量追加（导入用），id 同样写回每条消息；返回条数。"""
+        conn = self._conn()
+        conn.execute("BEGIN")
+        try:
+            for message in messages:
+                message.id = conn.execute(
+                    "INSERT INTO messages (session_id, role, content, created_at) VALUES (?, ?, ?, ?)",
+                    (session_id, message.role, message.content, message.created_at),
+                ).lastrowid
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return len(messages)
+
+    def iter_messages(self, session_id: str, batch_size: int = 500):
+        """按时间正序逐批取出全部未归档消息（导出用），每次只在内存里放一批。"""
+        after_id = 0
+        while True:
+            rows = self._conn().execute(
+                "SELECT id, role, content, created_at FROM messages "
+                "WHERE session_id = ? AND archived = 0 AND id > ? ORDER BY id LIMIT ?",
+                (session_id, after_id, batch_size),
+            ).fetchall()
+            if not rows:
+                return
+            yield [Message.from_row(row) for row in rows]
+            after_id = rows[-1][0]
+
+    def load_recent(self, session_id: str, limit: int = DEFAULT_PAGE_SIZE) -> list:
+        """最近 limit 条未归档消息（按时间正序）。"""
+        return self.load_before(session_id, None, limit)
+
+    def load_before(self, session_id: str, before_id: Optional[int],
+                    limit: int = DEFAULT_PAGE_SIZE) -> list:
+        """id 小于 before_id 的前一页消息（按时间正序）；before_id 为 None 表示从最新开始。"""
+        sql = "SELECT id, role, content, created_at FROM messages WHERE session_id = ? AND archived = 0"
+        params = [session_id]
+        if before_id is not None:
+            sql += " AND id < ?"
+            params.append(before_id)
+        sql += " ORDER BY id DESC LIMIT ?"
+        params.append(limit)
+        rows = self._conn().execute(sql, params).fetchall()
+        return [Message.from_row(row) for row in reversed(rows)]
+
+    def has_before(self, session_id: str, before_id: int) -> bool:
+        """是否还有更早的未归档消息。"""
+        row = self._conn().execute(
+            "SELECT 1 FROM messages WHERE session_id = ? AND archived = 0 AND id < ? LIMIT 1",
+            (session_id, before_id),
+        ).fetchone()
+        return row is not None
+
+    def archive(self, session_id: str) -> int:
+        """归档该会话当前的全部消息，返回归档条数。"""
+        cur = self._conn().execute(
+            "UPDATE messages SET archived = 1 WHERE session_id = ? AND archived = 0",
+            (session_id,),
+        )
+        return cur.rowcount
+
+
+class RedisHistoryStore:
+    """
+    Redis 协议后端的对话历史（多机部署时用），接口和 HistoryStore 相同
+
+    每个会话一个列表，元素是 [role, content, created_at]；消息 id 就是它在列表里的位置（从 1 开始），
+    RPUSH 的返回值保证多个进程并发追加时 id 也不会重复。归档是把列表改名，不删除。
+    """
+
+    def __init__(self, url: str, prefix: str = "echosoul:history:"):
+        self.client = RedisClient(url)
+        self.prefix = prefix
+
+    def append(self, session_id: str, message: Message) -> int:
+        message.id = self.client.command(
+            "RPUSH", self.prefix + session_id,
+            json.dumps([message.role, message.content, message.created_at], ensure_ascii=False),
+        )
+        return message.id
+
+    def append_many(self, session_id: str, messages: list) -> int:
+        if not messages:
+            return 0
+        end = self.client.command("RPUSH", self.prefix + session_id, *(
+            json.dumps([m.role, m.content, m.created_at], ensure_ascii=False) for m in messages
+        ))
+        for i, message in enumerate(messages, start=end - len(messages) + 1):
+            message.id = i
+        return len(messages)
+
+    def iter_messages(self, session_id: str, batch_size: int = 500):
+        key = self.prefix + session_id
+        start = 0
+        while True:
+            rows = self.client.command("LRANGE", key, start, start + batch_size - 1)
+            if not rows:
+                return
+            yield [Message(role, content, start + i + 1, created_at)
+                   for i, (role, content, created_at) in enumerate(map(json.loads, rows))]
+            start += len(rows)
+
+    def load_recent(self, session_id: str, limit: int = DEFAULT_PAGE_SIZE) -> list:
+        return self.load_before(session_id, None, limit)
+
+    def load_before(self, session_id: str, before_id: Optional[int],
+                    limit: int = DEFAULT_PAGE_SIZE) -> list:
+        key = self.prefix + session_id
+        end = self.client.command("LLEN", key) if before_id is None else before_id - 1
+        start = max(end - limit, 0)
+        if end <= start:
+            return []
+        rows = self.client.command("LRANGE", key, start, end - 1)
+        return [Message(role, content, start + i + 1, created_at)
+                for i, (role, content, created_at) in enumerate(map(json.loads, rows))]
+
+    def has_before(self, session_id: str, before_id: int) -> bool:
+        return before_id > 1
+
+    def archive(self, session_id: str) -> int:
+        key = self.prefix + session_id
+        count = self.client.command("LLEN", key)
+        if count:
+            self.client.command("RENAME", key, f"{key}:archived:{time.time_ns()}")
+        return count
+
+
+@st.cache_resource(show_spinner=False)
+def get_history_store(path: str = DEFAULT_DB_PATH, backend_url: str = ""):
+    """进程内共享的历史存储；backend_url 是 redis:// 地址时改用 Redis 协议后端。"""
+    if backend_url.startswith("redis://"):
+        return RedisHistoryStore(backend_url)
+    return HistoryStore(path)
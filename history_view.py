@@ -0,0 +1,57 @@
+# history_view.py
+# 历史消息的窗口化渲染：每次 rerun 只渲染最近一段，更早的消息点「加载更早」再展开
+
+import streamlit as st
+
+from history_store import DEFAULT_PAGE_SIZE, HistoryStore
+
+DEFAULT_WINDOW = 20               # 默认渲染的最近消息条数
+
+
+def _visible_messages(window: int) -> tuple:
+    """返回 (要渲染的消息, 内存里还没渲染的更早消息条数)。"""
+    earlier = st.session_state.earlier_messages
+    messages = st.session_state.messages
+    total = len(earlier) + len(messages)
+    if window >= total:
+        return earlier + messages[:], 0
+    if window <= len(messages):
+        return messages[len(messages) - window:], total - window
+    return earlier[total - window:] + messages[:], total - window
+
+
+@st.fragment
+def render_history(store: HistoryStore, session_id: str, window: int = DEFAULT_WINDOW,
+                   page_size: int = DEFAULT_PAGE_SIZE) -> None:
+    """
+    渲染历史消息
+
+    - 只渲染最近 history_window 条，rerun 开销与对话总长度无关
+    - 「加载更早」先展开内存里已有的消息，不够再从数据库翻一页
+    - 作为 fragment 运行，点「加载更早」只重跑这一块，不会重建整页
+    """
+    if "history_window" not in st.session_state:
+        st.session_state.history_window = window
+    shown = st.session_state.history_window
+    visible, hidden = _visible_messages(shown)
+
+    first_id = visible[0].id if visible else None
+    if hidden or (first_id is not None and store.has_before(session_id, first_id)):
+        if st.button("⬆️ 加载更早的消息", key="load_earlier_button"):
+            if not hidden:
+                # 内存里的都展示完了，再从数据库取一页（只用于展示，不会发给模型）
+                st.session_state.earlier_messages = store.load_before(
+                    session_id, first_id, page_size
+                ) + st.session_state.earlier_messages
+            st.session_state.history_window = shown + page_size
+            st.rerun(scope="fragment")
+
+    for message in visible:
+        with st.chat_message(message.role):
+            st.markdown(message.content)
+
+
+def reset_history_view() -> None:
+    """清空记忆时调用，窗口回到默认大小。"""
+    st.session_state.earlier_messages = []
+    st.session_state.pop("history_window", None)
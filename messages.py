@@ -0,0 +1,104 @@
+# messages.py
+# 对话消息模型：带 __slots__ 的 Message 和只追加的 History，
+# 每条消息的 token 数和 API payload 只算一次，之后每轮直接复用
+
+import json
+import time
+from typing import Iterable, Iterator, Optional
+
+from context_window import MESSAGE_OVERHEAD, estimate_tokens
+
+
+class Message:
+    """
+    一条对话消息（创建后内容不再修改）
+
+    tokens 和 payload 第一次用到时才计算并缓存：token 数供上下文预算、埋点计数共用，
+    payload 是发给 API 的 {"role", "content"} 字典，每轮请求直接引用、不再复制。
+    """
+
+    __slots__ = ("id", "role", "content", "created_at", "_tokens", "_payload")
+
+    def __init__(self, role: str, content: str, id: Optional[int] = None,
+                 created_at: Optional[float] = None):
+        self.id = id
+        self.role = role
+        self.content = content
+        self.created_at = time.time() if created_at is None else created_at
+        self._tokens = None
+        self._payload = None
+
+    @property
+    def tokens(self) -> int:
+        """估算的 token 数（含每条消息的角色 / 分隔符开销）。"""
+        if self._tokens is None:
+            self._tokens = estimate_tokens(self.content) + MESSAGE_OVERHEAD
+        return self._tokens
+
+    @property
+    def payload(self) -> dict:
+        """发给 API 的消息字典；调用方不能修改它。"""
+        if self._payload is None:
+            self._payload = {"role": self.role, "content": self.content}
+        return self._payload
+
+    def to_row(self) -> tuple:
+        """序列化成 (id, role, content, created_at)，用于持久化。"""
+        return self.id, self.role, self.content, self.created_at
+
+    @classmethod
+    def from_row(cls, row) -> "Message":
+        message_id, role, content, created_at = row
+        return cls(role, content, message_id, created_at)
+
+    def __repr__(self) -> str:
+        return f"Message(id={self.id!r}, role={self.role!r}, content={self.content[:20]!r})"
+
+
+class History:
+    """
+    只追加的对话历史
+
+    除了 drop_front（丢掉已经折叠进摘要的最早几条）以外只能 append，
+    所以按下标记下的位置（比如摘要折叠到第几条）不会因为中间插入 / 删除而失效。
+    """
+
+    __slots__ = ("_items",)
+
+    def __init__(self, messages: Iterable[Message] = ()):
+        self._items = list(messages)
+
+    def append(self, message: Message) -> None:
+        self._items.append(message)
+
+    def drop_front(self, count: int) -> None:
+        del self._items[:count]
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __iter__(self) -> Iterator[Message]:
+        return iter(self._items)
+
+    def __getitem__(self, index):
+        return self._items[index]
+
+    def payloads(self, start: int = 0) -> list:
+        """从第 start 条开始的 API payload 列表（只新建外层列表，消息字典都是缓存的）。"""
+        items = self._items
+        return [items[i].payload for i in range(start, len(items))]
+
+    def tokens(self, start: int = 0) -> int:
+        items = self._items
+        return sum(items[i].tokens for i in range(start, len(items)))
+
+    def to_rows(self) -> list:
+        return [(m.id, m.role, m.content, m.created_at) for m in self._items]
+
+    def dumps(self) -> str:
+        """紧凑的 JSON 数组（每条消息一个 [id, role, content, created_at]）。"""
+        return json.dumps(self.to_rows(), ensure_ascii=False, separators=(",", ":"))
+
+    @classmethod
+    def loads(cls, data: str) -> "History":
+        return cls(Message.from_row(row) for row in json.loads(data))
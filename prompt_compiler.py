@@ -0,0 +1,180 @@
+# prompt_compiler.py
+# 提示词编译：把 prompts/ 下的源文件（base.md + sections.json）展开成「风格 × 字数上限」的全部静态部分，
+# 连同每个变体的 token 数和哈希写成一个带版本号的二进制产物，运行时用 mmap 加载（见 prompt_store.py）
+# 用法：python prompt_compiler.py [--source prompts] [--out prompts/compiled/prompts.bin]
+# 会打印每一段的 token 数，以及和上一次编译相比的增减，方便看出每次改提示词的 token 代价
+
+import argparse
+import hashlib
+import json
+import os
+import struct
+import tempfile
+import time
+from typing import Optional
+
+from context_window import estimate_tokens
+
+COMPILER_VERSION = 1              # 产物格式或展开规则变化时加一，旧产物自动视为过期
+MAGIC = b"ESPROMPT"
+HEADER = struct.Struct(">8sI")    # 魔数 + 索引 JSON 的字节数，之后是索引，再之后是各变体的 UTF-8 文本
+
+SOURCE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "prompts")
+DEFAULT_ARTIFACT_PATH = os.path.join(SOURCE_DIR, "compiled", "prompts.bin")
+SOURCE_FILES = ("base.md", "sections.json")
+
+
+def source_paths(source_dir: str = SOURCE_DIR) -> list:
+    return [os.path.join(source_dir, name) for name in SOURCE_FILES]
+
+
+def load_sources(source_dir: str = SOURCE_DIR) -> dict:
+    """读取源文件：base.md 是固定提示词（去掉文件末尾换行），sections.json 是风格和字数上限段落。"""
+    with open(os.path.join(source_dir, "base.md"), encoding="utf-8") as f:
+        base = f.read().rstrip("\n")
+    with open(os.path.join(source_dir, "sections.json"), encoding="utf-8") as f:
+        sections = json.load(f)
+    return {"base": base, **sections}
+
+
+def source_hash(source_dir: str = SOURCE_DIR) -> str:
+    digest = hashlib.sha256(str(COMPILER_VERSION).encode())
+    for path in source_paths(source_dir):
+        with open(path, "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def style_sections(sources: dict) -> dict:
+    """风格名 -> 追加在固定提示词后面的段落；"" 表示没有风格段（未知风格也用它）。"""
+    sections = {"": ""}
+    for style, text in sources["styles"].items():
+        sections[style] = f"\n\n{sources['style_heading']}\n{text}"
+    return sections
+
+
+def word_limit_template(sources: dict) -> str:
+    """字数上限段落的模板，{word_limit} 处填数字；上限为 0 时不加这一段。"""
+    return f"\n\n{sources['word_limit_heading']}\n{sources['word_limit']}"
+
+
+def variant_key(style: str, word_limit: int) -> str:
+    return f"{style}|{word_limit}"
+
+
+def section_report(sources: dict) -> list:
+    """
+    每一段的字数和 token 数
+
+    固定提示词按二级标题（## ）切段，标题之前的部分记为「（开头）」；
+    风格段和字数上限段各记一行。
+    """
+    rows = []
+    name, lines = "（开头）", []
+    for line in sources["base"].split("\n"):
+        if line.startswith("## "):
+            rows.append((name, "\n".join(lines)))
+            name, lines = line[3:].strip(), []
+        lines.append(line)
+    rows.append((name, "\n".join(lines)))
+    rows = [(f"base/{name}", text) for name, text in rows]
+    rows += [(f"style/{style}", text) for style, text in style_sections(sources).items() if style]
+    rows.append(("word_limit", word_limit_template(sources)))
+    return [{"section": name, "chars": len(text), "tokens": estimate_tokens(text)} for name, text in rows]
+
+
+def build_variants(sources: dict) -> dict:
+    """所有「风格 × 字数上限」组合的静态部分：固定提示词 + 风格段 + 字数上限段。"""
+    limit = word_limit_template(sources)
+    variants = {}
+    for style, style_text in style_sections(sources).items():
+        for word_limit in sources["word_limits"]:
+            limit_text = limit.format(word_limit=word_limit) if word_limit > 0 else ""
+            variants[variant_key(style, word_limit)] = sources["base"] + style_text + limit_text
+    return variants
+
+
+def compile_prompts(source_dir: str = SOURCE_DIR, out_path: str = DEFAULT_ARTIFACT_PATH) -> dict:
+    """
+    编译并写出产物（先写临时文件再原子替换，正在 mmap 旧文件的进程不受影响）
+
+    Returns:
+        dict: 产物的索引（version、各段 token 数、各变体的偏移 / 长度 / token 数 / 哈希）
+    """
+    sources = load_sources(source_dir)
+    digest = source_hash(source_dir)
+    blobs = []
+    entries = {}
+    offset = 0
+    for key, text in build_variants(sources).items():
+        data = text.encode("utf-8")
+        entries[key] = {"offset": offset, "length": len(data), "tokens": estimate_tokens(text),
+                        "sha256": hashlib.sha256(data).hexdigest()[:16]}
+        blobs.append(data)
+        offset += len(data)
+    index = {
+        "compiler_version": COMPILER_VERSION,
+        "version": digest[:12],
+        "source_hash": digest,
+        "compiled_at": time.time(),
+        "style_sections": style_sections(sources),
+        "word_limit_template": word_limit_template(sources),
+        "sections": section_report(sources),
+        "variants": entries,
+    }
+    header = json.dumps(index, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    out_dir = os.path.dirname(os.path.abspath(out_path))
+    os.makedirs(out_dir, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix=".prompts-", dir=out_dir)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(HEADER.pack(MAGIC, len(header)))
+            f.write(header)
+            for data in blobs:
+                f.write(data)
+        os.chmod(tmp_path, 0o644)         # mkstemp 默认只有属主可读，其他用户跑的 worker 也要能 mmap
+        os.replace(tmp_path, out_path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return index
+
+
+def read_index(path: str) -> Optional[dict]:
+    """只读产物的索引部分；文件不存在或格式不对返回 None。"""
+    try:
+        with open(path, "rb") as f:
+            magic, length = HEADER.unpack(f.read(HEADER.size))
+            if magic != MAGIC:
+                return None
+            return json.loads(f.read(length))
+    except (OSError, ValueError, struct.error):
+        return None
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="编译 EchoSoul 系统提示词")
+    parser.add_argument("--source", default=SOURCE_DIR, help="源文件目录")
+    parser.add_argument("--out", default=DEFAULT_ARTIFACT_PATH, help="产物路径")
+    args = parser.parse_args()
+
+    previous = read_index(args.out)
+    before = {row["section"]: row["tokens"] for row in (previous or {}).get("sections", ())}
+    index = compile_prompts(args.source, args.out)
+
+    print(f"{'段落':<24} {'字数':>6} {'tokens':>7} {'变化':>6}")
+    for row in index["sections"]:
+        delta = row["tokens"] - before.get(row["section"], 0)
+        print(f"{row['section']:<24} {row['chars']:>6} {row['tokens']:>7} {delta:>+6}")
+    for name in sorted(set(before) - {row["section"] for row in index["sections"]}):
+        print(f"{name:<24} {'（已删除）':>6} {0:>7} {-before[name]:>+6}")
+    tokens = [entry["tokens"] for entry in index["variants"].values()]
+    print(f"\n{len(tokens)} 个变体，{min(tokens)} ~ {max(tokens)} tokens，"
+          f"产物 {os.path.getsize(args.out) / 1024:.1f} KB -> {args.out}")
+    old_version = previous["version"] if previous else "（无）"
+    print(f"版本 {old_version} -> {index['version']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+# prompt_store.py
+# 运行时的系统提示词：mmap 加载 prompt_compiler 编译好的产物，同一台机器上的多个 worker 进程共享同一份页缓存；
+# 产物被重新编译（或源文件被改动）后自动热加载，不用重启应用
+
+import json
+import mmap
+import os
+import threading
+import time
+from typing import Optional
+
+from prompt_compiler import (COMPILER_VERSION, DEFAULT_ARTIFACT_PATH, HEADER, MAGIC, SOURCE_DIR,
+                             compile_prompts, source_paths, variant_key)
+
+RELOAD_CHECK_INTERVAL = 2.0       # 最多每隔多少秒检查一次产物 / 源文件有没有变化
+
+
+class CompiledPrompts:
+    """
+    一份已加载的产物（只读）
+
+    变体文本按需从 mmap 里解码，解码结果在本进程内缓存；
+    产物里没有的字数上限（比如导入的旧设置）按产物里记录的模板现拼。
+    """
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, length = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f"不是提示词产物：{path}")
+        self.index = json.loads(self._mm[HEADER.size:HEADER.size + length])
+        if self.index.get("compiler_version") != COMPILER_VERSION:
+            raise ValueError(f"提示词产物版本不匹配：{path}")
+        self.version = self.index["version"]
+        self._data_start = HEADER.size + length
+        self._styles = self.index["style_sections"]
+        self._texts = {}
+
+    def _variant(self, key: str) -> Optional[str]:
+        text = self._texts.get(key)
+        if text is None:
+            entry = self.index["variants"].get(key)
+            if entry is None:
+                return None
+            start = self._data_start + entry["offset"]
+            text = self._texts[key] = self._mm[start:start + entry["length"]].decode("utf-8")
+        return text
+
+    @property
+    def base(self) -> str:
+        """固定提示词（不含风格和字数上限段）。"""
+        return self._variant(variant_key("", 0))
+
+    def static_prompt(self, comfort_style: str, word_limit: int) -> str:
+        """固定提示词 + 风格段 + 字数上限段。"""
+        style = comfort_style if comfort_style in self._styles else ""
+        text = self._variant(variant_key(style, word_limit))
+        if text is None:
+            limit = self.index["word_limit_template"].format(word_limit=word_limit) if word_limit > 0 else ""
+            text = self._variant(variant_key(style, 0)) + limit
+        return text
+
+    def tokens(self, comfort_style: str, word_limit: int) -> Optional[int]:
+        """编译时记录的变体 token 数；产物里没有这个组合时返回 None。"""
+        style = comfort_style if comfort_style in self._styles else ""
+        entry = self.index["variants"].get(variant_key(style, word_limit))
+        return None if entry is None else entry["tokens"]
+
+
+class PromptStore:
+    """
+    带热加载的提示词产物
+
+    - 产物不存在，或源文件比产物新（有人改了 prompts/ 下的文件）时，就地重新编译
+    - 每隔 check_interval 秒 stat 一次，产物文件被替换后重新 mmap，之后的请求用新版本；
+      还在用旧版本的调用方拿着旧对象不受影响
+    """
+
+    def __init__(self, path: str = DEFAULT_ARTIFACT_PATH, source_dir: str = SOURCE_DIR,
+                 check_interval: float = RELOAD_CHECK_INTERVAL, auto_compile: bool = True):
+        self.path = path
+        self.source_dir = source_dir
+        self.check_interval = check_interval
+        self.auto_compile = auto_compile
+        self.reloads = 0
+        self._lock = threading.Lock()
+        self._checked_at = 0.0
+        self._signature = None
+        self._current = None
+        self.refresh(force=True)
+
+    def _sources_newer(self, artifact_mtime: float) -> bool:
+        try:
+            return any(os.stat(path).st_mtime > artifact_mtime for path in source_paths(self.source_dir))
+        except OSError:
+            return False              # 部署时可以只带产物、不带源文件
+
+    def refresh(self, force: bool = False) -> bool:
+        """检查是否需要重新编译 / 重新加载；返回这次是否换了新版本。"""
+        now = time.monotonic()
+        if not force and now - self._checked_at < self.check_interval:
+            return False
+        with self._lock:
+            self._checked_at = now
+            try:
+                stat = os.stat(self.path)
+            except OSError:
+                stat = None
+            if self.auto_compile and (stat is None or self._sources_newer(stat.st_mtime)):
+                compile_prompts(self.source_dir, self.path)
+                stat = os.stat(self.path)
+            if stat is None:
+                # 不自动编译且产物不见了（比如部署时正在替换）：沿用已经加载的版本
+                if self._current is None:
+                    raise FileNotFoundError(f"找不到提示词产物：{self.path}")
+                return False
+            signature = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+            if signature == self._signature:
+                return False
+            try:
+                prompts = CompiledPrompts(self.path)
+            except ValueError:
+                if not self.auto_compile:
+                    raise
+                # 旧格式的产物：按当前编译器重新编译
+                compile_prompts(self.source_dir, self.path)
+                stat = os.stat(self.path)
+                signature = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+                prompts = CompiledPrompts(self.path)
+            if self._current is not None:
+                self.reloads += 1
+            self._current = prompts
+            self._signature = signature
+            return True
+
+    @property
+    def current(self) -> CompiledPrompts:
+        """当前版本的产物（顺带做节流后的热加载检查）。"""
+        self.refresh()
+        return self._current
+
+
+_STORE = None
+_STORE_LOCK = threading.Lock()
+
+
+def get_prompt_store() -> PromptStore:
+    """进程内共享的提示词产物，第一次用到时加载。"""
+    global _STORE
+    if _STORE is None:
+        with _STORE_LOCK:
+            if _STORE is None:
+                _STORE = PromptStore()
+    return _STORE
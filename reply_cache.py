@@ -0,0 +1,183 @@
+# reply_cache.py
+# 开场白回复缓存：「我不开心」「好累」这类高度重复的第一句话，直接复用之前的回复
+# 只作用于对话的第一轮，且按风格设置分桶，默认关闭（secrets 里 REPLY_CACHE_ENABLED = true 开启）
+
+import random
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Optional
+
+import streamlit as st
+
+DEFAULT_TTL = 24 * 3600           # 缓存条目有效期（秒）
+DEFAULT_MAX_ENTRIES = 500         # 最多缓存多少个不同的开场白
+MIN_VARIANTS = 3                  # 攒够这么多条不同回复后才开始命中，避免回回一样
+MAX_VARIANTS = 8                  # 每个开场白最多保留的回复数
+SIMILARITY_THRESHOLD = 0.6        # 字符 bigram 的 Jaccard 相似度阈值
+MAX_OPENER_CHARS = 40             # 太长的开场白基本不会重复，不进缓存
+
+
+def normalize(text: str) -> str:
+    """归一化：全角转半角、转小写、去掉空白、标点和表情。"""
+    text = unicodedata.normalize("NFKC", text).lower()
+    return "".join(ch for ch in text if ch.isalnum())
+
+
+def _bigrams(text: str) -> frozenset:
+    if len(text) < 2:
+        return frozenset([text])
+    return frozenset(text[i:i + 2] for i in range(len(text) - 1))
+
+
+class _Entry:
+    __slots__ = ("bucket", "text", "grams", "replies", "created_at", "gen_seconds", "samples", "last_served")
+
+    def __init__(self, bucket: tuple, text: str):
+        self.bucket = bucket
+        self.text = text
+        self.grams = _bigrams(text)
+        self.replies = []
+        self.created_at = time.time()
+        self.gen_seconds = 0.0        # 真实生成耗时的平均值
+        self.samples = 0              # 参与平均的生成次数（重复的回复不进 replies，但同样算一次）
+        self.last_served = -1
+
+
+class ReplyCache:
+    """
+    开场白回复缓存
+
+    - 先按 (风格设置, 归一化后的第一句话) 精确匹配
+    - 再在同一风格桶里按字符 bigram 相似度模糊匹配（倒排索引，只比较有公共 bigram 的条目）
+    - TTL 过期 + LRU 淘汰；每个开场白保留多条回复随机挑选
+    """
+
+    def __init__(self, ttl: float = DEFAULT_TTL, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()     # (bucket, text) -> _Entry，按最近使用排序
+        self._index = {}                  # (bucket, bigram) -> set of keys
+        self._rng = random.Random()
+        # seconds_avoided：命中条目的平均真实生成耗时之和；serve_seconds：命中后展示缓存回复实际花的时间
+        self.stats = {"lookups": 0, "exact_hits": 0, "fuzzy_hits": 0, "misses": 0, "seconds_avoided": 0.0,
+                      "serve_seconds": 0.0}
+
+    @staticmethod
+    def bucket(comfort_style: str, word_limit: int, forbidden_phrases: str) -> tuple:
+        """风格分桶：只有风格设置完全一致的会话才共享缓存。"""
+        return (comfort_style, int(word_limit), forbidden_phrases or "")
+
+    def _drop(self, key: tuple) -> None:
+        entry = self._entries.pop(key)
+        for gram in entry.grams:
+            keys = self._index.get((entry.bucket, gram))
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._index[(entry.bucket, gram)]
+
+    def _expired(self, entry: _Entry) -> bool:
+        return time.time() - entry.created_at > self.ttl
+
+    def _find(self, bucket: tuple, text: str) -> tuple:
+        """返回 (条目, 是否精确命中)；找不到返回 (None, False)。"""
+        key = (bucket, text)
+        entry = self._entries.get(key)
+        if entry is not None:
+            if not self._expired(entry):
+                return entry, True
+            self._drop(key)
+
+        grams = _bigrams(text)
+        candidates = set()
+        for gram in grams:
+            candidates.update(self._index.get((bucket, gram), ()))
+        best, best_score = None, SIMILARITY_THRESHOLD
+        for candidate in candidates:
+            other = self._entries[candidate]
+            score = len(grams & other.grams) / len(grams | other.grams)
+            if score >= best_score:
+                best, best_score = other, score
+        if best is not None and self._expired(best):
+            self._drop((best.bucket, best.text))
+            best = None
+        return best, False
+
+    def lookup(self, bucket: tuple, first_message: str) -> Optional[str]:
+        """查找缓存回复；条目里的回复还不够 MIN_VARIANTS 条时视为未命中。"""
+        text = normalize(first_message)
+        with self._lock:
+            self.stats["lookups"] += 1
+            if not text or len(text) > MAX_OPENER_CHARS:
+                self.stats["misses"] += 1
+                return None
+            entry, exact = self._find(bucket, text)
+            if entry is None or len(entry.replies) < MIN_VARIANTS:
+                self.stats["misses"] += 1
+                return None
+            self._entries.move_to_end((entry.bucket, entry.text))
+            # 随机挑一条，避免连续两次给出同一句
+            choices = [i for i in range(len(entry.replies)) if i != entry.last_served]
+            entry.last_served = self._rng.choice(choices)
+            self.stats["exact_hits" if exact else "fuzzy_hits"] += 1
+            self.stats["seconds_avoided"] += entry.gen_seconds
+            return entry.replies[entry.last_served]
+
+    def store(self, bucket: tuple, first_message: str, reply: str, gen_seconds: float) -> None:
+        """记录一次真实生成的回复（以及生成耗时，用来估算命中时省下的时间）。"""
+        text = normalize(first_message)
+        if not text or len(text) > MAX_OPENER_CHARS or not reply:
+            return
+        key = (bucket, text)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or self._expired(entry):
+                if entry is not None:
+                    self._drop(key)
+                entry = self._entries[key] = _Entry(bucket, text)
+                for gram in entry.grams:
+                    self._index.setdefault((bucket, gram), set()).add(key)
+            self._entries.move_to_end(key)
+            if reply not in entry.replies:
+                entry.replies.append(reply)
+                dropped = len(entry.replies) - MAX_VARIANTS
+                if dropped > 0:
+                    del entry.replies[:dropped]
+                    # 下标跟着前移；上次给出的那条被挤掉了就不用再避开
+                    entry.last_served = max(entry.last_served - dropped, -1)
+            entry.samples += 1
+            entry.gen_seconds += (gen_seconds - entry.gen_seconds) / entry.samples
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+
+    def served(self, seconds: float) -> None:
+        """命中后从查找到回复展示完用的时间，从省下的时间里扣掉。"""
+        with self._lock:
+            self.stats["serve_seconds"] += seconds
+
+    def snapshot(self) -> dict:
+        """
+        命中统计
+
+        Returns:
+            dict: stats 各项 + entries（条目数）、hit_rate（命中率）、
+                seconds_saved（省下的时间 = 本该花的生成耗时 - 展示缓存回复的耗时）、
+                saved_per_hit（平均每次命中省下的秒数）
+        """
+        with self._lock:
+            data = dict(self.stats)
+            data["entries"] = len(self._entries)
+        hits = data["exact_hits"] + data["fuzzy_hits"]
+        data["hit_rate"] = hits / data["lookups"] if data["lookups"] else 0.0
+        data["seconds_saved"] = data["seconds_avoided"] - data["serve_seconds"]
+        data["saved_per_hit"] = data["seconds_saved"] / hits if hits else 0.0
+        return data
+
+
+@st.cache_resource(show_spinner=False)
+def get_reply_cache(ttl: float = DEFAULT_TTL, max_entries: int = DEFAULT_MAX_ENTRIES) -> ReplyCache:
+    """进程内共享的开场白缓存。"""
+    return ReplyCache(ttl=ttl, max_entries=max_entries)
@@ -0,0 +1,119 @@
+# router.py
+# 多服务商路由：按首 token 延迟（EWMA）和错误率挑最快的健康节点，超时没出首 token 就对冲到备用节点
+
+import threading
+import time
+from typing import Optional
+
+DEFAULT_HEDGE_AFTER = 3.0         # 多少秒还没收到首 token 就向下一个节点发对冲请求，0 表示不对冲
+EWMA_ALPHA = 0.2                  # EWMA 的平滑系数，越大越看重最近的样本
+MAX_ERROR_RATE = 0.5              # 错误率（EWMA）超过它视为不健康
+COOLDOWN = 30.0                   # 不健康的节点多少秒后重新放一个请求去探测
+
+
+class Provider:
+    """一个 OpenAI 兼容的节点：客户端 + 模型名 + 滚动统计。"""
+
+    def __init__(self, name: str, client, model: Optional[str] = None):
+        self.name = name
+        self.client = client
+        self.model = model            # None 表示沿用请求参数里的 model
+        self.ttft = None              # 首 token 延迟的 EWMA（秒），None 表示还没有样本
+        self.error_rate = 0.0
+        self.last_error_at = None
+        self.requests = 0
+        self.wins = 0
+        self.errors = 0
+
+    def params_for(self, params: dict) -> dict:
+        if self.model is None:
+            return params
+        return {**params, "model": self.model}
+
+
+class ProviderRouter:
+    """
+    节点路由器（线程安全）
+
+    - ranked()：健康节点按 首 token 延迟 / (1 - 错误率) 从小到大排，从没用过的节点排最前（先探测）；
+      不健康的节点排在最后，只在别的都失败时兜底，冷却期过后重新参与排序
+    - hedge_after：生成服务等首 token 超过这个时间就向排名下一位的节点再发一份请求，谁先出字用谁
+    """
+
+    def __init__(self, providers: list, hedge_after: float = DEFAULT_HEDGE_AFTER,
+                 alpha: float = EWMA_ALPHA, max_error_rate: float = MAX_ERROR_RATE,
+                 cooldown: float = COOLDOWN, clock=time.monotonic):
+        if not providers:
+            raise ValueError("至少需要一个服务商节点")
+        self.providers = list(providers)
+        self.hedge_after = hedge_after
+        self.alpha = alpha
+        self.max_error_rate = max_error_rate
+        self.cooldown = cooldown
+        self._clock = clock
+        self._lock = threading.Lock()
+
+    @classmethod
+    def single(cls, client, model: Optional[str] = None) -> "ProviderRouter":
+        """只有一个节点的路由器（不对冲）。"""
+        return cls([Provider("default", client, model)], hedge_after=0)
+
+    def healthy(self, provider: Provider) -> bool:
+        if provider.error_rate < self.max_error_rate:
+            return True
+        return self._clock() - provider.last_error_at >= self.cooldown
+
+    def ranked(self) -> list:
+        """按优先级排好的节点列表。"""
+        with self._lock:
+            def score(provider):
+                if provider.ttft is None:
+                    # 从没试过的节点先探测；试过但一次都没出字的排到有样本的节点后面
+                    return float("inf") if provider.requests else 0.0
+                return provider.ttft / max(1.0 - provider.error_rate, 0.05)
+
+            return sorted(self.providers, key=lambda p: (not self.healthy(p), score(p)))
+
+    def _update_ttft(self, provider: Provider, seconds: float) -> None:
+        if provider.ttft is None:
+            provider.ttft = seconds
+        else:
+            provider.ttft += self.alpha * (seconds - provider.ttft)
+
+    def record_success(self, provider: Provider, ttft: float) -> None:
+        """节点赢得了这一轮（先出首 token）。"""
+        with self._lock:
+            provider.requests += 1
+            provider.wins += 1
+            self._update_ttft(provider, ttft)
+            provider.error_rate *= 1 - self.alpha
+
+    def record_error(self, provider: Provider) -> None:
+        with self._lock:
+            provider.requests += 1
+            provider.errors += 1
+            provider.error_rate += self.alpha * (1.0 - provider.error_rate)
+            provider.last_error_at = self._clock()
+
+    def record_abandoned(self, provider: Provider, elapsed: float) -> None:
+        """
+        节点输给了对冲的另一方、请求被取消：只知道它的首 token 延迟至少是 elapsed，
+        比当前估计还慢时才拉高估计，避免刚发出的备用请求被算成「很快」
+        """
+        with self._lock:
+            provider.requests += 1
+            if provider.ttft is None or elapsed > provider.ttft:
+                self._update_ttft(provider, elapsed)
+
+    def snapshot(self) -> list:
+        with self._lock:
+            return [{
+                "name": p.name,
+                "model": p.model,
+                "ttft_ewma": p.ttft,
+                "error_rate": round(p.error_rate, 3),
+                "healthy": self.healthy(p),
+                "requests": p.requests,
+                "wins": p.wins,
+                "errors": p.errors,
+            } for p in self.providers]
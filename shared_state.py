@@ -0,0 +1,262 @@
+# shared_state.py
+# 跨进程共享状态：会话设置、限流计数等小块状态的可插拔存储
+# 单机多进程用 SQLite（和历史记录同一个数据库文件），多机部署用任意 Redis 协议兼容的服务
+
+import json
+import socket
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Optional
+from urllib.parse import urlsplit
+
+import streamlit as st
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS shared_state (
+    key         TEXT PRIMARY KEY,
+    value       TEXT NOT NULL,
+    expires_at  REAL
+);
+"""
+
+
+class StateBackend(ABC):
+    """
+    共享状态后端的公共接口
+
+    子类实现 get / set / delete / incr 四个原子操作，其余（JSON 读写、固定窗口限流计数）在此基础上组合。
+    所有值都是字符串；incr 作用于整数计数器，ttl 只在计数器新建时生效。
+    """
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[str]:
+        ...
+
+    @abstractmethod
+    def set(self, key: str, value: str, ttl: Optional[float] = None) -> None:
+        ...
+
+    @abstractmethod
+    def delete(self, key: str) -> None:
+        ...
+
+    @abstractmethod
+    def incr(self, key: str, amount: int, ttl: Optional[float] = None) -> int:
+        ...
+
+    def load_json(self, key: str):
+        value = self.get(key)
+        return None if value is None else json.loads(value)
+
+    def save_json(self, key: str, value, ttl: Optional[float] = None) -> None:
+        self.set(key, json.dumps(value, ensure_ascii=False, separators=(",", ":")), ttl)
+
+    def consume(self, name: str, amount: int, limit: float, window: float = 60.0) -> float:
+        """
+        固定窗口限流：在当前窗口的计数器上加 amount
+
+        Returns:
+            float: 0 表示放行；否则是到下一个窗口还要等的秒数（这次的计数已经退回）
+        """
+        amount = int(min(amount, limit))
+        now = time.time()
+        index = int(now // window)
+        key = f"limit:{name}:{index}"
+        if self.incr(key, amount, ttl=window * 2) <= limit:
+            return 0.0
+        self.incr(key, -amount)
+        return (index + 1) * window - now
+
+    def release(self, name: str, amount: int, window: float = 60.0) -> None:
+        """把当前窗口里多扣的额度退回（比如按 max_tokens 预扣、实际生成得更少）。"""
+        if amount > 0:
+            self.incr(f"limit:{name}:{int(time.time() // window)}", -int(amount))
+
+
+class SqliteStateBackend(StateBackend):
+    """单机后端：同一台机器上的多个 Streamlit 进程共用一个 SQLite 文件（WAL 模式）。"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._conn().executescript(_SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Optional[str]:
+        row = self._conn().execute(
+            "SELECT value FROM shared_state WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)",
+            (key, time.time()),
+        ).fetchone()
+        return None if row is None else row[0]
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None) -> None:
+        expires_at = None if ttl is None else time.time() + ttl
+        self._conn().execute(
+            "INSERT INTO shared_state (key, value, expires_at) VALUES (?, ?, ?) "
+            "ON CONFLICT (key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at",
+            (key, value, expires_at),
+        )
+
+    def delete(self, key: str) -> None:
+        self._conn().execute("DELETE FROM shared_state WHERE key = ?", (key,))
+
+    def incr(self, key: str, amount: int, ttl: Optional[float] = None) -> int:
+        conn = self._conn()
+        now = time.time()
+        # BEGIN IMMEDIATE 先拿写锁，读 - 改 - 写在多个进程之间也是原子的
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT value, expires_at FROM shared_state WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or (row[1] is not None and row[1] <= now):
+                value = amount
+                expires_at = None if ttl is None else now + ttl
+            else:
+                value = int(row[0]) + amount
+                expires_at = row[1]
+            conn.execute(
+                "INSERT OR REPLACE INTO shared_state (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, str(value), expires_at),
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        # 顺手清理过期的限流计数，表不会无限增长
+        if row is None:
+            conn.execute("DELETE FROM shared_state WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,))
+        return value
+
+
+class RedisError(Exception):
+    """Redis 返回的错误回复。"""
+
+
+class RedisClient:
+    """
+    最小的 RESP 协议客户端（不依赖 redis-py），每个线程一条连接
+
+    url 形如 redis://[:password@]host:port/db。
+    """
+
+    def __init__(self, url: str, timeout: float = 5.0):
+        parts = urlsplit(url)
+        self.host = parts.hostname or "127.0.0.1"
+        self.port = parts.port or 6379
+        self.password = parts.password
+        self.db = int(parts.path.lstrip("/") or 0)
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connect(self):
+        sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        conn = (sock, sock.makefile("rb"))
+        self._local.conn = conn
+        if self.password:
+            self.command("AUTH", self.password)
+        if self.db:
+            self.command("SELECT", self.db)
+        return conn
+
+    def _read(self, reader):
+        line = reader.readline()
+        if not line:
+            raise ConnectionError("Redis 连接已关闭")
+        kind, body = line[:1], line[1:-2]
+        if kind == b"+":
+            return body.decode("utf-8")
+        if kind == b"-":
+            raise RedisError(body.decode("utf-8"))
+        if kind == b":":
+            return int(body)
+        if kind == b"$":
+            length = int(body)
+            if length < 0:
+                return None
+            data = reader.read(length + 2)
+            return data[:-2].decode("utf-8")
+        if kind == b"*":
+            length = int(body)
+            if length < 0:
+                return None
+            return [self._read(reader) for _ in range(length)]
+        raise RedisError(f"无法解析的回复：{line!r}")
+
+    def command(self, *args):
+        """发送一条命令并返回解析后的回复；连接断开时重连重试一次。"""
+        payload = [f"*{len(args)}\r\n".encode()]
+        for arg in args:
+            data = arg if isinstance(arg, bytes) else str(arg).encode("utf-8")
+            payload.append(b"$%d\r\n%s\r\n" % (len(data), data))
+        payload = b"".join(payload)
+        for attempt in range(2):
+            conn = getattr(self._local, "conn", None) or self._connect()
+            try:
+                conn[0].sendall(payload)
+                return self._read(conn[1])
+            except (ConnectionError, OSError):
+                self._local.conn = None
+                conn[0].close()
+                if attempt:
+                    raise
+
+
+class RedisStateBackend(StateBackend):
+    """多机后端：任何 Redis 协议兼容的服务（Redis / Valkey / KeyDB，或本地假服务器）。"""
+
+    def __init__(self, url: str, prefix: str = "echosoul:"):
+        self.client = RedisClient(url)
+        self.prefix = prefix
+
+    def get(self, key: str) -> Optional[str]:
+        return self.client.command("GET", self.prefix + key)
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None) -> None:
+        if ttl is None:
+            self.client.command("SET", self.prefix + key, value)
+        else:
+            self.client.command("SET", self.prefix + key, value, "PX", int(ttl * 1000))
+
+    def delete(self, key: str) -> None:
+        self.client.command("DEL", self.prefix + key)
+
+    def incr(self, key: str, amount: int, ttl: Optional[float] = None) -> int:
+        value = self.client.command("INCRBY", self.prefix + key, amount)
+        if ttl is not None and value == amount:
+            # 计数器刚被创建（INCRBY 的结果等于增量）时设置过期时间
+            self.client.command("PEXPIRE", self.prefix + key, int(ttl * 1000))
+        return value
+
+
+def open_backend(url: str, sqlite_path: str) -> StateBackend:
+    """redis:// 开头用 Redis 协议后端，否则用本机 SQLite 文件。"""
+    if url.startswith("redis://"):
+        return RedisStateBackend(url)
+    return SqliteStateBackend(sqlite_path)
+
+
+@st.cache_resource(show_spinner=False)
+def get_state_backend(url: str, sqlite_path: str) -> StateBackend:
+    """进程内共享的状态后端。"""
+    return open_backend(url, sqlite_path)
+
+
+def load_settings(backend: StateBackend, session_id: str) -> Optional[dict]:
+    """读取会话设置（别的进程保存的也能读到）；没有保存过返回 None。"""
+    return backend.load_json(f"settings:{session_id}")
+
+
+def save_settings(backend: StateBackend, session_id: str, settings: dict) -> None:
+    backend.save_json(f"settings:{session_id}", settings)
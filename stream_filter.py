@@ -0,0 +1,139 @@
+# stream_filter.py
+# 流式输出过滤：跨 chunk 匹配禁止短语（Aho–Corasick 自动机），并按中文字数实时截断
+
+from functools import lru_cache
+
+DEFAULT_MAX_TOKENS = 2048         # 不限字数时的 max_tokens
+TOKENS_PER_CHAR = 1.5             # 由字数上限推算 max_tokens 时每个字预留的 token（含标点 / 格式）
+MAX_TOKENS_MARGIN = 64
+LIMIT_SLACK = 0.1                 # 允许超出字数上限的比例，避免刚好卡在半句话上
+
+
+def is_cjk(ch: str) -> bool:
+    return "一" <= ch <= "鿿" or "㐀" <= ch <= "䶿"
+
+
+def parse_phrases(forbidden_phrases: str) -> tuple:
+    """和 generate_system_prompt 一样按逗号拆分禁止短语。"""
+    if not forbidden_phrases:
+        return ()
+    return tuple(sorted({p.strip() for p in forbidden_phrases.split(",") if p.strip()}))
+
+
+def max_tokens_for_limit(word_limit: int) -> int:
+    """按字数上限推算 max_tokens：有上限时不再固定请求 2048 个 token。"""
+    if word_limit <= 0:
+        return DEFAULT_MAX_TOKENS
+    return min(DEFAULT_MAX_TOKENS, int(word_limit * (1 + LIMIT_SLACK) * TOKENS_PER_CHAR) + MAX_TOKENS_MARGIN)
+
+
+class AhoCorasick:
+    """多模式匹配自动机；每个状态记录以它结尾的最长模式长度。"""
+
+    def __init__(self, patterns: tuple):
+        self.goto = [{}]
+        self.fail = [0]
+        self.match_len = [0]
+        for pattern in patterns:
+            state = 0
+            for ch in pattern:
+                nxt = self.goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(self.goto)
+                    self.goto[state][ch] = nxt
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.match_len.append(0)
+                state = nxt
+            self.match_len[state] = max(self.match_len[state], len(pattern))
+        self.max_len = max((len(p) for p in patterns), default=0)
+
+        # BFS 建立失配指针
+        queue = list(self.goto[0].values())
+        for state in queue:
+            for ch, nxt in self.goto[state].items():
+                queue.append(nxt)
+                f = self.fail[state]
+                while f and ch not in self.goto[f]:
+                    f = self.fail[f]
+                self.fail[nxt] = self.goto[f].get(ch, 0)
+                self.match_len[nxt] = max(self.match_len[nxt], self.match_len[self.fail[nxt]])
+
+    def step(self, state: int, ch: str) -> int:
+        while state and ch not in self.goto[state]:
+            state = self.fail[state]
+        return self.goto[state].get(ch, 0)
+
+
+@lru_cache(maxsize=32)
+def build_automaton(phrases: tuple) -> AhoCorasick:
+    """自动机只在禁止短语变化时重建。"""
+    return AhoCorasick(phrases)
+
+
+class StreamFilter:
+    """
+    流式过滤器
+
+    用法：
+        stream_filter = StreamFilter(forbidden_phrases, word_limit)
+        for text in handle:
+            renderer.write(stream_filter.feed(text))
+            if stream_filter.stopped:
+                break
+        renderer.write(stream_filter.flush())
+
+    - 末尾始终扣留 (最长短语长度 - 1) 个字符，跨 chunk 的短语也能在显示前被删掉
+    - 中文字数超过 word_limit × (1 + LIMIT_SLACK) 后 stopped 置为 True，调用方据此关闭流
+    """
+
+    def __init__(self, forbidden_phrases: str = "", word_limit: int = 0):
+        self.automaton = build_automaton(parse_phrases(forbidden_phrases))
+        self.hold = max(self.automaton.max_len - 1, 0)
+        self.char_cap = int(word_limit * (1 + LIMIT_SLACK)) if word_limit > 0 else 0
+        self.stopped = False
+        self.cjk_chars = 0
+        self.removed = 0
+        self._state = 0
+        self._pending = []
+
+    def _emit(self, upto: int) -> str:
+        """放出 pending 的前 upto 个字符，同时累计中文字数，超出上限就截断。"""
+        out = self._pending[:upto]
+        del self._pending[:upto]
+        if self.char_cap:
+            for i, ch in enumerate(out):
+                if is_cjk(ch):
+                    self.cjk_chars += 1
+                    if self.cjk_chars >= self.char_cap:
+                        self.stopped = True
+                        self._pending.clear()
+                        return "".join(out[:i + 1])
+        return "".join(out)
+
+    def feed(self, text: str) -> str:
+        """输入一个 chunk，返回可以安全显示的文本。"""
+        if self.stopped or not text:
+            return ""
+        automaton = self.automaton
+        if not automaton.max_len:
+            self._pending.extend(text)
+            return self._emit(len(self._pending))
+        state = self._state
+        pending = self._pending
+        for ch in text:
+            pending.append(ch)
+            state = automaton.step(state, ch)
+            length = automaton.match_len[state]
+            if length:
+                del pending[-length:]
+                self.removed += 1
+                state = 0
+        self._state = state
+        return self._emit(max(len(pending) - self.hold, 0))
+
+    def flush(self) -> str:
+        """流结束时放出扣留的尾巴。"""
+        if self.stopped:
+            return ""
+        return self._emit(len(self._pending))
@@ -0,0 +1,71 @@
+# stream_render.py
+# 流式回复的节流渲染：先攒 token，按时间间隔或字数阈值批量刷新到页面
+
+import time
+from typing import Callable
+
+DEFAULT_FLUSH_INTERVAL = 0.05     # 两次刷新的最小间隔（秒）
+DEFAULT_FLUSH_CHARS = 200         # 攒够这么多字也立即刷新
+CURSOR = "▌"
+
+
+class StreamRenderer:
+    """
+    把流式 chunk 批量渲染到 st.empty() 占位符
+
+    用法：
+        renderer = StreamRenderer(message_placeholder)
+        for text in chunks:
+            renderer.write(text)
+        full_response = renderer.close()
+    """
+
+    def __init__(self, placeholder, interval: float = DEFAULT_FLUSH_INTERVAL,
+                 max_chars: int = DEFAULT_FLUSH_CHARS, cursor: str = CURSOR,
+                 clock: Callable[[], float] = time.perf_counter):
+        self.placeholder = placeholder
+        self.interval = interval
+        self.max_chars = max_chars
+        self.cursor = cursor
+        self._clock = clock
+        self._parts = []
+        self._pending = 0
+        self._last_flush = clock()
+        # 统计信息
+        self.chunks = 0
+        self.render_calls = 0
+        self.bytes_sent = 0
+
+    @property
+    def text(self) -> str:
+        """目前收到的完整文本。"""
+        if len(self._parts) > 1:
+            self._parts = ["".join(self._parts)]
+        return self._parts[0] if self._parts else ""
+
+    def write(self, text: str) -> None:
+        """追加一个 chunk；到了刷新间隔或攒够字数才真正渲染。"""
+        if not text:
+            return
+        self._parts.append(text)
+        self._pending += len(text)
+        self.chunks += 1
+        if self._pending >= self.max_chars or self._clock() - self._last_flush >= self.interval:
+            self.flush()
+
+    def flush(self, final: bool = False) -> None:
+        """立即把当前文本渲染出来；final=True 时去掉光标。"""
+        body = self.text if final else self.text + self.cursor
+        self.placeholder.markdown(body)
+        self.render_calls += 1
+        self.bytes_sent += len(body.encode("utf-8"))
+        self._pending = 0
+        self._last_flush = self._clock()
+
+    def close(self) -> str:
+        """渲染最终结果（不带光标）并返回完整文本。"""
+        self.flush(final=True)
+        return self.text
+
+    def stats(self) -> dict:
+        return {"chunks": self.chunks, "render_calls": self.render_calls, "bytes_sent": self.bytes_sent}
@@ -0,0 +1,10 @@
+# conftest.py
+# 测试直接 import 仓库根目录下的模块，以及 benchmarks/ 里的本地假服务器
+
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in (ROOT, os.path.join(ROOT, "benchmarks")):
+    if path not in sys.path:
+        sys.path.insert(0, path)
@@ -0,0 +1,88 @@
+# test_shared_state.py
+# 两个独立进程（spawn，不共享内存）经由共享状态后端交接会话、争抢同一个限流窗口；
+# SQLite 文件后端和 Redis 协议后端（本地假服务器）各跑一遍
+# 用法：python -m pytest -q tests
+
+import multiprocessing
+import os
+import time
+import uuid
+
+import pytest
+
+from fake_redis import start_fake_redis
+from history_store import HistoryStore, RedisHistoryStore
+from messages import Message
+from shared_state import StateBackend, load_settings, open_backend, save_settings
+
+LIMIT = 50
+ATTEMPTS = 80                     # 每个进程尝试的次数，两个进程合计超过上限
+
+
+def _open(url: str, db_path: str) -> tuple:
+    # 不走 st.cache_resource 的缓存，每个进程各开各的连接
+    store = RedisHistoryStore(url) if url.startswith("redis://") else HistoryStore(db_path)
+    return open_backend(url, db_path), store
+
+
+def worker_turn(url: str, db_path: str, session_id: str, turn: int, settings: dict) -> dict:
+    """一个全新的进程接手会话：读出之前的设置和消息，再追加一轮并更新设置。"""
+    backend, store = _open(url, db_path)
+    seen_settings = load_settings(backend, session_id)
+    seen = [message.content for message in store.load_recent(session_id, limit=100)]
+    store.append(session_id, Message("user", f"第 {turn} 轮（pid {os.getpid()}）"))
+    save_settings(backend, session_id, {**(seen_settings or {}), **settings})
+    return {"pid": os.getpid(), "settings": seen_settings, "messages": seen}
+
+
+def worker_limit(url: str, db_path: str, name: str, start_at: float) -> int:
+    backend, _ = _open(url, db_path)
+    # 两个进程约好同一时刻开抢，保证请求真正交错
+    time.sleep(max(start_at - time.time(), 0))
+    return sum(backend.consume(name, 1, LIMIT, window=3600) == 0 for _ in range(ATTEMPTS))
+
+
+@pytest.fixture(scope="module")
+def pool():
+    # 每个任务换一个新进程：进程之间只能经由后端交换状态
+    with multiprocessing.get_context("spawn").Pool(2, maxtasksperchild=1) as pool:
+        yield pool
+
+
+@pytest.fixture(params=["sqlite", "redis"])
+def backend_args(request, tmp_path):
+    db_path = str(tmp_path / "shared.db")
+    if request.param == "sqlite":
+        yield "", db_path
+        return
+    server = start_fake_redis()
+    yield server.url, db_path
+    server.shutdown()
+
+
+def test_session_handoff_between_processes(pool, backend_args):
+    url, db_path = backend_args
+    session_id = uuid.uuid4().hex
+    first = pool.apply(worker_turn, (url, db_path, session_id, 1, {"comfort_style": "温和鼓励"}))
+    second = pool.apply(worker_turn, (url, db_path, session_id, 2, {"word_limit": 200}))
+    third = pool.apply(worker_turn, (url, db_path, session_id, 3, {}))
+
+    assert len({first["pid"], second["pid"], third["pid"]}) == 3
+    assert second["settings"] == {"comfort_style": "温和鼓励"}
+    assert second["messages"] == [f"第 1 轮（pid {first['pid']}）"]
+    assert third["settings"] == {"comfort_style": "温和鼓励", "word_limit": 200}
+    assert third["messages"] == [f"第 1 轮（pid {first['pid']}）", f"第 2 轮（pid {second['pid']}）"]
+
+
+def test_rate_limit_window_shared_between_processes(pool, backend_args):
+    url, db_path = backend_args
+    name = f"test:{uuid.uuid4().hex}"
+    start_at = time.time() + 2.0        # 留出子进程启动、import 的时间
+    admitted = pool.starmap(worker_limit, [(url, db_path, name, start_at)] * 2, chunksize=1)
+
+    assert sum(admitted) == LIMIT, admitted
+
+
+def test_backend_interface_is_abstract():
+    with pytest.raises(TypeError):
+        StateBackend()
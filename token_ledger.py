@@ -0,0 +1,200 @@
+# token_ledger.py
+# token 记账：每轮生成的 prompt / 命中缓存的 prompt / completion token 只追加写入账本，
+# 同一事务里顺手累加按会话、按小时、按模型的汇总，查询汇总只需一次主键查找
+
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+import streamlit as st
+
+from history_store import DEFAULT_DB_PATH
+
+DIMENSIONS = ("session", "hour", "model")
+DEFAULT_SESSION_BUDGET = 0        # 单个会话累计 token 上限，0 表示不限
+SOFT_LIMIT = 0.8                  # 用到预算的这个比例开始降级
+MIN_CONTEXT_BUDGET = 1000         # 降级后历史上下文的 token 下限
+MIN_MAX_TOKENS = 200              # 降级后单次回复的 max_tokens 下限
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS token_ledger (
+    id                 INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id         TEXT    NOT NULL,
+    model              TEXT    NOT NULL,
+    provider           TEXT    NOT NULL,
+    created_at         REAL    NOT NULL,
+    prompt_tokens      INTEGER NOT NULL,
+    cached_tokens      INTEGER NOT NULL,
+    completion_tokens  INTEGER NOT NULL,
+    estimated          INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS token_rollups (
+    dimension          TEXT    NOT NULL,
+    key                TEXT    NOT NULL,
+    turns              INTEGER NOT NULL,
+    prompt_tokens      INTEGER NOT NULL,
+    cached_tokens      INTEGER NOT NULL,
+    completion_tokens  INTEGER NOT NULL,
+    PRIMARY KEY (dimension, key)
+);
+"""
+
+_EMPTY = {"turns": 0, "prompt_tokens": 0, "cached_tokens": 0, "completion_tokens": 0}
+
+
+def usage_from_chunk(usage) -> dict:
+    """
+    从流式响应最后一个 chunk 的 usage 里取出 token 数
+
+    命中缓存的 prompt token：DeepSeek 放在 prompt_cache_hit_tokens，
+    OpenAI 放在 prompt_tokens_details.cached_tokens，两种都认。
+    """
+    cached = getattr(usage, "prompt_cache_hit_tokens", None)
+    if cached is None:
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached = getattr(details, "cached_tokens", None) if details is not None else None
+    return {
+        "prompt_tokens": int(getattr(usage, "prompt_tokens", 0) or 0),
+        "cached_tokens": int(cached or 0),
+        "completion_tokens": int(getattr(usage, "completion_tokens", 0) or 0),
+        "estimated": False,
+    }
+
+
+def hour_key(timestamp: float) -> str:
+    return time.strftime("%Y-%m-%dT%H", time.localtime(timestamp))
+
+
+class TokenLedger:
+    """
+    只追加的 token 账本（SQLite，和对话历史同一个数据库文件）
+
+    - record：一个事务里插入一条明细，并累加 session / hour / model 三个维度的汇总行
+    - rollup：按主键读一个汇总，开销和账本长度无关
+    """
+
+    def __init__(self, path: str = DEFAULT_DB_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._conn().executescript(_SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def record(self, session_id: str, usage: dict, created_at: Optional[float] = None) -> None:
+        """
+        记一轮生成的用量
+
+        Args:
+            session_id: 会话 id
+            usage: {"model", "provider", "prompt_tokens", "cached_tokens", "completion_tokens", "estimated"}
+            created_at: 时间戳，默认当前时间
+        """
+        created_at = time.time() if created_at is None else created_at
+        tokens = (usage["prompt_tokens"], usage["cached_tokens"], usage["completion_tokens"])
+        conn = self._conn()
+        conn.execute("BEGIN")
+        try:
+            conn.execute(
+                "INSERT INTO token_ledger (session_id, model, provider, created_at, prompt_tokens, "
+                "cached_tokens, completion_tokens, estimated) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (session_id, usage["model"], usage["provider"], created_at, *tokens, int(usage["estimated"])),
+            )
+            conn.executemany(
+                "INSERT INTO token_rollups VALUES (?, ?, 1, ?, ?, ?) ON CONFLICT (dimension, key) DO UPDATE SET "
+                "turns = turns + 1, prompt_tokens = prompt_tokens + excluded.prompt_tokens, "
+                "cached_tokens = cached_tokens + excluded.cached_tokens, "
+                "completion_tokens = completion_tokens + excluded.completion_tokens",
+                [("session", session_id, *tokens), ("hour", hour_key(created_at), *tokens),
+                 ("model", usage["model"], *tokens)],
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def rollup(self, dimension: str, key: str) -> dict:
+        """一个维度下某个键的汇总（turns / prompt / cached / completion），没有记录时全为 0。"""
+        row = self._conn().execute(
+            "SELECT turns, prompt_tokens, cached_tokens, completion_tokens FROM token_rollups "
+            "WHERE dimension = ? AND key = ?", (dimension, key),
+        ).fetchone()
+        return dict(zip(_EMPTY, row)) if row else dict(_EMPTY)
+
+    def rollups(self, dimension: str, limit: int = 24) -> list:
+        """一个维度下键最大的 limit 个汇总（hour 维度即最近 limit 个小时）。"""
+        rows = self._conn().execute(
+            "SELECT key, turns, prompt_tokens, cached_tokens, completion_tokens FROM token_rollups "
+            "WHERE dimension = ? ORDER BY key DESC LIMIT ?", (dimension, limit),
+        ).fetchall()
+        return [{"key": row[0], **dict(zip(_EMPTY, row[1:]))} for row in rows]
+
+    def entries(self, session_id: str, limit: int = 50) -> list:
+        """某个会话最近 limit 条明细（按时间倒序）。"""
+        rows = self._conn().execute(
+            "SELECT created_at, model, provider, prompt_tokens, cached_tokens, completion_tokens, estimated "
+            "FROM token_ledger WHERE session_id = ? ORDER BY id DESC LIMIT ?", (session_id, limit),
+        ).fetchall()
+        keys = ("created_at", "model", "provider", "prompt_tokens", "cached_tokens", "completion_tokens",
+                "estimated")
+        return [dict(zip(keys, row)) for row in rows]
+
+    def session_tokens(self, session_id: str) -> int:
+        """会话累计用掉的 token（prompt + completion）。"""
+        data = self.rollup("session", session_id)
+        return data["prompt_tokens"] + data["completion_tokens"]
+
+
+def apply_budget(used: int, budget: int, context_budget: int, max_tokens: int) -> tuple:
+    """
+    会话超出配额时的平滑降级：不拒绝回复，只让这一轮更省
+
+    - 用量低于预算的 SOFT_LIMIT：原样返回
+    - 介于 SOFT_LIMIT 和预算之间：历史上下文和 max_tokens 按剩余比例线性收缩
+    - 超出预算：收缩到下限（MIN_CONTEXT_BUDGET / MIN_MAX_TOKENS）
+
+    Args:
+        used: 会话已用 token
+        budget: 会话 token 上限，0 表示不限
+        context_budget: 原本的历史上下文 token 预算
+        max_tokens: 原本的 max_tokens
+
+    Returns:
+        tuple: (context_budget, max_tokens, 降级程度 0~1，0 表示没有降级)
+    """
+    if budget <= 0 or used < budget * SOFT_LIMIT:
+        return context_budget, max_tokens, 0.0
+    level = min((used - budget * SOFT_LIMIT) / (budget * (1 - SOFT_LIMIT)), 1.0)
+    floor_context = min(context_budget, MIN_CONTEXT_BUDGET)
+    floor_tokens = min(max_tokens, MIN_MAX_TOKENS)
+    return (round(context_budget - (context_budget - floor_context) * level),
+            round(max_tokens - (max_tokens - floor_tokens) * level), level)
+
+
+def usage_cost(data: dict, prices: dict) -> Optional[float]:
+    """
+    按单价估算费用
+
+    Args:
+        data: rollup / entries 返回的一行
+        prices: {"cache_hit", "cache_miss", "output"}，每百万 token 的价格；缺项时返回 None
+    """
+    try:
+        hit = data["cached_tokens"]
+        return (hit * prices["cache_hit"] + (data["prompt_tokens"] - hit) * prices["cache_miss"]
+                + data["completion_tokens"] * prices["output"]) / 1e6
+    except (KeyError, TypeError):
+        return None
+
+
+@st.cache_resource(show_spinner=False)
+def get_token_ledger(path: str = DEFAULT_DB_PATH) -> TokenLedger:
+    """进程内共享的 token 账本。"""
+    return TokenLedger(path)
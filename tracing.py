@@ -0,0 +1,195 @@
+# tracing.py
+# 每轮对话的耗时埋点：span 计时 + 进程内直方图 + 计数器，
+# 可导出为 Prometheus 文本格式或写入 JSONL 文件
+
+import bisect
+import functools
+import json
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+import streamlit as st
+
+# 对数刻度的桶：0.5ms 起每档 ×1.25，64 档覆盖到约 10 分钟
+_BOUNDS = tuple(0.0005 * 1.25 ** i for i in range(64))
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class Histogram:
+    """固定桶的低开销直方图：observe 只做一次二分查找和一次加一。"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = [0] * (len(_BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        index = bisect.bisect_left(_BOUNDS, value)
+        with self._lock:
+            self._counts[index] += 1
+            self.count += 1
+            self.total += value
+            if value > self.max:
+                self.max = value
+
+    def quantile(self, q: float) -> float:
+        """估算分位数（在所在桶内线性插值，落在最后一档时返回最大值）。"""
+        with self._lock:
+            if not self.count:
+                return 0.0
+            rank = q * self.count
+            seen = 0
+            for index, n in enumerate(self._counts):
+                if n and seen + n >= rank:
+                    if index >= len(_BOUNDS):
+                        return self.max
+                    lower = _BOUNDS[index - 1] if index else 0.0
+                    upper = min(_BOUNDS[index], self.max)
+                    return lower + (upper - lower) * (rank - seen) / n
+                seen += n
+            return self.max
+
+
+class Registry:
+    """span 直方图 + 全局计数器的集合。"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.histograms = {}
+        self.counters = {}
+        self.sink = None
+
+    def histogram(self, name: str) -> Histogram:
+        hist = self.histograms.get(name)
+        if hist is None:
+            with self._lock:
+                hist = self.histograms.setdefault(name, Histogram())
+        return hist
+
+    def observe(self, name: str, seconds: float, session_id: Optional[str] = None) -> None:
+        self.histogram(name).observe(seconds)
+        if self.sink is not None:
+            self.sink.write({"type": "span", "name": name, "seconds": seconds,
+                             "session": session_id, "ts": time.time()})
+
+    def incr(self, name: str, n: int = 1) -> None:
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def summary(self) -> dict:
+        """{span: {count, mean, p50, p95, p99}}，给管理面板用。"""
+        data = {}
+        for name, hist in sorted(self.histograms.items()):
+            data[name] = {
+                "count": hist.count,
+                "mean": hist.total / hist.count if hist.count else 0.0,
+                **{f"p{int(q * 100)}": hist.quantile(q) for q in QUANTILES},
+            }
+        return data
+
+    def prometheus_text(self) -> str:
+        """导出为 Prometheus 文本格式（span 用 summary，计数器用 counter）。"""
+        lines = ["# TYPE echosoul_span_seconds summary"]
+        for name, hist in sorted(self.histograms.items()):
+            for q in QUANTILES:
+                lines.append(f'echosoul_span_seconds{{span="{name}",quantile="{q}"}} {hist.quantile(q):.6f}')
+            lines.append(f'echosoul_span_seconds_sum{{span="{name}"}} {hist.total:.6f}')
+            lines.append(f'echosoul_span_seconds_count{{span="{name}"}} {hist.count}')
+        with self._lock:
+            counters = sorted(self.counters.items())
+        for name, value in counters:
+            lines.append(f"# TYPE echosoul_{name}_total counter")
+            lines.append(f"echosoul_{name}_total {value}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+class JsonlSink:
+    """把 span 事件逐行追加写入 JSONL 文件。"""
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._file = open(path, "a", encoding="utf-8")
+
+    def write(self, event: dict) -> None:
+        line = json.dumps(event, ensure_ascii=False)
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+
+
+@contextmanager
+def span(name: str, session_id: Optional[str] = None):
+    """
+    计时一个阶段
+
+    用法：
+        with span("prompt"):
+            system_messages = generate_system_prompt(...)
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        REGISTRY.observe(name, time.perf_counter() - start, session_id)
+
+
+def traced(name: str):
+    """装饰器版的 span。"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def observe(name: str, seconds: float, session_id: Optional[str] = None) -> None:
+    """直接记录一个耗时（用于不方便包成 with 块的阶段，比如首 token 延迟）。"""
+    REGISTRY.observe(name, seconds, session_id)
+
+
+def count(counters: dict, name: str, n: int = 1) -> None:
+    """同时累加会话级计数器（存在 session_state 里的 dict）和全局计数器。"""
+    counters[name] = counters.get(name, 0) + n
+    REGISTRY.incr(name, n)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.rstrip("/") != "/metrics":
+            self.send_error(404)
+            return
+        body = REGISTRY.prometheus_text().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """在后台线程启动 /metrics 端点，供 Prometheus 抓取。"""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="echosoul-metrics", daemon=True).start()
+    return server
+
+
+@st.cache_resource(show_spinner=False)
+def setup_exporters(jsonl_path: Optional[str] = None, metrics_port: Optional[int] = None) -> None:
+    """按配置打开 JSONL 输出和 /metrics 端点（每个进程只执行一次）。"""
+    if jsonl_path:
+        REGISTRY.sink = JsonlSink(jsonl_path)
+    if metrics_port:
+        start_metrics_server(int(metrics_port))
@@ -3,8 +3,19 @@
 
 import streamlit as st
 import base64
+import hashlib
+import io
 import os
-from typing import Optional
+from functools import lru_cache
+from typing import Optional, Tuple
+
+# 背景图预处理：启动时缩到这个宽度并转成 JPEG，体积比原始 PNG 小一个数量级
+BG_MAX_WIDTH = 1600
+BG_JPEG_QUALITY = 80
+
+# Streamlit 静态文件目录（需在 .streamlit/config.toml 中开启 enableStaticServing）
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+STATIC_URL_PREFIX = "app/static"
 
 
 def _img_to_b64(path: str) -> Optional[str]:
@@ -18,6 +29,72 @@ def _img_to_b64(path: str) -> Optional[str]:
         return None
 
 
+def _encode_background(path: str) -> Optional[Tuple[bytes, str]]:
+    """
+    读取并压缩背景图：装了 Pillow 就缩放 + 转 JPEG，否则原样返回。
+
+    Returns:
+        (图片字节, MIME 类型)；读不到就返回 None
+    """
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        with open(path, "rb") as f:
+            raw = f.read()
+    except Exception:
+        return None
+
+    try:
+        from PIL import Image
+    except ImportError:
+        mime = "image/png" if path.lower().endswith(".png") else "image/jpeg"
+        return raw, mime
+
+    try:
+        with Image.open(io.BytesIO(raw)) as img:
+            img = img.convert("RGB")
+            if img.width > BG_MAX_WIDTH:
+                img = img.resize((BG_MAX_WIDTH, round(img.height * BG_MAX_WIDTH / img.width)))
+            out = io.BytesIO()
+            img.save(out, format="JPEG", quality=BG_JPEG_QUALITY, optimize=True, progressive=True)
+    except Exception:
+        return raw, "image/png"
+    return out.getvalue(), "image/jpeg"
+
+
+def _publish_static(data: bytes, mime: str) -> str:
+    """按内容哈希写入 static 目录，返回浏览器可长期缓存的 URL。"""
+    ext = "jpg" if mime == "image/jpeg" else "png"
+    name = f"bg-{hashlib.sha256(data).hexdigest()[:12]}.{ext}"
+    target = os.path.join(STATIC_DIR, name)
+    if not os.path.exists(target):
+        os.makedirs(STATIC_DIR, exist_ok=True)
+        tmp = target + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, target)
+    return f"{STATIC_URL_PREFIX}/{name}"
+
+
+@st.cache_resource(show_spinner=False)
+def _background_url(path: str) -> Optional[str]:
+    """
+    背景图 URL（每个进程只处理一次）：
+    - 开启了静态文件服务：返回带内容哈希的静态地址，浏览器只下载一次
+    - 否则：退回压缩后的 data URI
+    """
+    encoded = _encode_background(path)
+    if encoded is None:
+        return None
+    data, mime = encoded
+    if st.get_option("server.enableStaticServing"):
+        try:
+            return _publish_static(data, mime)
+        except OSError:
+            pass
+    return f"data:{mime};base64,{base64.b64encode(data).decode('utf-8')}"
+
+
 def apply_theme(bg_image: Optional[str] = None) -> None:
     """
     应用 EchoSoul 的整体 UI 主题：
@@ -26,13 +103,22 @@ def apply_theme(bg_image: Optional[str] = None) -> None:
     - 左侧侧边栏：深色背景 + 白字 + 白底黑字输入框
     - 底部聊天输入框：白底黑字
     - 按钮 / 滚动条 / 菜单隐藏 等
+
+    CSS 按背景 URL 缓存，每次 rerun 只是把同一段字符串再发一次；
+    背景图走 URL 而不是内联 base64，每次 rerun 的 websocket 负载只有几 KB。
     """
-    b64 = _img_to_b64(bg_image) if bg_image else None
+    bg_url = _background_url(bg_image) if bg_image else None
+    css = build_css(bg_url)
+    st.markdown(css, unsafe_allow_html=True)
+
 
-    if b64:
+@lru_cache(maxsize=4)
+def build_css(bg_url: Optional[str] = None) -> str:
+    """生成主题 CSS；bg_url 为空时使用渐变背景。"""
+    if bg_url:
         bg_css = f"""
         .stApp {{
-            background: url("data:image/png;base64,{b64}") center/cover fixed no-repeat !important;
+            background: url("{bg_url}") center/cover fixed no-repeat !important;
         }}
         """
     else:
@@ -157,5 +243,4 @@ def apply_theme(bg_image: Optional[str] = None) -> None:
     ::-webkit-scrollbar-thumb {{ background: rgba(139, 125, 212, 0.3); border-radius: 10px; }}
     </style>
     """
-
-    st.markdown(css, unsafe_allow_html=True)
\ No newline at end of file
+    return css